@@ -1,3 +1,3 @@
-from .app import app, create_app
+from .app import create_app
 from .models import db
 from .routes import api
\ No newline at end of file
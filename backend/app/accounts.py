@@ -0,0 +1,77 @@
+import threading
+from .models import db, Account
+
+# Request header selecting the account a request acts on
+ACCOUNT_HEADER = 'X-Account-Id'
+
+
+class AccountNotFound(Exception):
+    def __init__(self):
+        super().__init__("Account not found.")
+
+
+# Ids of accounts known to exist. Accounts are never deleted, so a hit saves
+# the lookup on every request.
+_known = set()
+_lock = threading.Lock()
+
+
+def init_app(app):
+    with _lock:
+        _known.clear()
+
+
+def requested_account_id(headers, default_id):
+    # Account id from the request headers; raises AccountNotFound when malformed
+    value = headers.get(ACCOUNT_HEADER)
+    if value is None or value == '':
+        return default_id
+    try:
+        account_id = int(value)
+    except ValueError:
+        raise AccountNotFound()
+    if account_id <= 0:
+        raise AccountNotFound()
+    return account_id
+
+
+def _remember(account_id):
+    with _lock:
+        _known.add(account_id)
+
+
+def _is_known(account_id):
+    with _lock:
+        return account_id in _known
+
+
+def current_account(headers, default_id):
+    # Id of the existing account the request acts on; needs an app context
+    account_id = requested_account_id(headers, default_id)
+    if not _is_known(account_id):
+        if db.session.get(Account, account_id) is None:
+            raise AccountNotFound()
+        _remember(account_id)
+    return account_id
+
+
+async def current_account_async(session_factory, headers, default_id):
+    # current_account for the async app; 'session_factory' opens an AsyncSession
+    account_id = requested_account_id(headers, default_id)
+    if not _is_known(account_id):
+        async with session_factory() as session:
+            if await session.get(Account, account_id) is None:
+                raise AccountNotFound()
+        _remember(account_id)
+    return account_id
+
+
+def parse_account_name(payload):
+    # Name of a new account; raises ValueError when missing or too long
+    name = payload.get('name') if isinstance(payload, dict) else None
+    name = str(name or '').strip()
+    if not name:
+        raise ValueError("Account name is required.")
+    if len(name) > 100:
+        raise ValueError("Account name must be at most 100 characters.")
+    return name
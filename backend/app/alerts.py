@@ -0,0 +1,319 @@
+import bisect
+import datetime
+import json
+import queue
+import threading
+from array import array
+from sqlalchemy import inspect, select, update
+from .models import db, PriceAlert
+
+ACTIVE = 'active'
+TRIGGERED = 'triggered'
+DIRECTIONS = ('above', 'below')
+# Alert ids per UPDATE ... WHERE id IN (...) when recording triggered alerts
+ID_CHUNK_SIZE = 500
+# Triggered alerts are stamped before their commit, so each refresh also
+# looks this far behind the previous one for alerts other workers committed
+# late
+COMMIT_GRACE = datetime.timedelta(seconds=30)
+
+
+def parse_alert(payload):
+    # (ticker, direction, price) of a new alert; raises ValueError when invalid
+    payload = payload if isinstance(payload, dict) else {}
+    ticker = str(payload.get('ticker') or '').strip().upper()
+    if not ticker or len(ticker) > 10:
+        raise ValueError("A ticker of at most 10 characters is required.")
+    direction = payload.get('direction')
+    if direction not in DIRECTIONS:
+        raise ValueError("Direction must be 'above' or 'below'.")
+    price = payload.get('price')
+    if isinstance(price, bool) or not isinstance(price, (int, float)) or not 0 < price < float('inf'):
+        raise ValueError("Price must be a positive number.")
+    return ticker, direction, float(price)
+
+
+class _Thresholds:
+    """
+    Alerts of one symbol and direction, sorted so triggered ones are a tail.
+
+    Keys, alert ids and account ids are parallel typed arrays, 24 bytes per
+    alert. 'below' alerts are keyed by their price, so a quote at or under a
+    price triggers the tail from bisect_left(keys, quote); 'above' alerts are
+    keyed by the negated price, which turns them into the same tail. Taking
+    the k triggered alerts out is one bisect and a truncation of the arrays.
+    """
+
+    __slots__ = ('keys', 'ids', 'accounts')
+
+    def __init__(self):
+        self.keys = array('d')
+        self.ids = array('q')
+        self.accounts = array('q')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def extend(self, entries):
+        # Adds (key, alert id, account id) entries; a few are inserted in
+        # place, many are merged with one sort
+        if len(entries) * 16 < len(self.keys):
+            for key, alert_id, account_id in entries:
+                index = bisect.bisect_right(self.keys, key)
+                self.keys.insert(index, key)
+                self.ids.insert(index, alert_id)
+                self.accounts.insert(index, account_id)
+            return
+        merged = sorted(list(zip(self.keys, self.ids, self.accounts)) + list(entries))
+        self.keys = array('d', [key for key, _, _ in merged])
+        self.ids = array('q', [alert_id for _, alert_id, _ in merged])
+        self.accounts = array('q', [account_id for _, _, account_id in merged])
+
+    def remove(self, key, alert_id):
+        index = bisect.bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            if self.ids[index] == alert_id:
+                del self.keys[index], self.ids[index], self.accounts[index]
+                return True
+            index += 1
+        return False
+
+    def take_from(self, key):
+        # Removes and returns the entries keyed 'key' or higher
+        index = bisect.bisect_left(self.keys, key)
+        if index == len(self.keys):
+            return []
+        taken = list(zip(self.keys[index:], self.ids[index:], self.accounts[index:]))
+        del self.keys[index:], self.ids[index:], self.accounts[index:]
+        return taken
+
+
+def _key(direction, price):
+    return -price if direction == 'above' else price
+
+
+def _price(quote):
+    price = (quote or {}).get('current_price')
+    return float(price) if isinstance(price, (int, float)) else None
+
+
+class AlertEngine:
+    """
+    Active price alerts, indexed for evaluation on every quote refresh.
+
+    Each symbol keeps its 'above' and 'below' alerts sorted by price, so a
+    refresh only bisects the symbols it got quotes for and takes out the
+    alerts their prices reached, O(log n + k), however many alerts are
+    waiting. Every worker indexes all active alerts, picking up those created
+    by other workers on its next refresh. A triggered alert is recorded by the
+    worker whose refresh reached it first, and every worker then finds it
+    among the alerts triggered since its previous refresh and pushes it once
+    to the subscribers of its account connected to that worker.
+    """
+
+    def __init__(self, max_queue=64):
+        self.max_queue = max_queue
+        # symbol -> {direction: _Thresholds}
+        self._books = {}
+        self._count = 0
+        self._last_id = 0
+        # Time of the previous publish_triggered, and the ids it published
+        # that were triggered within COMMIT_GRACE of it, with their times
+        self._published_at = datetime.datetime.now()
+        self._published = {}
+        # account id -> queues receiving triggered alerts
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        # Keeps a refresh and a request from indexing the same new alerts,
+        # and refreshes from publishing the same triggered ones
+        self._sync_lock = threading.Lock()
+
+    def init_app(self, app):
+        # Loads the active alerts; before db-upgrade has created their table
+        # there are none, and refreshes load them once it exists
+        with self._lock:
+            self._books, self._count, self._last_id = {}, 0, 0
+            self._published_at, self._published = datetime.datetime.now(), {}
+        with app.app_context():
+            if inspect(db.engine).has_table(PriceAlert.__tablename__):
+                self.sync(db.session)
+
+    def __len__(self):
+        return self._count
+
+    def symbols(self):
+        with self._lock:
+            return set(self._books)
+
+    def sync(self, session):
+        # Indexes the active alerts created since the last sync
+        with self._sync_lock:
+            rows = session.execute(
+                select(PriceAlert.id, PriceAlert.account_id, PriceAlert.ticker, PriceAlert.direction,
+                       PriceAlert.price)
+                .where(PriceAlert.id > self._last_id, PriceAlert.status == ACTIVE)
+                .order_by(PriceAlert.id)).all()
+            if rows:
+                self.add(rows)
+                self._last_id = rows[-1].id
+
+    def add(self, alerts):
+        # Indexes (id, account id, ticker, direction, price) rows
+        grouped = {}
+        for alert_id, account_id, ticker, direction, price in alerts:
+            grouped.setdefault((ticker, direction), []).append((_key(direction, price), alert_id, account_id))
+        with self._lock:
+            for (ticker, direction), entries in grouped.items():
+                book = self._books.setdefault(ticker, {d: _Thresholds() for d in DIRECTIONS})
+                book[direction].extend(entries)
+            self._count += len(alerts)
+
+    def remove(self, alert):
+        # Drops a deleted PriceAlert from the index
+        with self._lock:
+            book = self._books.get(alert.ticker)
+            if book is not None and book[alert.direction].remove(_key(alert.direction, alert.price), alert.id):
+                self._count -= 1
+                if not any(book.values()):
+                    del self._books[alert.ticker]
+
+    def match(self, quotes):
+        """
+        Takes the alerts reached by the prices in 'quotes' out of the index.
+
+        Returns {'id', 'account_id', 'ticker', 'direction', 'price',
+        'triggered_price'} for each of them.
+        """
+        triggered = []
+        with self._lock:
+            for symbol in self._books.keys() & quotes.keys():
+                price = _price(quotes[symbol])
+                if price is None:
+                    continue
+                book = self._books[symbol]
+                for direction in DIRECTIONS:
+                    for key, alert_id, account_id in book[direction].take_from(_key(direction, price)):
+                        triggered.append({'id': alert_id, 'account_id': account_id, 'ticker': symbol,
+                                          'direction': direction, 'price': abs(key), 'triggered_price': price})
+                if not any(book.values()):
+                    del self._books[symbol]
+            self._count -= len(triggered)
+        return triggered
+
+    def evaluate(self, session, quotes):
+        """
+        Records the alerts triggered by 'quotes', then publishes every alert
+        triggered since the previous refresh, here or by another worker.
+
+        Alerts deleted meanwhile, or already recorded by another worker, which
+        then keep their first trigger, are left alone. Returns the published
+        alerts.
+        """
+        triggered = self.match(quotes)
+        if triggered:
+            try:
+                self._record(session, triggered, datetime.datetime.now())
+                session.commit()
+            except Exception:
+                session.rollback()
+                # Back in the index for the next refresh
+                self.add([(a['id'], a['account_id'], a['ticker'], a['direction'], a['price'])
+                          for a in triggered])
+                raise
+        return self.publish_triggered(session)
+
+    def _record(self, session, triggered, now):
+        # Marks the 'triggered' alerts that are still active as triggered.
+        # Alerts reached by the same quote share their price, so they are
+        # updated a chunk of ids per statement
+        table = PriceAlert.__table__
+        statement = update(table).where(table.c.status == ACTIVE)
+        by_price = {}
+        for alert in triggered:
+            by_price.setdefault(alert['triggered_price'], []).append(alert['id'])
+        for price, ids in by_price.items():
+            for start in range(0, len(ids), ID_CHUNK_SIZE):
+                session.execute(statement.where(table.c.id.in_(ids[start:start + ID_CHUNK_SIZE]))
+                                .values(status=TRIGGERED, triggered_price=price, triggered_at=now))
+
+    def publish_triggered(self, session):
+        """
+        Pushes the alerts triggered since the previous call, by any worker, to
+        the subscribers of their accounts connected here.
+
+        Only the accounts with subscribers are looked up. An alert is pushed
+        once even though the lookups overlap by COMMIT_GRACE. Returns the
+        published alerts.
+        """
+        with self._sync_lock:
+            now = datetime.datetime.now()
+            since = self._published_at - COMMIT_GRACE
+            with self._lock:
+                accounts = list(self._subscribers)
+            rows = []
+            if accounts:
+                rows = session.execute(
+                    select(PriceAlert.id, PriceAlert.account_id, PriceAlert.ticker, PriceAlert.direction,
+                           PriceAlert.price, PriceAlert.triggered_price, PriceAlert.triggered_at)
+                    .where(PriceAlert.account_id.in_(accounts), PriceAlert.status == TRIGGERED,
+                           PriceAlert.triggered_at > since)
+                    .order_by(PriceAlert.triggered_at, PriceAlert.id)).all()
+
+            fired = []
+            for row in rows:
+                if row.id in self._published:
+                    continue
+                self._published[row.id] = row.triggered_at
+                fired.append({'id': row.id, 'account_id': row.account_id, 'ticker': row.ticker,
+                              'direction': row.direction, 'price': row.price,
+                              'triggered_price': row.triggered_price,
+                              'triggered_at': row.triggered_at.strftime('%Y-%m-%d %H:%M:%S')})
+            # Older ones are out of reach of the next lookup
+            self._published_at = now
+            self._published = {alert_id: triggered_at for alert_id, triggered_at in self._published.items()
+                               if triggered_at > now - COMMIT_GRACE}
+        self._publish(fired)
+        return fired
+
+    def subscribe(self, account_id):
+        # Returns a queue that receives the account's triggered alerts
+        subscription = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(account_id, set()).add(subscription)
+        return subscription
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def unsubscribe(self, account_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(account_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(account_id, None)
+
+    def _publish(self, alerts):
+        with self._lock:
+            targets = [(alert, list(self._subscribers.get(alert['account_id'], ()))) for alert in alerts]
+        for alert, subscriptions in targets:
+            for subscription in subscriptions:
+                # Slow consumers lose their oldest alert rather than blocking the refresh
+                while True:
+                    try:
+                        subscription.put_nowait(alert)
+                        break
+                    except queue.Full:
+                        try:
+                            subscription.get_nowait()
+                        except queue.Empty:
+                            pass
+
+
+def format_alert_event(alert):
+    # Server-Sent Events frame carrying one triggered alert
+    data = {key: value for key, value in alert.items() if key != 'account_id'}
+    return f"id: {alert['id']}\nevent: alert\ndata: {json.dumps(data)}\n\n"
+
+
+alert_engine = AlertEngine()
@@ -1,28 +1,78 @@
+import os
 from flask import Flask
 from .models import db
+from .migrations import upgrade, upgrade_command
+from .lots import rebuild_lots_command
+from .ledger import verify_ledger_command, compact_ledger_command
+from .orders import order_writer, order_writer_command
 from .routes import api
+from .alerts import alert_engine
+from . import accounts, database, lots, metrics, profiling, services, swagger
+from .streamer import quote_streamer
+from .valuation import valuation_engine
+from .symbols import symbol_index
 from config import Config 
 from flask_cors import CORS
-from flasgger import Swagger 
 
-def create_app():
+
+def _create_sqlite_directory(uri):
+    # A SQLite file can only be created in an existing directory
+    if uri.startswith('sqlite:///') and uri != 'sqlite:///:memory:':
+        directory = os.path.dirname(uri[len('sqlite:///'):])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+
+def create_app(config_object=Config):
+    # Nothing is created at import; gunicorn and the flask CLI call this, e.g.
+    #   gunicorn 'app.app:create_app()'
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_object)
+    _create_sqlite_directory(app.config['SQLALCHEMY_DATABASE_URI'])
+    database.configure(app)
     db.init_app(app)
+    services.init_app(app)
+    accounts.init_app(app)
+    lots.init_app(app)
+    valuation_engine.init_app(app)
+    symbol_index.init_app(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
     
-    CORS(app)
+    # Let the browser read the pagination cursor of /api/transactions and
+    # the portfolio ETags
+    CORS(app, expose_headers=['X-Next-Cursor', 'ETag'])
 
-    # Initialize Swagger
-    swagger = Swagger(app)
+    if app.config['AUTO_MIGRATE']:
+        with app.app_context():
+            upgrade()  # Create tables and apply pending migrations
 
-    with app.app_context():
-        db.create_all()  # Create tables if they don't exist
+    # flask --app app.app db-upgrade
+    app.cli.add_command(upgrade_command)
+    # flask --app app.app rebuild-lots
+    app.cli.add_command(rebuild_lots_command)
+    # flask --app app.app verify-ledger [--repair]
+    app.cli.add_command(verify_ledger_command)
+    # flask --app app.app compact-ledger 2020-01-01
+    app.cli.add_command(compact_ledger_command)
+    # flask --app app.app order-writer
+    app.cli.add_command(order_writer_command)
+    # flask --app app.app profile-report --route GET_api_portfolio
+    app.cli.add_command(profiling.profile_report_command)
+    # flask --app app.app swagger-export swagger.json
+    app.cli.add_command(swagger.swagger_export_command)
 
     app.register_blueprint(api, url_prefix='/api')
-    return app
+    swagger.init_app(app)
 
-app = create_app()
+    # Loaded after the tables exist, and before the streamer that evaluates them
+    alert_engine.init_app(app)
+    # Started after the tables exist since it reads held tickers
+    quote_streamer.init_app(app)
+    # Likewise for the queued orders
+    order_writer.init_app(app)
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True)
-    # app.run(host='0.0.0.0', port=5000)
+    create_app().run(debug=True)
+    # create_app().run(host='0.0.0.0', port=5000)
@@ -0,0 +1,37 @@
+from quart import Quart
+from config import Config
+from . import accounts, lots, metrics, services
+from .async_db import async_db
+from .async_routes import async_api
+from .valuation import valuation_engine
+from .symbols import symbol_index
+
+
+def create_app(config_object=Config):
+    # ASGI app serving the API with async handlers, e.g.
+    #   uvicorn --factory app.asgi:create_app --port 5000
+    app = Quart(__name__)
+    app.config.from_object(config_object)
+    async_db.init_app(app)
+    services.init_app(app)
+    accounts.init_app(app)
+    lots.init_app(app)
+    valuation_engine.init_app(app)
+    symbol_index.init_app(app)
+    metrics.init_async_app(app)
+
+    @app.after_request
+    async def allow_cors(response):
+        # Same open policy as flask_cors on the WSGI app
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, If-None-Match, X-Account-Id'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor, ETag'
+        return response
+
+    @app.after_serving
+    async def close_provider():
+        await services.get_provider().aclose()
+
+    app.register_blueprint(async_api, url_prefix='/api')
+    return app
@@ -0,0 +1,78 @@
+import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from .models import db, Account
+from .database import engine_options, REPLICA
+
+# Async drivers used in place of the default sync ones
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url):
+    # sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql://... -> postgresql+asyncpg://...
+    scheme, separator, rest = url.partition('://')
+    driver = ASYNC_DRIVERS.get(scheme.split('+')[0])
+    return f"{driver}{separator}{rest}" if driver else url
+
+
+class AsyncDatabase:
+    """
+    Async engine and session factory over the same models as the Flask app.
+
+    The engine is created when the ASGI server starts serving so it binds to the
+    serving event loop. With DATABASE_REPLICA_URL set, read_session() opens
+    sessions on a second engine for the replica.
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.sessionmaker = None
+        self.replica_engine = None
+        self.replica_sessionmaker = None
+
+    def init_app(self, app):
+        url = app.config.get('ASYNC_DATABASE_URL') or \
+            async_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        replica_url = app.config['DATABASE_REPLICA_URL'] and async_database_url(app.config['DATABASE_REPLICA_URL'])
+
+        @app.before_serving
+        async def connect():
+            self.engine = create_async_engine(url, **engine_options(url, app.config, 'async'))
+            self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+            if replica_url:
+                self.replica_engine = create_async_engine(
+                    replica_url, **engine_options(replica_url, app.config, f'async_{REPLICA}'))
+                self.replica_sessionmaker = async_sessionmaker(self.replica_engine, expire_on_commit=False)
+            if app.config['AUTO_MIGRATE']:
+                async with self.engine.begin() as conn:
+                    # Create tables if they don't exist. Existing databases are
+                    # migrated with: flask --app app.app db-upgrade
+                    await conn.run_sync(db.metadata.create_all)
+                    await self._create_default_account(conn, app.config['DEFAULT_ACCOUNT_ID'])
+
+        @app.after_serving
+        async def dispose():
+            await self.engine.dispose()
+            if self.replica_engine is not None:
+                await self.replica_engine.dispose()
+
+    async def _create_default_account(self, conn, account_id):
+        # Requests without an X-Account-Id header act on this account
+        if await conn.scalar(select(Account.id).where(Account.id == account_id)) is None:
+            await conn.execute(insert(Account).values(id=account_id, name='default',
+                                                      created_at=datetime.datetime.now()))
+
+    def session(self):
+        return self.sessionmaker()
+
+    def read_session(self):
+        # Session for reads that may lag behind the primary; on the primary
+        # without a replica
+        return (self.replica_sessionmaker or self.sessionmaker)()
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,294 @@
+from quart import Blueprint, Response, current_app, request, jsonify
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from .async_db import async_db
+from .models import Account, Portfolio
+from .accounts import current_account_async, parse_account_name, AccountNotFound
+from .services import fetch_instrument_data_async, get_quotes_async, quote_cache
+from .valuation import valuation_engine
+from .symbols import symbol_index, DEFAULT_LIMIT
+from .history import history_response
+from .performance import portfolio_history, realized_by_ticker
+from .pagination import transactions_query, paginate
+from .bulk import (import_transactions_async, export_transactions_async, lines_of, parse_format,
+                   CONTENT_TYPES)
+from .trading import (execute_trade_async, execute_orders_async, parse_orders, price_orders,
+                      batch_response, TradeError, BatchRejected)
+
+# Async counterparts of the routes in routes.py, with the same URLs and JSON
+# responses. See routes.py (or /apidocs on the WSGI app) for the API docs.
+async_api = Blueprint('async_api', __name__)
+
+
+def valuation_response(valuation, body):
+    etag = valuation_engine.etag(valuation)
+    if request.if_none_match.contains_weak(etag):
+        response = Response('', status=304)
+    else:
+        response = jsonify(body())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@async_api.errorhandler(AccountNotFound)
+async def account_not_found(e):
+    return jsonify({"error": str(e)}), 404
+
+
+async def request_account():
+    return await current_account_async(async_db.session, request.headers,
+                                       current_app.config['DEFAULT_ACCOUNT_ID'])
+
+
+async def _find_position(session, account_id, ticker):
+    result = await session.execute(select(Portfolio).where(Portfolio.account_id == account_id,
+                                                           Portfolio.ticker == ticker.upper()))
+    return result.scalars().first()
+
+
+@async_api.route('/instruments/autocomplete', methods=['GET'])
+async def autocomplete_instrument():
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    if limit <= 0:
+        return jsonify({"error": "Limit must be a positive number."}), 400
+
+    response = jsonify(symbol_index.search(request.args.get('q', ''), limit))
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+@async_api.route('/instruments/search', methods=['GET'])
+async def search_instrument():
+    account_id = await request_account()
+    ticker = (request.args.get('ticker') or '').strip()
+    if not ticker:
+        return jsonify({"error": "Ticker is required."}), 400
+
+    # Fetch the shares owned of this ticker, if any
+    async with async_db.session() as session:
+        position = await _find_position(session, account_id, ticker)
+    shares_owned = position.shares_owned if position else 0
+
+    try:
+        # Fetch instrument data, expecting it to return a list
+        instrument_data_list = await fetch_instrument_data_async(ticker)
+    except Exception as e:
+        return jsonify({"error": str(e)})
+
+    # Look for the specific instrument data in the list
+    instrument_data = next((item for item in instrument_data_list if item['symbol'].upper() == ticker.upper()), None)
+
+    if instrument_data is None:
+        return jsonify({"error": "Instrument not found."}), 404
+
+    # Include shares owned in the response
+    instrument_data['shares_owned'] = shares_owned
+
+    return jsonify(instrument_data)
+
+
+@async_api.route('/instruments/<ticker>/history', methods=['GET'])
+async def get_instrument_history(ticker):
+    try:
+        return jsonify(history_response(ticker, request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@async_api.route('/transactions/buy', methods=['POST'])
+async def buy_shares():
+    account_id = await request_account()
+    data = await request.get_json()
+    ticker = data.get('ticker')
+    shares = float(data.get('shares'))
+
+    if (shares <= 0):
+        return jsonify({"error": "Invalid number of shares."}), 400
+
+    # Fetch current price of the instrument
+    try:
+        instrument_data = await fetch_instrument_data_async(ticker)
+        # Extract the current price
+        price = instrument_data[0]['current_price']
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+    # Record the purchase and update the position in one transaction
+    await execute_trade_async(async_db.sessionmaker, account_id, ticker, shares, 'buy', price)
+
+    return jsonify({"message": "Shares purchased!"}), 201
+
+
+@async_api.route('/transactions/sell', methods=['POST'])
+async def sell_shares():
+    account_id = await request_account()
+    data = await request.get_json()
+    ticker = data.get('ticker')
+    shares = float(data.get('shares'))  # Convert shares to float
+
+    if (shares <= 0):
+        return jsonify({"error": "Invalid number of shares."}), 400
+
+    # Fetch current price of the instrument
+    try:
+        instrument_data = await fetch_instrument_data_async(ticker)
+        # Extract the current price
+        price = instrument_data[0]['current_price']
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+    # Record the sale and update the position in one transaction
+    try:
+        realized = await execute_trade_async(async_db.sessionmaker, account_id, ticker, shares, 'sell',
+                                             price)
+    except TradeError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"message": "Shares sold!", "realized_profit_loss": realized}), 201
+
+
+@async_api.route('/transactions/batch', methods=['POST'])
+async def execute_batch():
+    account_id = await request_account()
+    try:
+        orders, atomic = parse_orders(await request.get_json(), current_app.config['BATCH_MAX_ORDERS'])
+    except TradeError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Price every order with one quote lookup
+    tickers = list(dict.fromkeys(o['ticker'] for o in orders if not o.get('error')))
+    try:
+        price_orders(orders, await get_quotes_async(tickers) if tickers else {})
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+    rejected = {}
+    # An all-or-nothing batch with an invalid order never touches the database
+    if not (atomic and any(o.get('error') for o in orders)):
+        try:
+            rejected = await execute_orders_async(async_db.sessionmaker, account_id, orders, atomic)
+        except BatchRejected as e:
+            rejected = {e.index: str(e)}
+
+    body, status = batch_response(orders, atomic, rejected)
+    return jsonify(body), status
+
+
+@async_api.route('/transactions', methods=['GET'])
+async def get_transactions():
+    account_id = await request_account()
+    try:
+        query, limit = transactions_query(account_id, request.args,
+                                          current_app.config['TRANSACTIONS_PAGE_SIZE'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    async with async_db.read_session() as session:
+        transactions, next_cursor = paginate((await session.execute(query)).scalars().all(), limit)
+
+    # Format the transactions for JSON response
+    response = jsonify([t.to_dict() for t in transactions])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+@async_api.route('/transactions/import', methods=['POST'])
+async def import_transactions_file():
+    account_id = await request_account()
+    try:
+        format = parse_format(request.args.get('format'), request.content_type)
+        async with async_db.session() as session:
+            result = await import_transactions_async(session, account_id, lines_of(request.body), format)
+            await session.commit()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    valuation_engine.invalidate(account_id)
+    return jsonify(result), 201
+
+
+@async_api.route('/transactions/export', methods=['GET'])
+async def export_transactions_file():
+    account_id = await request_account()
+    try:
+        format = parse_format(request.args.get('format'))
+        chunks = export_transactions_async(async_db.session, account_id, request.args, format)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = Response(chunks, mimetype=CONTENT_TYPES[format])
+    response.headers['Content-Disposition'] = f'attachment; filename=transactions.{format}'
+    return response
+
+
+@async_api.route('/portfolio', methods=['GET'])
+async def get_portfolio():
+    # Shared with /portfolio/status, which the frontend calls right after
+    valuation = await valuation_engine.snapshot_async(async_db.read_session, await request_account())
+
+    if not valuation:
+        return jsonify([])
+
+    if valuation.quote_error is not None:
+        raise Exception("Error fetching instrument data.")
+
+    return valuation_response(valuation, valuation.positions)
+
+
+@async_api.route('/portfolio/status', methods=['GET'])
+async def get_portfolio_status():
+    valuation = await valuation_engine.snapshot_async(async_db.read_session, await request_account())
+
+    if not valuation:
+        return jsonify([])
+
+    # Positions are valued at 0 when quotes could not be fetched
+    return valuation_response(valuation, valuation.summary)
+
+
+@async_api.route('/portfolio/history', methods=['GET'])
+async def get_portfolio_history():
+    account_id = await request_account()
+    async with async_db.session() as session:
+        try:
+            points = await session.run_sync(portfolio_history, account_id, request.args,
+                                            current_app.config)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+    return jsonify(points)
+
+
+@async_api.route('/portfolio/realized', methods=['GET'])
+async def get_realized_profit_loss():
+    account_id = await request_account()
+    async with async_db.session() as session:
+        return jsonify(await session.run_sync(realized_by_ticker, account_id))
+
+
+@async_api.route('/accounts', methods=['POST'])
+async def create_account():
+    try:
+        name = parse_account_name(await request.get_json())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    account = Account(name=name)
+    try:
+        async with async_db.session() as session, session.begin():
+            session.add(account)
+    except IntegrityError:
+        return jsonify({"error": "Account name is already taken."}), 409
+
+    return jsonify(account.to_dict()), 201
+
+
+@async_api.route('/quotes/cache', methods=['GET'])
+async def get_quote_cache_stats():
+    return jsonify(quote_cache.stats())
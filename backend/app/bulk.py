@@ -0,0 +1,250 @@
+import codecs
+import csv
+import datetime
+import io
+import json
+import math
+from sqlalchemy import insert
+from .models import Transaction
+from .history import SYMBOL_PATTERN
+from .lots import rebuild
+from .pagination import parse_date, transactions_query
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+CONTENT_TYPES = {
+    CSV: 'text/csv',
+    NDJSON: 'application/x-ndjson',
+}
+
+# Columns read by an import; others, such as the id and realized_profit_loss
+# of an export, are ignored so an export can be imported again
+IMPORT_COLUMNS = ('ticker', 'shares', 'operation', 'price', 'date')
+EXPORT_COLUMNS = ('id', 'ticker', 'shares', 'operation', 'price', 'date', 'realized_profit_loss')
+
+# Rows per bulk INSERT when importing, and per fetch when exporting
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+
+# A Core INSERT of the table rather than of the entity, which skips the ORM's
+# per-row bookkeeping; the rows are plain dicts and nothing reads them back
+INSERT = insert(Transaction.__table__)
+
+
+def parse_format(value, content_type=None):
+    # 'csv' or 'ndjson' from a format argument, else from a content type
+    if value:
+        if value.lower() not in CONTENT_TYPES:
+            raise ValueError(f"Format must be one of: {', '.join(CONTENT_TYPES)}.")
+        return value.lower()
+    if content_type:
+        for name, mimetype in CONTENT_TYPES.items():
+            if content_type.split(';')[0].strip().lower() in (mimetype, f'application/{name}'):
+                return name
+    return CSV
+
+
+class RowReader:
+    """
+    Turns the lines of a CSV or NDJSON upload into Transaction rows.
+
+    Lines are fed one at a time, so an upload is never held in memory. A CSV
+    upload starts with a header naming at least the import columns, in any
+    order. Raises ValueError naming the line of the first invalid row.
+    """
+
+    def __init__(self, format, account_id):
+        self.format = format
+        self.account_id = account_id
+        self.line = 0
+        self.count = 0
+        self.earliest = None
+        self._columns = None
+
+    def feed(self, text):
+        # The row of one line, or None for a header or blank line
+        self.line += 1
+        if not text.strip():
+            return None
+        try:
+            if self.format == NDJSON:
+                raw = json.loads(text)
+                if not isinstance(raw, dict):
+                    raise ValueError("Expected a JSON object.")
+            elif self._columns is None:
+                self._columns = self._header(text)
+                return None
+            else:
+                values = next(csv.reader([text]))
+                raw = dict(zip(self._columns, values))
+            row = self._row(raw)
+        except ValueError as e:
+            raise ValueError(f"Line {self.line}: {e}")
+
+        self.count += 1
+        if self.earliest is None or row['date'] < self.earliest:
+            self.earliest = row['date']
+        return row
+
+    def _header(self, text):
+        columns = [c.strip().lower() for c in next(csv.reader([text]))]
+        missing = [c for c in IMPORT_COLUMNS if c not in columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}.")
+        return columns
+
+    def _row(self, raw):
+        ticker = str(raw.get('ticker') or '').strip().upper()
+        if not SYMBOL_PATTERN.match(ticker) or len(ticker) > 10:
+            raise ValueError("Invalid ticker symbol.")
+        operation = str(raw.get('operation') or '').strip().lower()
+        if operation not in ('buy', 'sell'):
+            raise ValueError("Operation must be 'buy' or 'sell'.")
+        shares = _number(raw.get('shares'), "Invalid number of shares.")
+        price = _number(raw.get('price'), "Invalid price.")
+        date = raw.get('date')
+        if not isinstance(date, str) or not date:
+            raise ValueError("Date is required.")
+        date = parse_date(date.strip())
+        if date.tzinfo is not None:
+            # Stored like every other date: local time without an offset
+            date = date.astimezone().replace(tzinfo=None)
+        if date > datetime.datetime.now():
+            raise ValueError("Date is in the future.")
+        return {'account_id': self.account_id, 'ticker': ticker, 'shares': shares,
+                'operation': operation, 'price': price, 'date': date}
+
+
+def _number(value, error):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(error)
+    if not math.isfinite(number) or number <= 0:
+        raise ValueError(error)
+    return number
+
+
+def _finish(session, reader):
+    # Lots, positions and realized profit/loss of the account, replayed in one
+    # pass with the imported rows in date order among the existing ones
+    if reader.count == 0:
+        raise ValueError("No transactions to import.")
+    rebuild(session, reader.account_id, strict=True)
+    return {'imported': reader.count, 'earliest': reader.earliest.isoformat()}
+
+
+def import_transactions(session, account_id, lines, format, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Imports the transactions in 'lines' of CSV or NDJSON into an account.
+
+    Trades keep the prices and dates in the file. Rows are inserted with
+    executemany INSERTs of 'chunk_size' rows, then the account's lots,
+    positions and realized profit/loss are rebuilt from its whole log, so
+    backdated trades land in order. Raises ValueError for an invalid row or a
+    sale the history doesn't cover; the caller commits or rolls back.
+    """
+    reader = RowReader(format, account_id)
+    chunk = []
+    for text in lines:
+        row = reader.feed(text)
+        if row is not None:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                session.execute(INSERT, chunk)
+                chunk = []
+    if chunk:
+        session.execute(INSERT, chunk)
+    return _finish(session, reader)
+
+
+async def import_transactions_async(session, account_id, lines, format, chunk_size=IMPORT_CHUNK_SIZE):
+    # import_transactions for an AsyncSession and an async iterable of lines
+    reader = RowReader(format, account_id)
+    chunk = []
+    async for text in lines:
+        row = reader.feed(text)
+        if row is not None:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                await session.execute(INSERT, chunk)
+                chunk = []
+    if chunk:
+        await session.execute(INSERT, chunk)
+    return await session.run_sync(_finish, reader)
+
+
+async def lines_of(chunks, encoding='utf-8-sig'):
+    # Text lines of an async iterable of byte chunks, such as a Quart body
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def export_query(account_id, args):
+    # Columns of the account's transactions matching the /transactions filters,
+    # newest first and without a page limit, fetched in chunks through a
+    # server-side cursor
+    query, _ = transactions_query(account_id, args)
+    return (query.with_only_columns(*(getattr(Transaction, c) for c in EXPORT_COLUMNS))
+            .limit(None)
+            .execution_options(yield_per=EXPORT_CHUNK_SIZE))
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def format_header(format):
+    if format != CSV:
+        return ''
+    return ','.join(EXPORT_COLUMNS) + '\r\n'
+
+
+def format_rows(rows, format):
+    # One chunk of the export body for a list of rows
+    if format == NDJSON:
+        return ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, map(_value, row)))) + '\n' for row in rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_value(v) if v is not None else '' for v in row] for row in rows)
+    return buffer.getvalue()
+
+
+def export_transactions(session, account_id, args, format):
+    """
+    Streams an account's transactions as CSV or NDJSON text chunks.
+
+    Rows come from a server-side cursor in chunks of EXPORT_CHUNK_SIZE, so the
+    export runs in constant memory however long the history is. Accepts the
+    filters of /transactions. Raises ValueError for invalid arguments before
+    anything is yielded.
+    """
+    query = export_query(account_id, args)
+
+    def chunks():
+        yield format_header(format)
+        for partition in session.execute(query).partitions():
+            yield format_rows(partition, format)
+    return chunks()
+
+
+def export_transactions_async(session_factory, account_id, args, format):
+    # export_transactions for the async app; the chunks are read in a session
+    # of their own, which outlives the request handler
+    query = export_query(account_id, args)
+
+    async def chunks():
+        yield format_header(format)
+        async with session_factory() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions():
+                yield format_rows(partition, format)
+    return chunks()
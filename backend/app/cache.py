@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    # An upstream lookup in progress that other callers can wait on
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QuoteCache:
+    """
+    Per-symbol quote cache with a TTL and LRU eviction.
+
+    Concurrent misses for the same symbol share a single upstream call and all
+    misses of one lookup are handed to the loader together, so they can be
+    fetched with one batched request.
+    """
+
+    def __init__(self, ttl=5.0, max_size=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        # symbol -> (expires_at, quote), least recently used first
+        self._entries = OrderedDict()
+        # symbol -> _Flight for lookups currently hitting the upstream
+        self._flights = {}
+        # symbol -> asyncio.Future for lookups made from an event loop
+        self._async_flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.upstream_calls = 0
+
+    def get_many(self, symbols, loader):
+        # 'loader' takes a list of symbols and returns a dict of symbol -> quote
+        results, waiting, owned = self._lookup(symbols, self._flights, _Flight)
+
+        if owned:
+            quotes, error = {}, None
+            try:
+                with self._lock:
+                    self.upstream_calls += 1
+                quotes = loader(owned)
+            except Exception as e:
+                error = e
+            finally:
+                self._settle(owned, self._flights, quotes, error)
+
+        for symbol, flight in waiting.items():
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            if flight.value is not None:
+                results[symbol] = flight.value
+
+        return results
+
+    async def get_many_async(self, symbols, loader):
+        # Same as get_many for use on an event loop; 'loader' is a coroutine function
+        loop = asyncio.get_running_loop()
+        results, waiting, owned = self._lookup(symbols, self._async_flights, loop.create_future)
+
+        if owned:
+            quotes, error = {}, None
+            try:
+                with self._lock:
+                    self.upstream_calls += 1
+                quotes = await loader(owned)
+            except Exception as e:
+                error = e
+            except BaseException as e:
+                # Cancelled: callers waiting on this lookup are cancelled too
+                # rather than told the symbols weren't found
+                error = e
+                raise
+            finally:
+                self._settle(owned, self._async_flights, quotes, error)
+
+        for symbol, flight in waiting.items():
+            value = await flight
+            if value is not None:
+                results[symbol] = value
+
+        return results
+
+    def put_many(self, quotes):
+        # Store quotes fetched outside of get_many (e.g. by a background refresh)
+        with self._lock:
+            self._store(quotes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.stale = self.upstream_calls = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'upstream_calls': self.upstream_calls,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _lookup(self, symbols, flights, new_flight):
+        # Split symbols into fresh hits, lookups to wait on and ones this caller loads
+        results = {}
+        waiting = {}
+        owned = []
+
+        with self._lock:
+            now = self._clock()
+            for symbol in symbols:
+                entry = self._entries.get(symbol)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(symbol)
+                    results[symbol] = entry[1]
+                    self.hits += 1
+                    continue
+
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.stale += 1
+
+                # Join a lookup already in progress or start a new one
+                flight = flights.get(symbol)
+                if flight is None:
+                    flight = new_flight()
+                    flights[symbol] = flight
+                    owned.append(symbol)
+                waiting[symbol] = flight
+
+        return results, waiting, owned
+
+    def _settle(self, symbols, flights, quotes, error):
+        with self._lock:
+            self._store(quotes)
+            settled = [flights.pop(symbol) for symbol in symbols]
+
+        # Wake up every caller waiting on these symbols, even on failure
+        for symbol, flight in zip(symbols, settled):
+            if isinstance(flight, _Flight):
+                flight.value = quotes.get(symbol)
+                flight.error = error
+                flight.event.set()
+            elif isinstance(error, asyncio.CancelledError):
+                flight.cancel()
+            elif error is not None:
+                flight.set_exception(error)
+            else:
+                flight.set_result(quotes.get(symbol))
+
+    def _store(self, quotes):
+        # Caller must hold the lock
+        if self.ttl <= 0:
+            return
+        expires_at = self._clock() + self.ttl
+        for symbol, quote in quotes.items():
+            self._entries[symbol] = (expires_at, quote)
+            self._entries.move_to_end(symbol)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,115 @@
+import time
+from flask import current_app
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from . import metrics
+
+# Key of the read replica's engine in app.extensions, and its metrics label
+REPLICA = 'replica'
+
+
+class _TimedPool:
+    # Records each checkout and how long it took, including any wait for a
+    # connection to be returned when the pool is exhausted. The engine it
+    # belongs to is named by create_engine's pool_logging_name
+
+    def connect(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            metrics.observe_pool_checkout(self.logging_name or 'primary', started, timed_out)
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def _is_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def _connect_args(url, config):
+    # Statement timeout and prepared statement reuse, which each Postgres
+    # driver takes in its own way; psycopg2 has no prepared statements
+    args = {}
+    if url.get_backend_name() != 'postgresql':
+        return args
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    driver = url.get_driver_name()
+    if driver == 'asyncpg':
+        args['prepared_statement_cache_size'] = config['DB_STATEMENT_CACHE_SIZE']
+        if timeout:
+            args['server_settings'] = {'statement_timeout': str(timeout)}
+    else:
+        if timeout:
+            args['options'] = f"-c statement_timeout={timeout}"
+        if driver == 'psycopg':
+            args['prepare_threshold'] = config['DB_PREPARE_THRESHOLD'] or None
+    return args
+
+
+def engine_options(url, config, name='primary'):
+    """
+    create_engine() options for 'url' from the DB_* settings.
+
+    Every pooled engine gets a pool that reports to the db_pool_* metrics
+    under 'name'. Sizing, recycling, pre-ping and the statement timeout only
+    apply to database servers; SQLite keeps SQLAlchemy's defaults, and an
+    in-memory SQLite database gets no options at all as it is one shared
+    connection.
+    """
+    url = make_url(url)
+    if _is_memory(url):
+        return {}
+    pool = TimedAsyncQueuePool if url.get_dialect().is_async else TimedQueuePool
+    options = {'poolclass': pool, 'pool_logging_name': name}
+    if url.get_backend_name() == 'sqlite':
+        return options
+
+    options.update(pool_size=config['DB_POOL_SIZE'], max_overflow=config['DB_MAX_OVERFLOW'],
+                   pool_timeout=config['DB_POOL_TIMEOUT'], pool_recycle=config['DB_POOL_RECYCLE'],
+                   pool_pre_ping=config['DB_POOL_PRE_PING'])
+    connect_args = _connect_args(url, config)
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure(app):
+    """
+    Sets the engine options of the primary database and creates the engine
+    of the read replica.
+
+    Runs before db.init_app. SQLALCHEMY_ENGINE_OPTIONS set by the config
+    object are kept as they are. The replica isn't a Flask-SQLAlchemy bind,
+    since binds get their own metadata on the shared 'db' that create_all
+    would then try to create on the replica.
+    """
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'],
+                                                                 app.config)
+    replica = app.config['DATABASE_REPLICA_URL']
+    if replica:
+        app.extensions[REPLICA] = create_engine(replica, **engine_options(replica, app.config, REPLICA))
+
+
+def read_bind():
+    """
+    bind_arguments for db.session.execute() sending a read to the replica.
+
+    Only for reads that may lag behind the primary by the replication delay;
+    None, which leaves the statement on the primary, without a replica.
+    Needs an app context.
+    """
+    engine = current_app.extensions.get(REPLICA)
+    return None if engine is None else {'bind': engine}
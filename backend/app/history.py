@@ -0,0 +1,288 @@
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import numpy as np
+from config import Config
+from .pagination import parse_date
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Symbols that can name a history file, e.g. 'AAPL', 'BRK.B', '^GSPC' or 'EURUSD=X'
+SYMBOL_PATTERN = re.compile(r'^[A-Z0-9^][A-Z0-9.\-=^]{0,19}$')
+
+# Bar intervals accepted by /instruments/<ticker>/history, in seconds
+INTERVALS = {
+    '1m': 60,
+    '5m': 5 * 60,
+    '15m': 15 * 60,
+    '30m': 30 * 60,
+    '1h': 60 * 60,
+    '4h': 4 * 60 * 60,
+    '1d': 24 * 60 * 60,
+    '1w': 7 * 24 * 60 * 60,
+}
+# Weekly bars start on Monday; the epoch was a Thursday
+WEEK_OFFSET = 4 * 24 * 60 * 60
+
+TIME_DTYPE = np.dtype('<i8')   # Milliseconds since the epoch
+PRICE_DTYPE = np.dtype('<f8')
+# Fetches waiting to be recorded by the background writer before new ones are dropped
+MAX_PENDING = 1024
+
+
+def parse_interval(value):
+    # Seconds in a bar interval such as '5m'; raises ValueError when unknown
+    if value not in INTERVALS:
+        raise ValueError(f"Interval must be one of: {', '.join(INTERVALS)}.")
+    return INTERVALS[value]
+
+
+def _to_millis(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def ohlc_bars(times, prices, step):
+    """
+    Downsamples ticks sorted by time into OHLC bars of 'step' seconds.
+
+    Bars are aligned to the epoch (weeks to Mondays) and only intervals with
+    ticks get one. Returns a list of dicts with the bar start in epoch seconds.
+    """
+    if len(times) == 0:
+        return []
+    offset = WEEK_OFFSET if step == INTERVALS['1w'] else 0
+    first = (int(times[0]) // 1000 - offset) // step * step + offset
+    last = (int(times[-1]) // 1000 - offset) // step * step + offset
+    edges = np.arange(first, last + 2 * step, step)
+
+    # Ticks are sorted, so each bar is a contiguous run found by binary search
+    # on the bar edges rather than by bucketing every tick
+    bounds = np.searchsorted(times, edges * 1000, 'left')
+    used = bounds[1:] > bounds[:-1]
+    starts, ends, edges = bounds[:-1][used], bounds[1:][used], edges[:-1][used]
+
+    opens = prices[starts]
+    highs = np.maximum.reduceat(prices, starts)
+    lows = np.minimum.reduceat(prices, starts)
+    closes = prices[ends - 1]
+
+    return [{'time': int(t), 'open': float(o), 'high': float(h), 'low': float(l),
+             'close': float(c), 'ticks': int(n)}
+            for t, o, h, l, c, n in zip(edges.tolist(), opens.tolist(), highs.tolist(),
+                                        lows.tolist(), closes.tolist(), (ends - starts).tolist())]
+
+
+class PriceHistory:
+    """
+    Append-only store of every quote fetched from the provider.
+
+    Each symbol has two column files in 'directory': <SYMBOL>.time with int64
+    epoch milliseconds and <SYMBOL>.price with float64 prices, appended to in
+    time order. Reads memory-map the columns and binary search the time column,
+    so a range query only pages in the ticks it returns no matter how many
+    years of history a symbol has. An empty 'directory' disables the store.
+
+    Quote fetches hand their quotes to submit(), which returns at once; a
+    background thread records them, so requests and the event loop of the
+    async app don't wait on the files or their locks.
+    """
+
+    def __init__(self, directory=None, max_bars=2000, clock=time.time):
+        self.directory = directory
+        self.max_bars = max_bars
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=MAX_PENDING)
+        self._writer = None
+        # Apart from _lock, which the writer holds while it appends
+        self._writer_lock = threading.Lock()
+
+    def init_app(self, app):
+        # Quotes submitted so far go to the directory they were fetched for
+        self.flush()
+        self.directory = app.config['PRICE_HISTORY_DIR']
+        self.max_bars = app.config['PRICE_HISTORY_MAX_BARS']
+
+    def submit(self, quotes):
+        # Records the quotes (symbol -> quote data) from the background writer
+        if not self.directory:
+            return
+        try:
+            self._pending.put_nowait(quotes)
+        except queue.Full:
+            logger.warning("Price history writer is behind, %d ticks not recorded", len(quotes))
+            return
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_pending, name='price-history', daemon=True)
+                self._writer.start()
+
+    def flush(self):
+        # Waits until every submitted quote is recorded
+        self._pending.join()
+
+    def _write_pending(self):
+        while True:
+            quotes = self._pending.get()
+            try:
+                self.record(quotes)
+            except Exception:
+                logger.exception("Could not record price history")
+            finally:
+                self._pending.task_done()
+
+    def _path(self, symbol, column):
+        return os.path.join(self.directory, f"{symbol}.{column}")
+
+    def record(self, quotes):
+        # Appends the current price of each quote (symbol -> quote data)
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._lock:
+                for symbol, quote in quotes.items():
+                    price = quote.get('current_price')
+                    if SYMBOL_PATTERN.match(symbol) and isinstance(price, (int, float)):
+                        self._append(symbol, float(price))
+        except OSError:
+            # Losing a tick must never fail the request that fetched it
+            logger.exception("Could not record price history")
+
+    def _append(self, symbol, price):
+        # Caller must hold the lock
+        with open(self._path(symbol, 'time'), 'ab+') as times, \
+                open(self._path(symbol, 'price'), 'ab+') as prices:
+            if fcntl is not None:
+                # Another worker process may be appending to the same symbol
+                fcntl.flock(times, fcntl.LOCK_EX)
+            # Both read under the file lock, so a tick timed before another
+            # worker's last write can't be appended after it
+            now = int(self._clock() * 1000)
+            last = self._last_time(times)
+            if now <= last:
+                # Keeps the time column sorted; the same instant is recorded once
+                return
+            count = min(times.seek(0, os.SEEK_END) // TIME_DTYPE.itemsize,
+                        prices.seek(0, os.SEEK_END) // PRICE_DTYPE.itemsize)
+            # Drops a partial tick left behind by a crash between the two writes
+            times.truncate(count * TIME_DTYPE.itemsize)
+            prices.truncate(count * PRICE_DTYPE.itemsize)
+            times.write(np.array([now], TIME_DTYPE).tobytes())
+            prices.write(np.array([price], PRICE_DTYPE).tobytes())
+
+    def _last_time(self, times):
+        size = times.seek(0, os.SEEK_END) // TIME_DTYPE.itemsize * TIME_DTYPE.itemsize
+        if size == 0:
+            return -1
+        times.seek(size - TIME_DTYPE.itemsize)
+        return int(np.frombuffer(times.read(TIME_DTYPE.itemsize), TIME_DTYPE)[0])
+
+    def ticks(self, symbol, start=None, end=None):
+        """
+        Ticks of 'symbol' with start <= time < end as (times, prices) arrays.
+
+        'start' and 'end' are datetimes; either may be None for an open range.
+        """
+        times, prices = self._columns(symbol, start, end)
+        # Copied out so the files aren't kept mapped by the caller
+        return np.array(times), np.array(prices)
+
+    def _columns(self, symbol, start, end):
+        # Memory-mapped slices of the time and price columns within the range
+        symbol = symbol.upper()
+        empty = np.empty(0, TIME_DTYPE), np.empty(0, PRICE_DTYPE)
+        if not self.directory or not SYMBOL_PATTERN.match(symbol):
+            return empty
+        try:
+            count = min(os.path.getsize(self._path(symbol, 'time')) // TIME_DTYPE.itemsize,
+                        os.path.getsize(self._path(symbol, 'price')) // PRICE_DTYPE.itemsize)
+        except OSError:
+            return empty
+        if count == 0:
+            return empty
+
+        times = np.memmap(self._path(symbol, 'time'), TIME_DTYPE, mode='r', shape=(count,))
+        lo = 0 if start is None else int(np.searchsorted(times, _to_millis(start), 'left'))
+        hi = count if end is None else int(np.searchsorted(times, _to_millis(end), 'left'))
+        if lo >= hi:
+            return empty
+        prices = np.memmap(self._path(symbol, 'price'), PRICE_DTYPE, mode='r', shape=(count,))
+        return times[lo:hi], prices[lo:hi]
+
+    def prices_at(self, symbol, moments):
+        """
+        Last recorded price of 'symbol' before each of 'moments'.
+
+        'moments' are sorted epoch milliseconds. Returns (times, prices) arrays
+        of the matching ticks, with a time of -1 where nothing was recorded yet.
+        """
+        moments = np.asarray(moments, dtype=TIME_DTYPE)
+        found = np.full(len(moments), -1, TIME_DTYPE), np.full(len(moments), np.nan)
+        times, prices = self._columns(symbol, None, None)
+        if len(times) == 0:
+            return found
+        rows = np.searchsorted(times, moments, 'left') - 1
+        recorded = rows >= 0
+        found[0][recorded] = times[rows[recorded]]
+        found[1][recorded] = prices[rows[recorded]]
+        return found
+
+    def bars(self, symbol, start=None, end=None, interval=None):
+        """
+        OHLC bars of 'symbol' between 'start' and 'end'.
+
+        Without an 'interval' the smallest one giving at most 'max_bars' bars
+        over the range is used. Returns (interval, bars); raises ValueError for
+        an unknown interval or one giving more than 'max_bars' bars.
+        """
+        times, prices = self._columns(symbol, start, end)
+        first = _to_millis(start) if start is not None else (int(times[0]) if len(times) else 0)
+        last = _to_millis(end) if end is not None else (int(times[-1]) if len(times) else 0)
+        span = max(0, last - first) // 1000
+
+        if interval is None:
+            interval = next((name for name, step in INTERVALS.items()
+                             if span // step < self.max_bars), '1w')
+        step = parse_interval(interval)
+        if span // step >= self.max_bars:
+            raise ValueError(f"Interval '{interval}' gives more than {self.max_bars} bars "
+                             f"for this range, use a longer one.")
+        return interval, ohlc_bars(times, prices, step)
+
+
+def parse_history_args(args):
+    # (start, end, interval) of a history request; raises ValueError when invalid
+    start = parse_date(args['start']) if args.get('start') else None
+    end = parse_date(args['end'], end=True) if args.get('end') else None
+    if start is not None and end is not None and start >= end:
+        raise ValueError("Start must be before end.")
+    interval = args.get('interval') or None
+    if interval is not None:
+        parse_interval(interval)
+    return start, end, interval
+
+
+def history_response(symbol, args):
+    # Body of /instruments/<ticker>/history; raises ValueError for invalid args
+    symbol = symbol.upper()
+    if not SYMBOL_PATTERN.match(symbol):
+        raise ValueError("Invalid ticker symbol.")
+    start, end, interval = parse_history_args(args)
+    interval, bars = price_history.bars(symbol, start, end, interval)
+    return {
+        'symbol': symbol,
+        'interval': interval,
+        'bars': bars
+    }
+
+
+price_history = PriceHistory(Config.PRICE_HISTORY_DIR, Config.PRICE_HISTORY_MAX_BARS)
@@ -0,0 +1,180 @@
+import datetime
+import math
+import click
+from sqlalchemy import and_, case, delete, exists, func, insert, literal, select, update
+from .models import db, Portfolio, PortfolioCheckpoint, Transaction, TransactionArchive
+from .lots import LotBook, REBUILD_CHUNK_SIZE
+
+# Differences below these are float rounding rather than drift
+SHARES_TOLERANCE = 1e-9
+COST_TOLERANCE = 1e-6
+# Opening-balance rows written per round trip by compact()
+OPENING_CHUNK_SIZE = 1000
+
+ARCHIVED_COLUMNS = ('id', 'account_id', 'ticker', 'shares', 'operation', 'price', 'date',
+                    'realized_profit_loss')
+
+
+def _scoped(query, model, account_id):
+    return query if account_id is None else query.where(model.account_id == account_id)
+
+
+def ledger_positions(session, account_id=None):
+    """
+    Positions recomputed from the transaction log in one grouped aggregate.
+
+    A buy adds its shares and cost; a sell takes off its shares and the cost
+    basis it removed, which is its sale value less its realized profit/loss.
+    Returns {(account id, ticker): (shares, cost basis)} of the positions with
+    shares left.
+    """
+    buy = Transaction.operation == 'buy'
+    cost_removed = Transaction.shares * Transaction.price - func.coalesce(Transaction.realized_profit_loss, 0)
+    query = (select(Transaction.account_id, Transaction.ticker,
+                    func.sum(case((buy, Transaction.shares), else_=-Transaction.shares)),
+                    func.sum(case((buy, Transaction.shares * Transaction.price), else_=-cost_removed)))
+             .group_by(Transaction.account_id, Transaction.ticker))
+    rows = session.execute(_scoped(query, Transaction, account_id))
+    return {(account, ticker): (shares, cost_basis)
+            for account, ticker, shares, cost_basis in rows if shares > SHARES_TOLERANCE}
+
+
+def verify(session, account_id=None):
+    """
+    Compares the stored positions with those recomputed from the log.
+
+    Returns one entry per position that drifted, with the stored and the
+    expected shares and cost basis; a position that should be closed expects
+    zero shares. Positions of tickers without any transactions are left out,
+    as rebuild-lots keeps them.
+    """
+    expected = ledger_positions(session, account_id)
+    traded = exists().where(and_(Transaction.account_id == Portfolio.account_id,
+                                 Transaction.ticker == Portfolio.ticker))
+    stored = {(account, ticker): (shares, cost_basis)
+              for account, ticker, shares, cost_basis in session.execute(
+                  _scoped(select(Portfolio.account_id, Portfolio.ticker, Portfolio.shares_owned,
+                                 Portfolio.total_cost_basis).where(traded), Portfolio, account_id))}
+
+    drift = []
+    for key in sorted(expected.keys() | stored.keys()):
+        shares, cost_basis = expected.get(key, (0, 0.0))
+        stored_shares, stored_cost_basis = stored.get(key, (0, 0.0))
+        if (abs(shares - stored_shares) > SHARES_TOLERANCE
+                or not math.isclose(cost_basis, stored_cost_basis, abs_tol=COST_TOLERANCE)):
+            drift.append({'account_id': key[0], 'ticker': key[1],
+                          'shares_owned': stored_shares, 'total_cost_basis': stored_cost_basis,
+                          'expected_shares': shares, 'expected_cost_basis': cost_basis})
+    return drift
+
+
+def repair(session, drift):
+    # Sets the positions in 'drift' to their expected values; the caller commits
+    for entry in drift:
+        position = (Portfolio.account_id == entry['account_id'], Portfolio.ticker == entry['ticker'])
+        values = {'shares_owned': entry['expected_shares'], 'total_cost_basis': entry['expected_cost_basis']}
+        if entry['expected_shares'] <= SHARES_TOLERANCE:
+            session.execute(delete(Portfolio).where(*position))
+        elif session.execute(update(Portfolio).where(*position).values(**values)
+                             .execution_options(synchronize_session=False)).rowcount == 0:
+            session.execute(insert(Portfolio).values(account_id=entry['account_id'],
+                                                     ticker=entry['ticker'], **values))
+
+
+def _opening_rows(account_id, books):
+    # One opening buy per lot still open, priced so the rows add up to the
+    # position's cost basis, which differs from its lots' under average cost
+    for ticker, book in books.items():
+        if book.shares <= SHARES_TOLERANCE:
+            continue
+        lots_cost = sum(shares * price for shares, price, _ in book.lots)
+        scale = book.cost_basis / lots_cost if lots_cost else 1.0
+        for shares, price, opened_at in book.lots:
+            yield {'account_id': account_id, 'ticker': ticker, 'shares': shares, 'operation': 'buy',
+                   'price': price * scale, 'date': opened_at, 'realized_profit_loss': None,
+                   'opening': True}
+
+
+def compact(session, before, account_id=None):
+    """
+    Moves the transactions dated before 'before' into transaction_archive.
+
+    The trades are replayed through lot books first, and every lot still open
+    at 'before' is written back to the live log as an opening buy dated when
+    the lot was opened. Replaying the log afterwards gives the same lots,
+    positions and realized profit/loss, while it only holds what is needed
+    for that. Opening rows of an earlier compaction are replaced rather than
+    archived. /portfolio/history checkpoints taken before 'before' are
+    dropped, as the replay they start would now see the opening rows.
+    Returns the number of transactions archived and of opening rows written;
+    the caller commits.
+    """
+    rows = session.execute(
+        _scoped(select(Transaction.account_id, Transaction.ticker, Transaction.shares,
+                       Transaction.operation, Transaction.price, Transaction.date)
+                .where(Transaction.date < before)
+                .order_by(Transaction.account_id, Transaction.date, Transaction.id)
+                .execution_options(yield_per=REBUILD_CHUNK_SIZE), Transaction, account_id))
+
+    openings = []
+    current = None
+    books = {}
+    for row in rows:
+        if row.account_id != current:
+            openings.extend(_opening_rows(current, books))
+            current, books = row.account_id, {}
+        book = books.setdefault(row.ticker, LotBook())
+        if row.operation == 'buy':
+            book.buy(row.shares, row.price, row.date)
+        else:
+            book.sell(row.shares)
+    openings.extend(_opening_rows(current, books))
+
+    archived = session.execute(
+        insert(TransactionArchive).from_select(
+            ARCHIVED_COLUMNS + ('archived_at',),
+            _scoped(select(*(getattr(Transaction, c) for c in ARCHIVED_COLUMNS),
+                           literal(datetime.datetime.now()))
+                    .where(Transaction.date < before, Transaction.opening.is_(False)),
+                    Transaction, account_id))).rowcount
+    session.execute(_scoped(delete(Transaction).where(Transaction.date < before), Transaction, account_id)
+                    .execution_options(synchronize_session=False))
+    for start in range(0, len(openings), OPENING_CHUNK_SIZE):
+        session.execute(insert(Transaction.__table__), openings[start:start + OPENING_CHUNK_SIZE])
+    session.execute(_scoped(delete(PortfolioCheckpoint).where(PortfolioCheckpoint.as_of < before),
+                            PortfolioCheckpoint, account_id))
+    return {'archived': archived, 'openings': len(openings)}
+
+
+def _describe(entry):
+    return (f"account {entry['account_id']} {entry['ticker']}: "
+            f"{entry['shares_owned']:g} shares costing {entry['total_cost_basis']:.2f}, "
+            f"expected {entry['expected_shares']:g} costing {entry['expected_cost_basis']:.2f}")
+
+
+@click.command('verify-ledger')
+@click.option('--account', 'account_id', type=int, help="Only check this account.")
+@click.option('--repair', 'fix', is_flag=True, help="Correct the positions that drifted.")
+def verify_ledger_command(account_id, fix):
+    """Compare positions with the transaction log, and optionally repair them."""
+    drift = verify(db.session, account_id)
+    for entry in drift:
+        click.echo(_describe(entry))
+    if fix:
+        repair(db.session, drift)
+        db.session.commit()
+        click.echo(f"Repaired {len(drift)} positions.")
+    elif drift:
+        raise click.ClickException(f"{len(drift)} positions differ from the transaction log.")
+    else:
+        click.echo("Positions match the transaction log.")
+
+
+@click.command('compact-ledger')
+@click.argument('before', type=click.DateTime(formats=['%Y-%m-%d']))
+@click.option('--account', 'account_id', type=int, help="Only compact this account.")
+def compact_ledger_command(before, account_id):
+    """Archive transactions dated before BEFORE, keeping their open lots as opening rows."""
+    result = compact(db.session, before, account_id)
+    db.session.commit()
+    click.echo(f"Archived {result['archived']} transactions and wrote {result['openings']} opening rows.")
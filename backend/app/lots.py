@@ -0,0 +1,262 @@
+import collections
+import datetime
+import click
+from sqlalchemy import and_, delete, exists, insert, select, update
+from config import Config
+from .models import db, Lot, Portfolio, PortfolioCheckpoint, Transaction
+
+FIFO = 'fifo'
+AVERAGE = 'average'
+METHODS = (FIFO, AVERAGE)
+
+# Lots fetched per round trip while a sell walks them
+LOT_FETCH_SIZE = 32
+# Transactions fetched, and realized profit/loss rows written, per round trip
+# by rebuild()
+REBUILD_CHUNK_SIZE = 5000
+# Rounding allowed when rebuild() checks that a sale is covered
+SHARES_TOLERANCE = 1e-9
+
+
+def parse_method(value):
+    value = str(value).lower()
+    if value not in METHODS:
+        raise ValueError(f"Cost basis method must be one of: {', '.join(METHODS)}.")
+    return value
+
+
+# Cost basis method used by sells, from COST_BASIS_METHOD
+method = parse_method(Config.COST_BASIS_METHOD)
+
+
+def init_app(app):
+    global method
+    method = parse_method(app.config['COST_BASIS_METHOD'])
+
+
+def removed_basis(lots_cost, shares, shares_owned, cost_basis):
+    # Cost basis a sale of 'shares' takes from a position of 'shares_owned'
+    # shares costing 'cost_basis', given the cost of the lots it used up
+    if method == AVERAGE:
+        return cost_basis * shares / shares_owned if shares < shares_owned else cost_basis
+    return lots_cost
+
+
+class LotBook:
+    """
+    Open lots of one position kept in memory, oldest first.
+
+    Applies buys and sells the way trading.py applies them to the Lot and
+    Portfolio tables, for replaying the transaction log without the database.
+    """
+
+    __slots__ = ('lots', 'shares', 'cost_basis')
+
+    def __init__(self, lots=(), cost_basis=None):
+        # [shares, price, opened at] per lot
+        self.lots = collections.deque([shares, price, opened_at] for shares, price, opened_at in lots)
+        self.shares = sum(lot[0] for lot in self.lots)
+        self.cost_basis = sum(lot[0] * lot[1] for lot in self.lots) if cost_basis is None else cost_basis
+
+    def buy(self, shares, price, opened_at=None):
+        self.lots.append([shares, price, opened_at])
+        self.shares += shares
+        self.cost_basis += shares * price
+
+    def sell(self, shares):
+        # Takes 'shares' from the oldest lots; returns the cost basis removed
+        lots_cost = 0.0
+        left = shares
+        while left > 0 and self.lots:
+            lot = self.lots[0]
+            taken = min(left, lot[0])
+            lots_cost += taken * lot[1]
+            left -= taken
+            lot[0] -= taken
+            if lot[0] <= 0:
+                self.lots.popleft()
+
+        removed = removed_basis(lots_cost, shares, self.shares, self.cost_basis)
+        self.shares -= shares
+        self.cost_basis -= removed
+        if self.shares <= 0:
+            self.shares, self.cost_basis = 0, 0.0
+            self.lots.clear()
+        return removed
+
+
+# Sells walk the open lots of their position along the (account, ticker,
+# opened_at, id) index and stop at the last lot they need, so a sale costs
+# the lots it touches rather than the position's whole history.
+
+def _oldest_lots(account_id, ticker):
+    return (select(Lot.id, Lot.shares, Lot.price)
+            .where(Lot.account_id == account_id, Lot.ticker == ticker)
+            .order_by(Lot.opened_at, Lot.id)
+            .execution_options(yield_per=LOT_FETCH_SIZE))
+
+
+class _Taking:
+    # Shares taken from lots, oldest first, until a sale is covered
+    def __init__(self, shares):
+        self.left = shares
+        self.cost = 0.0
+        self.emptied = []
+        self.remainder = None
+
+    def take(self, lot_id, shares, price):
+        # Returns True once the sale is covered
+        taken = min(self.left, shares)
+        self.cost += taken * price
+        self.left -= taken
+        if taken < shares:
+            self.remainder = (lot_id, shares - taken)
+        else:
+            self.emptied.append(lot_id)
+        return self.left <= 0
+
+    def statements(self):
+        if self.emptied:
+            yield delete(Lot).where(Lot.id.in_(self.emptied)).execution_options(synchronize_session=False)
+        if self.remainder is not None:
+            lot_id, shares = self.remainder
+            yield (update(Lot).where(Lot.id == lot_id).values(shares=shares)
+                   .execution_options(synchronize_session=False))
+
+
+def open_lot(account_id, ticker, shares, price, opened_at):
+    return insert(Lot).values(account_id=account_id, ticker=ticker, shares=shares, price=price,
+                              opened_at=opened_at)
+
+
+def take_lots(session, account_id, ticker, shares):
+    # Removes 'shares' from the oldest lots of a position; returns their cost
+    taking = _Taking(shares)
+    result = session.execute(_oldest_lots(account_id, ticker))
+    try:
+        for lot_id, lot_shares, price in result:
+            if taking.take(lot_id, lot_shares, price):
+                break
+    finally:
+        result.close()
+    for statement in taking.statements():
+        session.execute(statement)
+    return taking.cost
+
+
+async def take_lots_async(session, account_id, ticker, shares):
+    taking = _Taking(shares)
+    result = await session.stream(_oldest_lots(account_id, ticker))
+    try:
+        async for lot_id, lot_shares, price in result:
+            if taking.take(lot_id, lot_shares, price):
+                break
+    finally:
+        await result.close()
+    for statement in taking.statements():
+        await session.execute(statement)
+    return taking.cost
+
+
+def _save_account(session, account_id, books):
+    # Replaces the lots and positions of the tickers an account traded
+    tickers = list(books)
+    for start in range(0, len(tickers), 500):
+        session.execute(delete(Lot).where(Lot.account_id == account_id,
+                                          Lot.ticker.in_(tickers[start:start + 500])))
+    lots = [{'account_id': account_id, 'ticker': ticker, 'shares': shares, 'price': price,
+             'opened_at': opened_at}
+            for ticker, book in books.items() for shares, price, opened_at in book.lots]
+    if lots:
+        session.execute(insert(Lot), lots)
+
+    for ticker, book in books.items():
+        position = (Portfolio.account_id == account_id, Portfolio.ticker == ticker)
+        if book.shares <= 0:
+            session.execute(delete(Portfolio).where(*position))
+        elif session.execute(update(Portfolio).where(*position)
+                             .values(shares_owned=book.shares, total_cost_basis=book.cost_basis)
+                             .execution_options(synchronize_session=False)).rowcount == 0:
+            session.execute(insert(Portfolio).values(account_id=account_id, ticker=ticker,
+                                                     shares_owned=book.shares,
+                                                     total_cost_basis=book.cost_basis))
+
+
+def _lots_for_untraded_positions(session, account_id=None):
+    # Positions without any transactions get one lot at their average cost
+    query = (select(Portfolio.account_id, Portfolio.ticker, Portfolio.shares_owned, Portfolio.total_cost_basis)
+             .where(~exists().where(and_(Transaction.account_id == Portfolio.account_id,
+                                         Transaction.ticker == Portfolio.ticker))))
+    if account_id is not None:
+        query = query.where(Portfolio.account_id == account_id)
+    untraded = session.execute(query).all()
+    now = datetime.datetime.now()
+    for account_id, ticker, shares, cost_basis in untraded:
+        session.execute(delete(Lot).where(Lot.account_id == account_id, Lot.ticker == ticker))
+        if shares > 0:
+            session.execute(open_lot(account_id, ticker, shares, cost_basis / shares, now))
+
+
+def rebuild(session, account_id=None, strict=False):
+    """
+    Rebuilds lots, positions and realized profit/loss from the transaction log.
+
+    Streams every transaction once in (account, date, id) order, replaying
+    each account's trades through in-memory lot books with the configured
+    cost basis method, and writes the realized profit/loss of every sale in
+    chunks. Only one account's books are held in memory at a time. Stored
+    /portfolio/history checkpoints are dropped, to be retaken. With an
+    'account_id' only that account is rebuilt. With 'strict', a sale of more
+    shares than the position holds raises ValueError instead of closing it.
+    Returns the number of transactions replayed; the caller commits.
+    """
+    checkpoints = delete(PortfolioCheckpoint)
+    query = (select(Transaction.id, Transaction.account_id, Transaction.ticker, Transaction.shares,
+                    Transaction.operation, Transaction.price, Transaction.date)
+             .order_by(Transaction.account_id, Transaction.date, Transaction.id)
+             .execution_options(yield_per=REBUILD_CHUNK_SIZE))
+    if account_id is not None:
+        checkpoints = checkpoints.where(PortfolioCheckpoint.account_id == account_id)
+        query = query.where(Transaction.account_id == account_id)
+    session.execute(checkpoints)
+    rows = session.execute(query)
+
+    replayed = 0
+    current = None
+    books = {}
+    realized = []
+    for row in rows:
+        if row.account_id != current:
+            if current is not None:
+                _save_account(session, current, books)
+            current, books = row.account_id, {}
+
+        book = books.setdefault(row.ticker, LotBook())
+        if row.operation == 'buy':
+            book.buy(row.shares, row.price, row.date)
+        else:
+            if strict and row.shares > book.shares + SHARES_TOLERANCE:
+                raise ValueError(f"Selling {row.shares:g} {row.ticker} on {row.date.isoformat()} "
+                                 f"exceeds the {book.shares:g} shares owned then.")
+            removed = book.sell(row.shares)
+            realized.append({'id': row.id, 'realized_profit_loss': row.shares * row.price - removed})
+
+        if len(realized) >= REBUILD_CHUNK_SIZE:
+            session.execute(update(Transaction), realized)
+            realized = []
+        replayed += 1
+
+    if current is not None:
+        _save_account(session, current, books)
+    if realized:
+        session.execute(update(Transaction), realized)
+    _lots_for_untraded_positions(session, account_id)
+    return replayed
+
+
+@click.command('rebuild-lots')
+def rebuild_lots_command():
+    """Rebuild lots, positions and realized profit/loss from the transaction log."""
+    replayed = rebuild(db.session)
+    db.session.commit()
+    click.echo(f"Replayed {replayed} transactions with the {method} cost basis method.")
@@ -0,0 +1,289 @@
+import bisect
+import threading
+import time
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Bucket upper bounds in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram:
+    # Bucket counts are allocated up front, so observing only bumps numbers
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield f"{name}_bucket", labels + (('le', _format_bound(bound)),), cumulative
+        yield f"{name}_sum", labels, total
+        yield f"{name}_count", labels, cumulative
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+class Family:
+    """
+    A metric with one child per combination of label values.
+
+    Children are kept in nested dicts keyed by each label value in turn and
+    created on first use, so repeat lookups are plain dict hits.
+    """
+
+    def __init__(self, name, help, kind, label_names, factory):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = label_names
+        self._factory = factory
+        self._children = {} if label_names else factory()
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        if not self.label_names:
+            return self._children
+        node = self._children
+        for value in values[:-1]:
+            child = node.get(value)
+            if child is None:
+                with self._lock:
+                    child = node.setdefault(value, {})
+            node = child
+        child = node.get(values[-1])
+        if child is None:
+            with self._lock:
+                child = node.setdefault(values[-1], self._factory())
+        return child
+
+    def _leaves(self, node, values):
+        if len(values) == len(self.label_names):
+            yield values, node
+            return
+        for value, child in list(node.items()):
+            yield from self._leaves(child, values + (value,))
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in self._leaves(self._children, ()):
+            for name, labels, value in child.samples(self.name, tuple(zip(self.label_names, values))):
+                yield f"{name}{_format_labels(labels)} {value}"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def counter(self, name, help, label_names=()):
+        return self._add(Family(name, help, 'counter', label_names, Counter))
+
+    def histogram(self, name, help, label_names=(), buckets=REQUEST_BUCKETS):
+        return self._add(Family(name, help, 'histogram', label_names, lambda: Histogram(buckets)))
+
+    def _add(self, family):
+        self._families.append(family)
+        return family
+
+    def collector(self, function):
+        # 'function' returns [(name, type, help, value)] when metrics are scraped
+        self._collectors.append(function)
+        return function
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        for collect in self._collectors:
+            for name, kind, help, value in collect():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds', "Time to handle a request, by route.", ('route', 'method'))
+REQUESTS = registry.counter(
+    'http_requests_total', "Requests handled, by route and status code.", ('route', 'method', 'status'))
+QUOTE_DURATION = registry.histogram(
+    'quote_upstream_duration_seconds', "Time spent in quote provider calls.")
+QUOTE_ERRORS = registry.counter(
+    'quote_upstream_errors_total', "Quote provider calls that failed.")
+QUERY_DURATION = registry.histogram(
+    'db_query_duration_seconds', "Time spent executing SQL statements, by statement type.",
+    ('statement',), QUERY_BUCKETS)
+POOL_WAIT = registry.histogram(
+    'db_pool_wait_seconds', "Time to check a connection out of the pool, by engine.",
+    ('engine',), QUERY_BUCKETS)
+POOL_CHECKOUTS = registry.counter(
+    'db_pool_checkouts_total', "Connections checked out of the pool, by engine.", ('engine',))
+POOL_TIMEOUTS = registry.counter(
+    'db_pool_timeouts_total', "Checkouts that gave up waiting for a free connection, by engine.", ('engine',))
+
+
+@registry.collector
+def _quote_cache_metrics():
+    from .services import quote_cache
+    stats = quote_cache.stats()
+    return [
+        ('quote_cache_hits_total', 'counter', "Quote lookups served from the cache.", stats['hits']),
+        ('quote_cache_misses_total', 'counter', "Quote lookups of symbols not in the cache.", stats['misses']),
+        ('quote_cache_stale_total', 'counter', "Quote lookups of expired cache entries.", stats['stale']),
+        ('quote_cache_size', 'gauge', "Symbols in the quote cache.", stats['size']),
+        ('quote_cache_hit_ratio', 'gauge', "Share of quote lookups served from the cache.", stats['hit_ratio']),
+    ]
+
+
+def observe_quote_call(started, failed):
+    # Records a provider call that began at perf_counter() 'started'
+    QUOTE_DURATION.labels().observe(time.perf_counter() - started)
+    if failed:
+        QUOTE_ERRORS.labels().inc()
+
+
+def observe_pool_checkout(engine, started, timed_out):
+    # Records a checkout from the pool of 'engine' that began at 'started'
+    POOL_WAIT.labels(engine).observe(time.perf_counter() - started)
+    if timed_out:
+        POOL_TIMEOUTS.labels(engine).inc()
+    else:
+        POOL_CHECKOUTS.labels(engine).inc()
+
+
+# Statement types tracked by db_query_duration_seconds
+_STATEMENT_TYPES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def _statement_type(statement):
+    for kind in _STATEMENT_TYPES:
+        if statement.startswith(kind):
+            return kind
+    return 'OTHER'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None:
+        QUERY_DURATION.labels(_statement_type(statement)).observe(time.perf_counter() - started)
+
+
+def _listen_to_queries():
+    # Every engine, including the one behind the async app, reports here
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _route():
+    # The URL rule rather than the path, so ids don't create new series
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _start():
+    g.metrics_started = time.perf_counter()
+
+
+def _finish(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        route = _route()
+        REQUEST_DURATION.labels(route, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(route, request.method, response.status_code).inc()
+    return response
+
+
+def init_app(app):
+    """
+    Instruments a Flask app and serves the metrics at /metrics.
+
+    Does nothing unless METRICS_ENABLED is set.
+    """
+    if not app.config['METRICS_ENABLED']:
+        return
+    _listen_to_queries()
+    app.before_request(_start)
+    app.after_request(_finish)
+
+    def metrics():
+        return registry.render(), 200, {'Content-Type': CONTENT_TYPE}
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+
+def init_async_app(app):
+    # init_app for the Quart app, whose request hooks are coroutines
+    from quart import g as async_g, request as async_request
+
+    if not app.config['METRICS_ENABLED']:
+        return
+    _listen_to_queries()
+
+    @app.before_request
+    async def start():
+        async_g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    async def finish(response):
+        started = async_g.get('metrics_started')
+        if started is not None:
+            rule = async_request.url_rule
+            route = rule.rule if rule is not None else 'unmatched'
+            REQUEST_DURATION.labels(route, async_request.method).observe(time.perf_counter() - started)
+            REQUESTS.labels(route, async_request.method, response.status_code).inc()
+        return response
+
+    @app.route('/metrics')
+    async def metrics():
+        return registry.render(), 200, {'Content-Type': CONTENT_TYPE}
@@ -0,0 +1,151 @@
+import datetime
+import click
+from flask import current_app
+from sqlalchemy import func, inspect, insert, select, text, update, delete
+from .models import db, SchemaVersion, Account, Transaction, Portfolio, QueuedOrder, PriceAlert
+from .lots import rebuild
+
+# Ordered schema changes as (version, description, function). Each one is
+# applied once per database and must also be safe to run against tables that
+# db.create_all() has just created in their current form.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return function
+    return register
+
+
+def upgrade():
+    # Create missing tables, then apply every migration the database hasn't seen
+    db.create_all()
+    applied = set(db.session.execute(select(SchemaVersion.version)).scalars())
+
+    for version, description, function in MIGRATIONS:
+        if version in applied:
+            continue
+        function()
+        db.session.add(SchemaVersion(version=version, description=description,
+                                     applied_at=datetime.datetime.now()))
+        db.session.commit()
+
+
+def _create_indexes(model):
+    # create_all skips indexes added to tables that already exist
+    for index in model.__table__.indexes:
+        index.create(db.session.connection(), checkfirst=True)
+
+
+def _create_index(name, model, *columns, unique=False):
+    # An index of an earlier schema version, which is no longer on the model
+    db.session.execute(text(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} '
+        f'ON "{model.__tablename__}" ({", ".join(columns)})'))
+
+
+def _drop_index(name):
+    db.session.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+
+def _has_column(model, column):
+    columns = inspect(db.session.connection()).get_columns(model.__tablename__)
+    return any(c['name'] == column for c in columns)
+
+
+@migration(1, "Keyset pagination indexes on transaction")
+def add_transaction_indexes():
+    _create_index('ix_transaction_date_id', Transaction, 'date', 'id')
+    _create_index('ix_transaction_ticker_date_id', Transaction, 'ticker', 'date', 'id')
+    _create_index('ix_transaction_operation_date_id', Transaction, 'operation', 'date', 'id')
+
+
+@migration(2, "Upper-case tickers and unique portfolio ticker")
+def normalize_tickers():
+    if _has_column(Portfolio, 'account_id'):
+        # Tables created in their current form, whose tickers the models
+        # already upper-case and whose positions are unique per account
+        return
+
+    for model in (Transaction, Portfolio):
+        db.session.execute(
+            update(model)
+            .where(model.ticker != func.upper(model.ticker))
+            .values(ticker=func.upper(model.ticker)))
+
+    # Positions that only differed by case are merged into the oldest row
+    duplicates = db.session.execute(
+        select(Portfolio.ticker).group_by(Portfolio.ticker).having(func.count() > 1)).scalars().all()
+    for ticker in duplicates:
+        keep_id, shares_owned, total_cost_basis = db.session.execute(
+            select(func.min(Portfolio.id), func.sum(Portfolio.shares_owned),
+                   func.sum(Portfolio.total_cost_basis))
+            .where(Portfolio.ticker == ticker)).one()
+        db.session.execute(
+            delete(Portfolio).where(Portfolio.ticker == ticker, Portfolio.id != keep_id))
+        db.session.execute(
+            update(Portfolio).where(Portfolio.id == keep_id)
+            .values(shares_owned=shares_owned, total_cost_basis=total_cost_basis))
+
+    _create_index('ix_portfolio_ticker', Portfolio, 'ticker', unique=True)
+
+
+@migration(3, "Accounts, with existing positions and history in the default account")
+def add_accounts():
+    default_id = current_app.config['DEFAULT_ACCOUNT_ID']
+    if db.session.get(Account, default_id) is None:
+        db.session.execute(insert(Account).values(id=default_id, name='default',
+                                                  created_at=datetime.datetime.now()))
+
+    for model in (Portfolio, Transaction):
+        if not _has_column(model, 'account_id'):
+            db.session.execute(text(
+                f'ALTER TABLE "{model.__tablename__}" ADD COLUMN account_id INTEGER NOT NULL '
+                f'DEFAULT {int(default_id)} REFERENCES account (id)'))
+
+    # Indexes are now led by the account, so one account's positions and
+    # history are found without scanning everyone else's
+    for name in ('ix_portfolio_ticker', 'ix_transaction_date_id', 'ix_transaction_ticker_date_id',
+                 'ix_transaction_operation_date_id'):
+        _drop_index(name)
+    _create_indexes(Portfolio)
+    _create_indexes(Transaction)
+
+
+@migration(4, "Lots and realized profit/loss, rebuilt from the transaction log")
+def add_lots():
+    if not _has_column(Transaction, 'realized_profit_loss'):
+        db.session.execute(text('ALTER TABLE "transaction" ADD COLUMN realized_profit_loss FLOAT'))
+    # Cost bases so far were reduced by the sale value instead of the cost of
+    # the shares sold, so positions are redone from the log
+    rebuild(db.session)
+
+
+@migration(5, "Opening-balance flag on transaction, for ledger compaction")
+def add_opening_transactions():
+    # The transaction_archive table itself is created by db.create_all()
+    if not _has_column(Transaction, 'opening'):
+        db.session.execute(text('ALTER TABLE "transaction" ADD COLUMN opening BOOLEAN NOT NULL DEFAULT FALSE'))
+
+
+
+@migration(6, "Index of queued orders by account, for portfolio snapshots")
+def add_queued_order_account_index():
+    # The queued_order table itself is created by db.create_all()
+    _create_indexes(QueuedOrder)
+
+
+
+@migration(7, "Index of triggered price alerts by account, for pushing them from every worker")
+def add_price_alert_trigger_index():
+    # The price_alert table itself is created by db.create_all()
+    _create_indexes(PriceAlert)
+
+
+@click.command('db-upgrade')
+def upgrade_command():
+    """Create missing tables and apply pending schema migrations."""
+    upgrade()
+    click.echo(f"Database is at schema version {MIGRATIONS[-1][0]}.")
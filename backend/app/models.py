@@ -1,24 +1,241 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 import datetime
 
 db = SQLAlchemy()
 
+class Account(db.Model):
+    # Owner of a portfolio and its transaction history
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.datetime.now())
+
+    def __repr__(self):
+        return f"<Account {self.id} {self.name}>"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
 class Transaction(db.Model):
+    # Composite indexes backing the newest-first keyset pages of /transactions,
+    # led by the account so every page only touches that account's history
+    __table_args__ = (
+        db.Index('ix_transaction_account_date_id', 'account_id', 'date', 'id'),
+        db.Index('ix_transaction_account_ticker_date_id', 'account_id', 'ticker', 'date', 'id'),
+        db.Index('ix_transaction_account_operation_date_id', 'account_id', 'operation', 'date', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
     ticker = db.Column(db.String(10), nullable=False)
     shares = db.Column(db.Integer, nullable=False)
     operation = db.Column(db.String(4), nullable=False)  # buy or sell
     price = db.Column(db.Float, nullable=False)
     date = db.Column(db.DateTime, default=lambda: datetime.datetime.now())  # Use lambda to get current time
+    # Sale proceeds less the cost basis of the shares sold; None for buys
+    realized_profit_loss = db.Column(db.Float)
+    # Buy standing in for a lot still open when older history was compacted
+    # into transaction_archive
+    opening = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    @validates('ticker')
+    def normalize_ticker(self, key, ticker):
+        # Tickers are stored upper-case so lookups are plain indexed equality
+        return ticker.upper()
 
     def __repr__(self):
         return f"<Transaction {self.ticker} {self.operation} {self.shares}>"
 
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'ticker': self.ticker,
+            'shares': self.shares,
+            'operation': self.operation,
+            'price': self.price,
+            'date': self.date.strftime('%Y-%m-%d %H:%M:%S'),
+            'realized_profit_loss': self.realized_profit_loss
+        }
+
+class TransactionArchive(db.Model):
+    # Transactions moved out of the live log by ledger compaction, kept with
+    # their original ids for auditing
+    __table_args__ = (
+        db.Index('ix_transaction_archive_account_date_id', 'account_id', 'date', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    ticker = db.Column(db.String(10), nullable=False)
+    shares = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(4), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    date = db.Column(db.DateTime)
+    realized_profit_loss = db.Column(db.Float)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<TransactionArchive {self.ticker} {self.operation} {self.shares}>"
+
 class Portfolio(db.Model):
+    # One position per ticker and account; also serves the per-account scans
+    __table_args__ = (
+        db.Index('ux_portfolio_account_ticker', 'account_id', 'ticker', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
     ticker = db.Column(db.String(10), nullable=False)
     total_cost_basis = db.Column(db.Float, nullable=False)
     shares_owned = db.Column(db.Integer, nullable=False)
 
+    @validates('ticker')
+    def normalize_ticker(self, key, ticker):
+        return ticker.upper()
+
     def __repr__(self):
         return f"<Portfolio {self.ticker} {self.shares_owned}>"
+
+
+class Lot(db.Model):
+    # Shares of a position still held from one buy, consumed oldest first by
+    # sells along the index
+    __table_args__ = (
+        db.Index('ix_lot_account_ticker_opened_id', 'account_id', 'ticker', 'opened_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    ticker = db.Column(db.String(10), nullable=False)
+    shares = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    opened_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<Lot {self.ticker} {self.shares} @ {self.price}>"
+
+
+class PortfolioCheckpoint(db.Model):
+    # Positions of an account at the start of 'as_of' (a midnight), so the
+    # history of /portfolio/history is replayed from the nearest one
+    __table_args__ = (
+        db.Index('ux_portfolio_checkpoint_account_as_of', 'account_id', 'as_of', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)
+    # JSON of ticker -> open lots, cost basis, last trade price and time
+    positions = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f"<PortfolioCheckpoint {self.account_id} {self.as_of}>"
+
+
+class QueuedOrder(db.Model):
+    # Buy or sell accepted while the order queue is on, applied later by the
+    # order writer (see orders.py); pending ones are drained in id order
+    __table_args__ = (
+        db.Index('ix_queued_order_status_id', 'status', 'id'),
+        db.Index('ix_queued_order_account_status_id', 'account_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    ticker = db.Column(db.String(10), nullable=False)
+    shares = db.Column(db.Float, nullable=False)
+    operation = db.Column(db.String(4), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, executed or failed
+    error = db.Column(db.String(200))
+    realized_profit_loss = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.datetime.now())
+    executed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<QueuedOrder {self.id} {self.status}>"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'ticker': self.ticker,
+            'shares': self.shares,
+            'operation': self.operation,
+            'price': self.price,
+            'status': self.status,
+            'error': self.error,
+            'realized_profit_loss': self.realized_profit_loss,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'executed_at': self.executed_at.strftime('%Y-%m-%d %H:%M:%S') if self.executed_at else None
+        }
+
+
+class WatchlistItem(db.Model):
+    # Ticker an account follows without owning it; refreshed by the quote streamer
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'ticker', name='uq_watchlist_item_account_ticker'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    ticker = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.datetime.now())
+
+    def __repr__(self):
+        return f"<WatchlistItem {self.account_id} {self.ticker}>"
+
+    def to_dict(self):
+        return {
+            'ticker': self.ticker,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+
+class PriceAlert(db.Model):
+    # Fires once when the price of 'ticker' reaches 'price' from below
+    # ('above') or from above ('below'); active ones are indexed in memory by
+    # alerts.py and loaded in id order
+    __table_args__ = (
+        db.Index('ix_price_alert_status_id', 'status', 'id'),
+        db.Index('ix_price_alert_account_id', 'account_id', 'id'),
+        db.Index('ix_price_alert_account_status_triggered_at', 'account_id', 'status', 'triggered_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    ticker = db.Column(db.String(10), nullable=False)
+    direction = db.Column(db.String(5), nullable=False)  # above or below
+    price = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='active')  # active or triggered
+    triggered_price = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.datetime.now())
+    triggered_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<PriceAlert {self.id} {self.ticker} {self.direction} {self.price}>"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'ticker': self.ticker,
+            'direction': self.direction,
+            'price': self.price,
+            'status': self.status,
+            'triggered_price': self.triggered_price,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'triggered_at': self.triggered_at.strftime('%Y-%m-%d %H:%M:%S') if self.triggered_at else None
+        }
+
+
+class SchemaVersion(db.Model):
+    # Migrations from app/migrations.py applied to this database
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<SchemaVersion {self.version}>"
@@ -0,0 +1,255 @@
+import datetime
+import logging
+import os
+import threading
+import time
+import click
+from sqlalchemy import event, insert, select, update
+from .models import db, QueuedOrder
+from .trading import MAX_ATTEMPTS, apply_order_batch, is_retryable, retry_delay
+from .valuation import valuation_engine
+
+try:
+    import fcntl
+except ImportError:  # Windows: every writer drains, the claim keeps them apart
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+EXECUTED = 'executed'
+FAILED = 'failed'
+
+
+SYNCHRONOUS_MODES = ('FULL', 'NORMAL')
+
+
+def _use_wal(synchronous):
+    # Connect listener putting SQLite in WAL mode, so readers don't block the
+    # writer. FULL syncs every commit to disk; NORMAL only at checkpoints,
+    # so a power loss can undo the last commits, but never corrupts the database
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.close()
+    return connect
+
+
+class OrderWriter:
+    """
+    Applies queued orders from a single writer with group commit.
+
+    Trade requests only insert their priced order, which is one short write,
+    instead of each running its own read-modify-write transaction. The writer
+    takes up to 'batch_size' pending orders at a time, applies them with the
+    same guarded statements as /transactions/batch in best-effort mode, and
+    commits them together with their outcome, so SQLite pays one commit and
+    one lock hand-off per batch rather than per order. A batch failing with
+    an error that retrying won't fix is applied again one order per commit,
+    so only the order causing it is marked failed. Across processes, only
+    the worker holding the lock file runs the loop; the others take over if
+    it exits.
+    """
+
+    def __init__(self, batch_size=500, poll_interval=0.05):
+        self.enabled = False
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._app = None
+        self._lock_path = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self.stop()
+        self._app = app
+        self.enabled = app.config['ORDER_QUEUE_ENABLED']
+        self.batch_size = app.config['ORDER_QUEUE_BATCH_SIZE']
+        self.poll_interval = app.config['ORDER_QUEUE_POLL_INTERVAL']
+        self._lock_path = app.config['ORDER_QUEUE_LOCK_PATH']
+        if not self.enabled:
+            return
+        synchronous = app.config['ORDER_QUEUE_SQLITE_SYNCHRONOUS'].upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"ORDER_QUEUE_SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}.")
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        if uri.startswith('sqlite:') and uri != 'sqlite:///:memory:':
+            with app.app_context():
+                event.listen(db.engine, 'connect', _use_wal(synchronous))
+                # Connections opened so far, such as by the migrations, are
+                # reopened with it
+                db.engine.dispose()
+        if app.config['ORDER_QUEUE_WRITER']:
+            self.start()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='order-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self._thread = None
+
+    def enqueue(self, account_id, ticker, shares, operation, price):
+        # Stores a priced order; returns its id
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                order_id = db.session.execute(
+                    insert(QueuedOrder).values(account_id=account_id, ticker=ticker.upper(), shares=shares,
+                                               operation=operation, price=price, status=PENDING)
+                ).inserted_primary_key[0]
+                db.session.commit()
+                return order_id
+            except Exception as e:
+                db.session.rollback()
+                if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+            time.sleep(retry_delay(attempt))
+
+    def drain(self):
+        # Applies one batch of pending orders; returns how many were taken.
+        # Needs an app context
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return self._apply_batch(db.session)
+            except Exception as e:
+                db.session.rollback()
+                if not is_retryable(e):
+                    logger.warning("Queued order batch failed, applying its orders one at a time: %s", e)
+                    return self._apply_singly(db.session)
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+            time.sleep(retry_delay(attempt))
+
+    def _apply_singly(self, session):
+        # Applies the next batch one order per commit, marking an order that
+        # fails on its own as failed instead of retrying it forever
+        ids = session.execute(select(QueuedOrder.id)
+                              .where(QueuedOrder.status == PENDING)
+                              .order_by(QueuedOrder.id)
+                              .limit(self.batch_size)).scalars().all()
+        session.rollback()
+        for order_id in ids:
+            try:
+                self._apply_batch(session, order_id)
+            except Exception as e:
+                session.rollback()
+                if is_retryable(e):
+                    raise
+                logger.exception("Queued order %s failed", order_id)
+                session.execute(update(QueuedOrder)
+                                .where(QueuedOrder.id == order_id, QueuedOrder.status == PENDING)
+                                .values(status=FAILED, error=str(e)[:200], executed_at=datetime.datetime.now())
+                                .execution_options(synchronize_session=False))
+                session.commit()
+        return len(ids)
+
+    def _apply_batch(self, session, order_id=None):
+        # Applies the next batch of pending orders, or only 'order_id'
+        query = (select(QueuedOrder.id, QueuedOrder.account_id, QueuedOrder.ticker, QueuedOrder.shares,
+                        QueuedOrder.operation, QueuedOrder.price)
+                 .where(QueuedOrder.status == PENDING)
+                 .order_by(QueuedOrder.id)
+                 .limit(self.batch_size))
+        if order_id is not None:
+            query = query.where(QueuedOrder.id == order_id)
+        pending = session.execute(query).all()
+        if not pending:
+            session.rollback()
+            return 0
+
+        # Claimed first, so a second writer racing for the same orders finds
+        # fewer of them pending and backs off instead of applying them twice
+        ids = [row.id for row in pending]
+        claimed = session.execute(update(QueuedOrder)
+                                  .where(QueuedOrder.id.in_(ids), QueuedOrder.status == PENDING)
+                                  .values(status=EXECUTED)
+                                  .execution_options(synchronize_session=False)).rowcount
+        if claimed != len(ids):
+            session.rollback()
+            return 0
+
+        orders = [{'id': row.id, 'account_id': row.account_id, 'ticker': row.ticker, 'shares': row.shares,
+                   'operation': row.operation, 'price': row.price} for row in pending]
+        rejected = apply_order_batch(session, orders)
+
+        now = datetime.datetime.now()
+        outcomes = []
+        for index, order in enumerate(orders):
+            error = rejected.get(index)
+            realized = None
+            if error is None and order['operation'] == 'sell':
+                realized = order['shares'] * order['price'] - order['cost']
+            outcomes.append({'id': order['id'], 'status': FAILED if error else EXECUTED,
+                             'error': error, 'realized_profit_loss': realized, 'executed_at': now})
+        session.execute(update(QueuedOrder), outcomes)
+        session.commit()
+
+        for index, order in enumerate(orders):
+            if index not in rejected:
+                valuation_engine.record_trade(order['account_id'], order['ticker'], order['shares'],
+                                              order['operation'], order['price'], order['cost'],
+                                              order['id'])
+        return len(pending)
+
+    def _acquire_lock(self):
+        # Open lock file held while this process is the writer, or None
+        if fcntl is None:
+            return open(os.devnull)
+        os.makedirs(os.path.dirname(self._lock_path) or '.', exist_ok=True)
+        lock_file = open(self._lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except OSError:
+            lock_file.close()
+            return None
+
+    def run(self):
+        # Writer loop; returns when stopped
+        lock_file = None
+        try:
+            while not self._stop.is_set():
+                if lock_file is None:
+                    lock_file = self._acquire_lock()
+                    if lock_file is None:
+                        # Another process is the writer; check that it still is
+                        self._stop.wait(1)
+                        continue
+
+                try:
+                    with self._app.app_context():
+                        taken = self.drain()
+                except Exception:
+                    logger.exception("Applying queued orders failed")
+                    taken = 0
+                if taken < self.batch_size:
+                    # Lets orders gather into the next batch instead of
+                    # committing each one as it arrives
+                    self._stop.wait(self.poll_interval)
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+
+order_writer = OrderWriter()
+
+
+@click.command('order-writer')
+def order_writer_command():
+    """Apply queued orders until interrupted."""
+    # Runs in the foreground in place of a writer thread started by create_app
+    order_writer.stop()
+    order_writer._stop.clear()
+    click.echo(f"Applying queued orders, up to {order_writer.batch_size} per commit.")
+    try:
+        order_writer.run()
+    except KeyboardInterrupt:
+        pass
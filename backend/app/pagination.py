@@ -0,0 +1,80 @@
+import base64
+import datetime
+from sqlalchemy import select, tuple_
+from .models import Transaction
+
+
+def encode_cursor(transaction):
+    # Opaque cursor pointing just past 'transaction' in (date, id) order
+    raw = f"{transaction.date.isoformat()}|{transaction.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date, transaction_id = raw.rsplit('|', 1)
+        return datetime.datetime.fromisoformat(date), int(transaction_id)
+    except ValueError:
+        raise ValueError("Invalid cursor.")
+
+
+def parse_date(value, end=False):
+    # Accepts a date or date-time; a bare end date includes that whole day
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}'.")
+    if end and len(value) == 10:
+        parsed += datetime.timedelta(days=1)
+    return parsed
+
+
+def transactions_query(account_id, args, default_limit=None):
+    """
+    Build the newest-first transactions query of an account from request arguments.
+
+    Pages are selected with a keyset cursor on (date, id) rather than an offset,
+    so every page is a range scan on the account-led composite indexes of
+    Transaction no matter how much history exists. Without a 'limit' argument
+    pages hold 'default_limit' transactions (all of them when None). Raises
+    ValueError for invalid arguments.
+    """
+    query = (select(Transaction)
+             .where(Transaction.account_id == account_id)
+             .order_by(Transaction.date.desc(), Transaction.id.desc()))
+
+    ticker = args.get('ticker')
+    if ticker:
+        query = query.where(Transaction.ticker == ticker.upper())
+
+    operation = args.get('operation')
+    if operation:
+        if operation.lower() not in ('buy', 'sell'):
+            raise ValueError("Operation must be 'buy' or 'sell'.")
+        query = query.where(Transaction.operation == operation.lower())
+
+    if args.get('start'):
+        query = query.where(Transaction.date >= parse_date(args['start']))
+    if args.get('end'):
+        query = query.where(Transaction.date < parse_date(args['end'], end=True))
+
+    if args.get('cursor'):
+        query = query.where(tuple_(Transaction.date, Transaction.id) < decode_cursor(args['cursor']))
+
+    limit = args.get('limit', default_limit, type=int)
+    if limit is not None:
+        if limit <= 0:
+            raise ValueError("Limit must be a positive number.")
+        # One extra row tells whether there is a next page
+        query = query.limit(limit + 1)
+
+    return query, limit
+
+
+def paginate(transactions, limit):
+    # Split the fetched rows into the page and the cursor for the next one
+    if limit is None or len(transactions) <= limit:
+        return transactions, None
+    page = transactions[:limit]
+    return page, encode_cursor(page[-1])
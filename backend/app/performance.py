@@ -0,0 +1,206 @@
+import datetime
+import json
+from sqlalchemy import func, select, union_all
+from .models import Transaction, TransactionArchive, PortfolioCheckpoint
+from .history import price_history
+from .lots import LotBook
+from .pagination import parse_date
+
+# Transactions fetched per round trip while replaying
+FETCH_SIZE = 1000
+
+
+def _midnight(day):
+    return datetime.datetime.combine(day, datetime.time())
+
+
+def _millis(moment):
+    return int(moment.timestamp() * 1000)
+
+
+class Positions:
+    """
+    Open positions of an account while its transactions are replayed.
+
+    Trades go through the same lot accounting as trading.py, so the positions
+    replayed up to now match the stored ones. Each position also keeps its
+    last trade price, which values it when no quote was recorded.
+    """
+
+    def __init__(self, positions=None):
+        # ticker -> [LotBook, last trade price, last trade time in epoch ms]
+        self.positions = positions or {}
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        return cls({ticker: [LotBook([(shares, price, None) for shares, price in p['lots']], p['cost_basis']),
+                             p['price'], p['traded_at']]
+                    for ticker, p in json.loads(checkpoint.positions).items()})
+
+    def to_json(self):
+        return json.dumps({ticker: {'lots': [lot[:2] for lot in book.lots], 'cost_basis': book.cost_basis,
+                                    'price': price, 'traded_at': traded_at}
+                           for ticker, (book, price, traded_at) in self.positions.items()})
+
+    def apply(self, ticker, shares, operation, price, date):
+        position = self.positions.setdefault(ticker, [LotBook(), price, 0])
+        if operation == 'buy':
+            position[0].buy(shares, price)
+        else:
+            position[0].sell(shares)
+        position[1:] = [price, _millis(date)]
+        if position[0].shares <= 0:
+            del self.positions[ticker]
+
+    def items(self):
+        # (ticker, (shares, cost basis, last trade price, last trade time))
+        for ticker, (book, price, traded_at) in self.positions.items():
+            yield ticker, (book.shares, book.cost_basis, price, traded_at)
+
+
+def _transactions(session, account_id, since, until):
+    # Transactions of the account dated since <= date < until in replay order,
+    # streamed in chunks along the (account, date, id) index
+    query = (select(Transaction.ticker, Transaction.shares, Transaction.operation,
+                    Transaction.price, Transaction.date)
+             .where(Transaction.account_id == account_id, Transaction.date < until)
+             .order_by(Transaction.date, Transaction.id)
+             .execution_options(yield_per=FETCH_SIZE))
+    if since is not None:
+        query = query.where(Transaction.date >= since)
+    yield from session.execute(query)
+
+
+def _checkpointed(rows, positions, account_id, every, until, existing, created):
+    # Passes 'rows' through, adding a checkpoint of 'positions' to 'created'
+    # at the start of a day once 'every' transactions were replayed since the
+    # last one. Relies on the next stage applying each row to 'positions'
+    # before pulling the following one.
+    replayed = 0
+    day = None
+    for row in rows:
+        if row.date.date() != day:
+            day = row.date.date()
+            as_of = _midnight(day)
+            if as_of in existing:
+                replayed = 0
+            elif replayed >= every and as_of <= until:
+                created.append(PortfolioCheckpoint(account_id=account_id, as_of=as_of,
+                                                   positions=positions.to_json()))
+                replayed = 0
+        replayed += 1
+        yield row
+
+
+def _day_ends(rows, positions, ends):
+    # Applies 'rows' to 'positions', yielding (day, positions) at each of 'ends'
+    rows = iter(rows)
+    row = next(rows, None)
+    for day, end in enumerate(ends):
+        while row is not None and row.date < end:
+            positions.apply(row.ticker, row.shares, row.operation, row.price, row.date)
+            row = next(rows, None)
+        yield day, positions
+
+
+def _points(day_ends, ends):
+    # Values the positions at the end of each day at the last recorded quote,
+    # or the last trade price when that is more recent
+    ends_ms = [_millis(end) for end in ends]
+    quotes = {}
+    for day, positions in day_ends:
+        market_value = cost_basis = 0.0
+        for ticker, (shares, basis, price, traded_at) in positions.items():
+            if ticker not in quotes:
+                quotes[ticker] = price_history.prices_at(ticker, ends_ms)
+            quoted_at, quoted = quotes[ticker]
+            if quoted_at[day] > traded_at:
+                price = float(quoted[day])
+            market_value += shares * price
+            cost_basis += basis
+
+        yield {
+            'date': (ends[day] - datetime.timedelta(days=1)).date().isoformat(),
+            'market_value': market_value,
+            'cost_basis': cost_basis,
+            'profit_loss': market_value - cost_basis
+        }
+
+
+def equity_curve(session, account_id, first_day, last_day, checkpoint_every):
+    """
+    Daily market value, cost basis and profit/loss of an account.
+
+    Replays the account's transactions from the nearest checkpoint at or
+    before 'first_day' through 'last_day' (both dates, inclusive) in one
+    streaming pass. Checkpoints are added to 'session' every
+    'checkpoint_every' transactions, for the caller to commit. They are only
+    taken at midnights at least a day old, which no transaction still being
+    committed can precede.
+    """
+    start = _midnight(first_day)
+    ends = [_midnight(first_day + datetime.timedelta(days=day + 1))
+            for day in range((last_day - first_day).days + 1)]
+
+    checkpoint = session.execute(
+        select(PortfolioCheckpoint)
+        .where(PortfolioCheckpoint.account_id == account_id, PortfolioCheckpoint.as_of <= start)
+        .order_by(PortfolioCheckpoint.as_of.desc())
+        .limit(1)).scalar()
+    positions = Positions.from_checkpoint(checkpoint) if checkpoint else Positions()
+    since = checkpoint.as_of if checkpoint else None
+
+    existing_query = select(PortfolioCheckpoint.as_of).where(
+        PortfolioCheckpoint.account_id == account_id, PortfolioCheckpoint.as_of < ends[-1])
+    if since is not None:
+        existing_query = existing_query.where(PortfolioCheckpoint.as_of > since)
+    existing = set(session.execute(existing_query).scalars())
+
+    created = []
+    until = _midnight(datetime.date.today() - datetime.timedelta(days=1))
+    rows = _transactions(session, account_id, since, ends[-1])
+    rows = _checkpointed(rows, positions, account_id, checkpoint_every, until, existing, created)
+    points = list(_points(_day_ends(rows, positions, ends), ends))
+
+    session.add_all(created)
+    return points
+
+
+def history_range(session, account_id, args, max_days):
+    # First and last day of a /portfolio/history request; raises ValueError
+    last_day = parse_date(args['end']).date() if args.get('end') else datetime.date.today()
+    if args.get('start'):
+        first_day = parse_date(args['start']).date()
+    else:
+        # From the first transaction, as far back as the range allows
+        first = session.execute(select(func.min(Transaction.date))
+                                .where(Transaction.account_id == account_id)).scalar()
+        first_day = first.date() if first else last_day
+        first_day = max(first_day, last_day - datetime.timedelta(days=max_days - 1))
+
+    if first_day > last_day:
+        raise ValueError("Start must not be after end.")
+    if (last_day - first_day).days >= max_days:
+        raise ValueError(f"The range can span at most {max_days} days.")
+    return first_day, last_day
+
+
+def portfolio_history(session, account_id, args, config):
+    # Body of /portfolio/history; raises ValueError for invalid arguments
+    first_day, last_day = history_range(session, account_id, args, config['PORTFOLIO_HISTORY_MAX_DAYS'])
+    return equity_curve(session, account_id, first_day, last_day, config['PORTFOLIO_CHECKPOINT_INTERVAL'])
+
+
+def realized_by_ticker(session, account_id):
+    # Shares sold and realized profit/loss of an account per ticker, counting
+    # the sales compacted into the archive
+    sales = union_all(*(
+        select(model.ticker, model.shares, model.realized_profit_loss)
+        .where(model.account_id == account_id, model.operation == 'sell')
+        for model in (Transaction, TransactionArchive))).subquery()
+    rows = session.execute(
+        select(sales.c.ticker, func.sum(sales.c.shares), func.sum(sales.c.realized_profit_loss))
+        .group_by(sales.c.ticker)
+        .order_by(sales.c.ticker))
+    return [{'ticker': ticker, 'shares_sold': shares, 'realized_profit_loss': realized or 0.0}
+            for ticker, shares, realized in rows]
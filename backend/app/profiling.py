@@ -0,0 +1,242 @@
+import glob
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import click
+from flask import current_app, g, request
+
+logger = logging.getLogger(__name__)
+
+COLLAPSED_SUFFIX = '.collapsed'
+SPEEDSCOPE_SUFFIX = '.speedscope.json'
+
+# Directory of this backend, stripped from frame labels
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+class Profile:
+    # Stacks sampled from one thread, as tuples of code objects (leaf first)
+    # mapped to the number of times each was seen
+    __slots__ = ('name', 'interval', 'stacks', 'samples')
+
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+
+    def add(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack = tuple(stack)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def collapsed(self):
+        # Brendan Gregg's collapsed format: 'root;...;leaf count' per line
+        return ''.join(f"{';'.join(frame_label(code) for code in reversed(stack))} {count}\n"
+                       for stack, count in self.stacks.items())
+
+    def speedscope(self):
+        # https://www.speedscope.app/file-format-schema.json, one sampled profile
+        frames, indexes = [], {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            sample = []
+            for code in reversed(stack):
+                if code not in indexes:
+                    indexes[code] = len(frames)
+                    frames.append({'name': code.co_qualname, 'file': code.co_filename,
+                                   'line': code.co_firstlineno})
+                sample.append(indexes[code])
+            samples.append(sample)
+            weights.append(count * self.interval)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{'type': 'sampled', 'name': self.name, 'unit': 'seconds',
+                          'startValue': 0, 'endValue': sum(weights),
+                          'samples': samples, 'weights': weights}],
+            'name': self.name,
+            'exporter': 'rocketfin'
+        }
+
+
+def frame_label(code):
+    # 'app/valuation.py:ValuationEngine.snapshot', with library paths cut at
+    # site-packages so the labels are the same on every machine
+    path = code.co_filename
+    if path.startswith(_BASE_DIR):
+        path = path[len(_BASE_DIR):]
+    elif 'site-packages' + os.sep in path:
+        path = path.split('site-packages' + os.sep, 1)[1]
+    return f"{path}:{code.co_qualname}"
+
+
+class Sampler:
+    """
+    Statistical profiler for selected threads.
+
+    While any thread is watched, one background thread wakes every 'interval'
+    seconds and records the current stack of each watched thread from
+    sys._current_frames(). Unlike a tracing profiler nothing runs on function
+    calls, so a profiled request pays only for the GIL handoffs of sampling.
+    A thread busy in Python code gives up the GIL every
+    sys.getswitchinterval() seconds (5ms by default), which bounds how often
+    it can be sampled.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self._lock = threading.Lock()
+        # thread id -> Profile
+        self._watched = {}
+        self._thread = None
+
+    def start(self, name, thread_id=None):
+        # Starts sampling a thread, the current one by default
+        profile = Profile(name, self.interval)
+        with self._lock:
+            self._watched[thread_id or threading.get_ident()] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, thread_id=None):
+        # Stops sampling a thread; returns its Profile, or None if not watched
+        with self._lock:
+            return self._watched.pop(thread_id or threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._watched:
+                    self._thread = None
+                    return
+                watched = list(self._watched.items())
+            frames = sys._current_frames()
+            for thread_id, profile in watched:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.add(frame)
+            del frames
+            time.sleep(self.interval)
+
+
+sampler = Sampler()
+
+
+def route_slug(method, rule):
+    # 'GET', '/api/instruments/<ticker>/history' -> 'GET_api_instruments_ticker_history'
+    return '_'.join(filter(None, [method] + re.split(r'[^A-Za-z0-9]+', rule)))
+
+
+def write_profile(directory, profile):
+    """
+    Writes a profile as <name>/<time>-<pid>-<thread> files in 'directory'.
+
+    Each profile gets a collapsed stack file, for flamegraph.pl and the
+    profile-report command, and a speedscope file for speedscope.app.
+    Returns the path of the collapsed file.
+    """
+    folder = os.path.join(directory, profile.name)
+    os.makedirs(folder, exist_ok=True)
+    base = os.path.join(folder, f"{int(time.time() * 1000)}-{os.getpid()}-{threading.get_ident()}")
+    with open(base + SPEEDSCOPE_SUFFIX, 'w') as f:
+        json.dump(profile.speedscope(), f)
+    with open(base + COLLAPSED_SUFFIX, 'w') as f:
+        f.write(profile.collapsed())
+    return base + COLLAPSED_SUFFIX
+
+
+def _should_profile(config):
+    return config['PROFILE_HEADER'] in request.headers or random.random() < config['PROFILE_SAMPLE_RATE']
+
+
+def _start():
+    if _should_profile(current_app.config):
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.profile = sampler.start(route_slug(request.method, rule))
+
+
+def _finish(exc):
+    if g.pop('profile', None) is None:
+        return
+    profile = sampler.stop()
+    if profile is not None and profile.samples:
+        try:
+            write_profile(current_app.config['PROFILE_DIR'], profile)
+        except OSError:
+            # A profile must never fail the request it measured
+            logger.exception("Could not write profile")
+
+
+def init_app(app):
+    """
+    Profiles requests of a Flask app when PROFILING_ENABLED is set.
+
+    A PROFILE_SAMPLE_RATE fraction of requests is sampled, as is every request
+    carrying the PROFILE_HEADER header, and their profiles are written to
+    PROFILE_DIR grouped by route.
+    """
+    if not app.config['PROFILING_ENABLED']:
+        return
+    sampler.interval = app.config['PROFILE_INTERVAL']
+    app.before_request(_start)
+    # Teardown also runs after errors, so a request is never left watched
+    app.teardown_request(_finish)
+
+
+def read_collapsed(paths):
+    # Sums the stacks of collapsed stack files: {('root', ..., 'leaf'): count}
+    stacks = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    key = tuple(stack.split(';'))
+                    stacks[key] = stacks.get(key, 0) + int(count)
+    return stacks
+
+
+def hot_functions(stacks, top=20):
+    """
+    The 'top' functions by self samples, from read_collapsed() stacks.
+
+    Returns (function, self samples, total samples) tuples; total counts the
+    samples a function was anywhere on the stack, once per sample.
+    """
+    own, total = {}, {}
+    for stack, count in stacks.items():
+        own[stack[-1]] = own.get(stack[-1], 0) + count
+        for function in set(stack):
+            total[function] = total.get(function, 0) + count
+    ranked = sorted(total, key=lambda function: (-own.get(function, 0), -total[function], function))
+    return [(function, own.get(function, 0), total[function]) for function in ranked[:top]]
+
+
+@click.command('profile-report')
+@click.option('--route', default=None, help="Only profiles of this route, e.g. GET_api_portfolio.")
+@click.option('--top', default=20, show_default=True, help="Number of functions to list.")
+def profile_report_command(route, top):
+    """Print the hottest functions of the profiles in PROFILE_DIR."""
+    directory = current_app.config['PROFILE_DIR']
+    paths = glob.glob(os.path.join(directory, route or '*', '*' + COLLAPSED_SUFFIX))
+    if not paths:
+        click.echo(f"No profiles in {directory}.")
+        return
+    stacks = read_collapsed(paths)
+    samples = sum(stacks.values())
+    click.echo(f"{len(paths)} profiles, {samples} samples")
+    click.echo(f"{'self':>7} {'total':>7}  function")
+    for function, own, total in hot_functions(stacks, top):
+        click.echo(f"{own / samples:>7.1%} {total / samples:>7.1%}  {function}")
@@ -0,0 +1,41 @@
+from .base import QuoteProvider
+from .yahoo import YahooProvider
+from .synthetic import SyntheticProvider
+from .replay import ReplayProvider
+from ..quote_client import CircuitBreaker
+
+PROVIDERS = {
+    YahooProvider.name: YahooProvider,
+    SyntheticProvider.name: SyntheticProvider,
+    ReplayProvider.name: ReplayProvider,
+}
+
+
+def create_provider(config):
+    # Build the quote provider named by QUOTE_PROVIDER from a Flask config mapping
+    name = config.get('QUOTE_PROVIDER', YahooProvider.name)
+
+    if name == YahooProvider.name:
+        return YahooProvider(
+            api_key=config.get('YAHOO_FINANCE_API_KEY'),
+            record_dir=config.get('QUOTE_RECORD_DIR'),
+            connect_timeout=config['QUOTE_CONNECT_TIMEOUT'],
+            read_timeout=config['QUOTE_READ_TIMEOUT'],
+            max_retries=config['QUOTE_MAX_RETRIES'],
+            backoff_base=config['QUOTE_BACKOFF_BASE'],
+            backoff_max=config['QUOTE_BACKOFF_MAX'],
+            pool_size=config['QUOTE_POOL_SIZE'],
+            breaker=CircuitBreaker(
+                failure_threshold=config['QUOTE_BREAKER_THRESHOLD'],
+                reset_timeout=config['QUOTE_BREAKER_RESET_TIMEOUT']))
+
+    if name == SyntheticProvider.name:
+        return SyntheticProvider(
+            latency_ms=config['SYNTHETIC_LATENCY_MS'],
+            error_rate=config['SYNTHETIC_ERROR_RATE'],
+            seed=config['SYNTHETIC_SEED'])
+
+    if name == ReplayProvider.name:
+        return ReplayProvider(config.get('QUOTE_REPLAY_PATH'))
+
+    raise ValueError(f"Unknown quote provider '{name}'. Expected one of: {', '.join(PROVIDERS)}.")
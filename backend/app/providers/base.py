@@ -0,0 +1,26 @@
+import asyncio
+
+
+class QuoteProvider:
+    """
+    Source of market data quotes.
+
+    Implementations return a dict mapping each upper-case symbol they know to a
+    quote dict with the keys used throughout the API (symbol, name, bid, ask,
+    current_price, change_value, change_percent). Unknown symbols are left out.
+    """
+
+    name = 'base'
+
+    def fetch_quotes(self, symbols):
+        raise NotImplementedError
+
+    async def fetch_quotes_async(self, symbols):
+        # Providers without native async support run on a worker thread
+        return await asyncio.to_thread(self.fetch_quotes, symbols)
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
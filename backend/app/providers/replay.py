@@ -0,0 +1,54 @@
+import glob
+import json
+import os
+import threading
+from .base import QuoteProvider
+from .yahoo import parse_quote_response
+
+
+class ReplayProvider(QuoteProvider):
+    """
+    Serves quotes recorded to disk instead of calling the network.
+
+    `path` is a JSON file or a directory of JSON files, each holding a raw
+    Yahoo Finance quote response (as saved by the Yahoo provider's record_dir).
+    Files are read in name order; when a symbol was recorded several times its
+    quotes are replayed in sequence and wrap around at the end.
+    """
+
+    name = 'replay'
+
+    def __init__(self, path):
+        if not path:
+            raise ValueError("QUOTE_REPLAY_PATH must be set to use the replay provider.")
+
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, '*.json')))
+        else:
+            files = [path]
+
+        # symbol -> recorded quotes in replay order
+        self._recordings = {}
+        for file in files:
+            with open(file) as f:
+                for symbol, quote in parse_quote_response(json.load(f)).items():
+                    self._recordings.setdefault(symbol, []).append(quote)
+
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    async def fetch_quotes_async(self, symbols):
+        # Served from memory, so there is nothing to wait on
+        return self.fetch_quotes(symbols)
+
+    def fetch_quotes(self, symbols):
+        quotes = {}
+        with self._lock:
+            for symbol in symbols:
+                recordings = self._recordings.get(symbol)
+                if not recordings:
+                    continue
+                position = self._positions.get(symbol, 0)
+                quotes[symbol] = dict(recordings[position % len(recordings)])
+                self._positions[symbol] = position + 1
+        return quotes
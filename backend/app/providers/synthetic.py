@@ -0,0 +1,63 @@
+import asyncio
+import random
+import threading
+import time
+import zlib
+from ..quote_client import QuoteProviderError
+from .base import QuoteProvider
+
+
+class SyntheticProvider(QuoteProvider):
+    """
+    Deterministic in-process quote generator for offline benchmarks.
+
+    Every symbol gets a stable base price derived from its name and walks by a
+    small seeded random step on each fetch, so runs with the same seed and the
+    same call sequence produce the same prices. `latency_ms` is added to every
+    fetch and `error_rate` is the fraction of fetches that fail like an outage.
+    """
+
+    name = 'synthetic'
+
+    def __init__(self, latency_ms=0.0, error_rate=0.0, seed=0):
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._prices = {}
+        self._lock = threading.Lock()
+
+    def fetch_quotes(self, symbols):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._generate(symbols)
+
+    async def fetch_quotes_async(self, symbols):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._generate(symbols)
+
+    def _generate(self, symbols):
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                raise QuoteProviderError("Error fetching data from the synthetic provider.")
+            return {symbol: self._quote(symbol) for symbol in symbols}
+
+    def _quote(self, symbol):
+        # Caller must hold the lock
+        previous = self._prices.get(symbol)
+        if previous is None:
+            # Stable per-symbol starting price between 10 and 500
+            previous = 10 + zlib.crc32(symbol.encode()) % 49000 / 100
+        price = round(max(0.01, previous * (1 + self._random.uniform(-0.01, 0.01))), 2)
+        self._prices[symbol] = price
+
+        change_value = round(price - previous, 2)
+        return {
+            "name": f"{symbol} Synthetic Inc.",
+            "bid": round(price - 0.01, 2),
+            "ask": round(price + 0.01, 2),
+            "current_price": price,
+            "change_value": change_value,
+            "change_percent": round(change_value / previous * 100, 4),
+            "symbol": symbol
+        }
@@ -0,0 +1,74 @@
+import json
+import os
+import time
+from ..quote_client import QuoteClient, AsyncQuoteClient
+from .base import QuoteProvider
+
+API_URL = "https://yfapi.net/v6/finance/quote"
+
+
+def normalize_quote(instrument):
+    # Map a raw Yahoo Finance quote onto the fields the API returns
+    return {
+        "name": instrument.get("longName", "N/A"),
+        "bid": instrument.get("bid", "N/A"),
+        "ask": instrument.get("ask", "N/A"),
+        "current_price": instrument.get("regularMarketPrice", "N/A"),
+        "change_value": instrument.get("regularMarketChange", "N/A"),
+        "change_percent": instrument.get("regularMarketChangePercent", "N/A"),
+        # Include the ticker symbol
+        "symbol": instrument.get("symbol", "N/A")
+    }
+
+
+def parse_quote_response(data):
+    # Map each returned symbol to its instrument data
+    quotes = {}
+
+    # Check if the response contains quote data
+    if data.get("quoteResponse") and data["quoteResponse"]["result"]:
+        for instrument in data["quoteResponse"]["result"]:
+            quote = normalize_quote(instrument)
+            quotes[quote["symbol"].upper()] = quote
+
+    return quotes
+
+
+class YahooProvider(QuoteProvider):
+    name = 'yahoo'
+
+    def __init__(self, api_key=None, url=API_URL, record_dir=None, **client_options):
+        # Pooled keep-alive client so quotes don't pay a new handshake per request
+        self.client = QuoteClient(url, headers={'x-api-key': api_key},
+                                  name="Yahoo Finance", **client_options)
+        # Used when serving under ASGI; shares the circuit breaker with 'client'
+        self.async_client = AsyncQuoteClient(url, headers={'x-api-key': api_key},
+                                             name="Yahoo Finance",
+                                             **dict(client_options, breaker=self.client.breaker))
+        # When set, raw responses are saved so the replay provider can serve them
+        self.record_dir = record_dir
+
+    def fetch_quotes(self, symbols):
+        # Fetch quotes for a list of symbols with a single upstream request
+        data = self.client.get_json({"symbols": ','.join(symbols)})
+        if self.record_dir:
+            self._record(data)
+        return parse_quote_response(data)
+
+    async def fetch_quotes_async(self, symbols):
+        data = await self.async_client.get_json({"symbols": ','.join(symbols)})
+        if self.record_dir:
+            self._record(data)
+        return parse_quote_response(data)
+
+    def close(self):
+        self.client.close()
+
+    async def aclose(self):
+        await self.async_client.aclose()
+
+    def _record(self, data):
+        os.makedirs(self.record_dir, exist_ok=True)
+        path = os.path.join(self.record_dir, f"quotes-{time.time_ns()}.json")
+        with open(path, 'w') as f:
+            json.dump(data, f)
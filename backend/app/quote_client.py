@@ -0,0 +1,232 @@
+import asyncio
+import random
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class QuoteProviderError(Exception):
+    pass
+
+
+class CircuitOpenError(QuoteProviderError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the provider is down.
+
+    The circuit opens after `failure_threshold` consecutive failed calls. Once
+    `reset_timeout` seconds have passed a single trial call is let through
+    (half-open); its outcome closes the circuit again or re-opens it. A trial
+    call ending without an outcome, such as on an unexpected error or when it
+    is cancelled, re-opens it as well.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                # Let exactly one trial call through
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+    def release(self):
+        # Ends a call whose outcome may not have been recorded; a trial call
+        # still pending re-opens the circuit so another is let through later
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+
+class QuoteClient:
+    """
+    HTTP client for a quote provider.
+
+    Owns a pooled keep-alive session so repeated calls reuse connections, applies
+    connect/read timeouts to every call, retries 429/5xx responses and network
+    errors with jittered exponential backoff and trips a circuit breaker when the
+    provider keeps failing.
+    """
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, url, headers=None, name='the quote provider',
+                 connect_timeout=3.05, read_timeout=5.0, max_retries=2,
+                 backoff_base=0.2, backoff_max=5.0, pool_size=10,
+                 breaker=None, session=None, sleep=time.sleep):
+        self.url = url
+        self.headers = headers or {}
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+        self.session = session if session is not None else self._create_session()
+        if session is not None:
+            session.headers.update(self.headers)
+
+    def _create_session(self):
+        session = requests.Session()
+        # Retries are handled here so they can back off and feed the breaker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def get_json(self, params=None):
+        self._check_breaker()
+        try:
+            return self._get_json(params)
+        except BaseException:
+            self.breaker.release()
+            raise
+
+    def _get_json(self, params):
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.get(self.url, params=params,
+                                            timeout=(self.connect_timeout, self.read_timeout))
+            except (requests.ConnectionError, requests.Timeout):
+                pass
+            else:
+                if self._accept(response.status_code):
+                    return response.json()
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                self._sleep(self._backoff(attempt, retry_after))
+
+        return self._give_up()
+
+    def close(self):
+        self.session.close()
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable, try again later.")
+
+    def _accept(self, status_code):
+        # True for a usable response, False for one worth retrying
+        if status_code == 200:
+            self.breaker.record_success()
+            return True
+
+        if status_code not in self.RETRY_STATUSES:
+            # The provider answered, so this is not an outage
+            self.breaker.record_success()
+            raise QuoteProviderError(f"Error fetching data from {self.name}.")
+
+        return False
+
+    def _give_up(self):
+        self.breaker.record_failure()
+        raise QuoteProviderError(f"Error fetching data from {self.name}.")
+
+    def _backoff(self, attempt, retry_after=None):
+        # Full jitter keeps workers from retrying in lockstep
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return min(delay, self.backoff_max)
+
+
+class AsyncQuoteClient(QuoteClient):
+    """
+    QuoteClient for use on an event loop, backed by a pooled httpx.AsyncClient.
+
+    Shares the timeout, retry and circuit breaker behaviour of QuoteClient.
+    """
+
+    def __init__(self, url, sleep=asyncio.sleep, **kwargs):
+        super().__init__(url, sleep=sleep, **kwargs)
+
+    def _create_session(self):
+        # Created on first use so it binds to the serving event loop
+        return None
+
+    async def get_json(self, params=None):
+        self._check_breaker()
+        try:
+            return await self._get_json(params)
+        except BaseException:
+            self.breaker.release()
+            raise
+
+    async def _get_json(self, params):
+        if not self.session:
+            self.session = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size))
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = await self.session.get(self.url, params=params)
+            except httpx.TransportError:
+                pass
+            else:
+                if self._accept(response.status_code):
+                    return response.json()
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                await self._sleep(self._backoff(attempt, retry_after))
+
+        return self._give_up()
+
+    async def aclose(self):
+        if self.session:
+            await self.session.aclose()
+            self.session = None
+
+    def close(self):
+        # The async client can only be closed on its loop, see aclose
+        pass
@@ -1,18 +1,120 @@
-from flask import request, jsonify
-from flask import Blueprint, request, jsonify
-from .models import db, Transaction, Portfolio
-from .services import fetch_instrument_data
-from sqlalchemy import func
+import io
+import queue
+from sqlalchemy.exc import IntegrityError
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from .models import db, Account, Portfolio, PriceAlert, QueuedOrder, WatchlistItem
+from .alerts import alert_engine, format_alert_event, parse_alert
+from .database import read_bind
+from .accounts import current_account, parse_account_name, AccountNotFound, ACCOUNT_HEADER
+from .services import fetch_instrument_data, get_quotes, quote_cache
+from .streamer import quote_streamer, format_event
+from .valuation import valuation_engine
+from .symbols import symbol_index, DEFAULT_LIMIT
+from .history import history_response
+from .performance import portfolio_history, realized_by_ticker
+from .pagination import transactions_query, paginate
+from .orders import order_writer
+from .bulk import import_transactions, export_transactions, parse_format, CONTENT_TYPES
+from .trading import (execute_trade, execute_orders, parse_orders, price_orders,
+                      batch_response, TradeError, BatchRejected)
 
 api = Blueprint('api', __name__)
 
 
+@api.errorhandler(AccountNotFound)
+def account_not_found(e):
+    return jsonify({"error": str(e)}), 404
+
+
+def request_account():
+    # Account selected by the X-Account-Id header, the default one without it
+    return current_account(request.headers, current_app.config['DEFAULT_ACCOUNT_ID'])
+
+
+def stream_account():
+    # request_account() for event streams, which also take ?account=<id>
+    # since EventSource can't send headers
+    headers = request.headers
+    if ACCOUNT_HEADER not in headers and 'account' in request.args:
+        headers = {ACCOUNT_HEADER: request.args['account']}
+    return current_account(headers, current_app.config['DEFAULT_ACCOUNT_ID'])
+
+
+def valuation_response(valuation, body):
+    # Tags the response with the snapshot version; a client that already has
+    # this version gets an empty 304 without the body being built
+    etag = valuation_engine.etag(valuation)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(body())
+    response.set_etag(etag, weak=True)
+    # Let browsers keep the response but revalidate it on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def queued_response(order_id):
+    # 202 for an order left to the order writer, with where to poll it
+    body = {"message": "Order queued.", "order_id": order_id, "status": "pending"}
+    return jsonify(body), 202, {'Location': f"{request.script_root}/api/orders/{order_id}"}
+
+
+@api.route('/instruments/autocomplete', methods=['GET'])
+def autocomplete_instrument():
+    """
+    Suggest instruments matching a partial ticker or company name.
+    ---
+    description: Served from a local symbol listing without any quote lookups, so it can be called on every keystroke. Ticker prefix matches come first, then company names with a word starting with the query, then tickers one typo away.
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: The partial ticker or company name, e.g. 'app' or 'micro'.
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum number of suggestions (default 10, at most 50).
+    responses:
+      200:
+        description: Matching instruments, best matches first.
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              symbol:
+                type: string
+                description: The ticker symbol of the instrument.
+              name:
+                type: string
+                description: The company name of the instrument.
+      400:
+        description: Invalid limit.
+    """
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    if limit <= 0:
+        return jsonify({"error": "Limit must be a positive number."}), 400
+
+    response = jsonify(symbol_index.search(request.args.get('q', ''), limit))
+    # The listing rarely changes, let the browser reuse repeated queries
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
 @api.route('/instruments/search', methods=['GET'])
 def search_instrument():
     """
     Search for an instrument by its ticker symbol and include the amount owned in the portfolio.
     ---
     parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
       - name: ticker
         in: query
         type: string
@@ -55,7 +157,7 @@ def search_instrument():
               format: int
               description: The number of shares owned in the portfolio.
       400:
-        description: Invalid ticker symbol.
+        description: Missing or invalid ticker symbol.
         schema:
           type: object
           properties:
@@ -63,17 +165,14 @@ def search_instrument():
               type: string
               description: Error message indicating the issue.
     """
-    ticker = request.args.get('ticker')
-    
-    # Fetch portfolio details
-    portfolio = Portfolio.query.all()
+    account_id = request_account()
+    ticker = (request.args.get('ticker') or '').strip()
+    if not ticker:
+        return jsonify({"error": "Ticker is required."}), 400
 
-    # Initialize shares owned
-    shares_owned = 0
-    for p in portfolio:
-        if p.ticker.upper() == ticker.upper():
-            shares_owned = p.shares_owned
-            break
+    # Fetch the shares owned of this ticker, if any
+    position = Portfolio.query.filter_by(account_id=account_id, ticker=ticker.upper()).first()
+    shares_owned = position.shares_owned if position else 0
 
     try:
         # Fetch instrument data, expecting it to return a list
@@ -93,12 +192,89 @@ def search_instrument():
     return jsonify(instrument_data)
 
 
+@api.route('/instruments/<ticker>/history', methods=['GET'])
+def get_instrument_history(ticker):
+    """
+    Get the price history of an instrument as OHLC bars.
+    ---
+    description: Built from every quote the app has fetched for the instrument. Ticks are downsampled on the server into open/high/low/close bars of the requested interval, so long ranges stay small.
+    parameters:
+      - name: ticker
+        in: path
+        type: string
+        required: true
+        description: The ticker symbol of the instrument.
+      - name: start
+        in: query
+        type: string
+        required: false
+        description: Earliest date or date-time to include (ISO 8601). Defaults to the first recorded price.
+      - name: end
+        in: query
+        type: string
+        required: false
+        description: Latest date or date-time to include (ISO 8601); a date includes that whole day. Defaults to the last recorded price.
+      - name: interval
+        in: query
+        type: string
+        enum: [1m, 5m, 15m, 30m, 1h, 4h, 1d, 1w]
+        required: false
+        description: Length of each bar. Defaults to the shortest interval that keeps the range within the bar limit.
+    responses:
+      200:
+        description: Bars with at least one recorded price, oldest first.
+        schema:
+          type: object
+          properties:
+            symbol:
+              type: string
+              description: The ticker symbol of the instrument.
+            interval:
+              type: string
+              description: The length of each bar.
+            bars:
+              type: array
+              items:
+                type: object
+                properties:
+                  time:
+                    type: integer
+                    description: Start of the bar in seconds since the epoch (UTC).
+                  open:
+                    type: number
+                    format: float
+                  high:
+                    type: number
+                    format: float
+                  low:
+                    type: number
+                    format: float
+                  close:
+                    type: number
+                    format: float
+                  ticks:
+                    type: integer
+                    description: The number of recorded prices in the bar.
+      400:
+        description: Invalid ticker, dates or interval, or an interval too short for the range.
+    """
+    try:
+        return jsonify(history_response(ticker, request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
 @api.route('/transactions/buy', methods=['POST'])
 def buy_shares():
     """
     Buy shares of a specified instrument.
     ---
     parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
       - name: body
         in: body
         required: true
@@ -121,6 +297,20 @@ def buy_shares():
             message:
               type: string
               description: Success message indicating purchase.
+      202:
+        description: The order queue is on and the order was queued; poll the returned order_id at /orders/{order_id}.
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+              description: Confirmation that the order was queued.
+            order_id:
+              type: integer
+              description: Id of the queued order.
+            status:
+              type: string
+              description: Always 'pending'.
       400:
         description: Invalid request or not enough shares.
         schema:
@@ -130,6 +320,7 @@ def buy_shares():
               type: string
               description: Error message indicating the issue.
     """
+    account_id = request_account()
     data = request.json
     ticker = data.get('ticker')
     shares = float(data.get('shares'))
@@ -145,24 +336,11 @@ def buy_shares():
     except Exception as e:
         return jsonify({"message": str(e)}), 400
 
-    # Logic to record the purchase in the database
-    # Check if the portfolio exists; if not, create it
-    existing_portfolio = Portfolio.query.filter(func.lower(
-        Portfolio.ticker) == ticker.lower()).first()
+    if order_writer.enabled:
+        return queued_response(order_writer.enqueue(account_id, ticker, shares, 'buy', price))
 
-    if existing_portfolio:
-        existing_portfolio.shares_owned += shares
-        existing_portfolio.total_cost_basis += price * shares
-    else:
-        new_portfolio = Portfolio(
-            ticker=ticker, total_cost_basis=price * shares, shares_owned=shares)
-        db.session.add(new_portfolio)
-
-    # Record the transaction
-    transaction = Transaction(
-        ticker=ticker, shares=shares, operation='buy', price=price)
-    db.session.add(transaction)
-    db.session.commit()
+    # Record the purchase and update the position in one transaction
+    execute_trade(account_id, ticker, shares, 'buy', price)
 
     return jsonify({"message": "Shares purchased!"}), 201
 
@@ -173,6 +351,11 @@ def sell_shares():
     Sell shares of a specified instrument.
     ---
     parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
       - name: body
         in: body
         required: true
@@ -195,6 +378,24 @@ def sell_shares():
             message:
               type: string
               description: Success message indicating sale.
+            realized_profit_loss:
+              type: number
+              format: float
+              description: Sale value less the cost basis of the shares sold.
+      202:
+        description: The order queue is on and the order was queued; poll the returned order_id at /orders/{order_id}.
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+              description: Confirmation that the order was queued.
+            order_id:
+              type: integer
+              description: Id of the queued order.
+            status:
+              type: string
+              description: Always 'pending'.
       400:
         description: Invalid request or not enough shares.
         schema:
@@ -204,6 +405,7 @@ def sell_shares():
               type: string
               description: Error message indicating the issue.
     """
+    account_id = request_account()
     data = request.json
     ticker = data.get('ticker')
     shares = float(data.get('shares'))  # Convert shares to float
@@ -219,50 +421,256 @@ def sell_shares():
     except Exception as e:
         return jsonify({"message": str(e)}), 400
 
-    # Check if the portfolio exists
-    portfolio = Portfolio.query.filter(func.lower(
-        Portfolio.ticker) == ticker.lower()).first()
+    if order_writer.enabled:
+        # Whether enough shares are owned is only known once the order is applied
+        return queued_response(order_writer.enqueue(account_id, ticker, shares, 'sell', price))
+
+    # Record the sale and update the position in one transaction; fails if
+    # not enough shares are owned at the moment the position is updated
+    try:
+        realized = execute_trade(account_id, ticker, shares, 'sell', price)
+    except TradeError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"message": "Shares sold!", "realized_profit_loss": realized}), 201
 
-    if not portfolio or portfolio.shares_owned < shares:
-        return jsonify({"error": "Not enough shares to sell."}), 400
 
-    # Record the transaction
-    transaction = Transaction(
-        ticker=ticker, shares=shares, operation="sell", price=price)
-    db.session.add(transaction)
+@api.route('/orders/<int:order_id>', methods=['GET'])
+def get_order(order_id):
+    """
+    Retrieve a buy or sell order queued while the order queue is on.
+    ---
+    parameters:
+      - name: order_id
+        in: path
+        type: integer
+        required: true
+        description: Id returned when the order was queued.
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+    responses:
+      200:
+        description: The order and its outcome once the order writer has applied it.
+        schema:
+          type: object
+          properties:
+            id:
+              type: integer
+              description: Id of the order.
+            ticker:
+              type: string
+              description: The ticker symbol of the instrument.
+            shares:
+              type: number
+              description: The number of shares to buy or sell.
+            operation:
+              type: string
+              description: buy or sell.
+            price:
+              type: number
+              format: float
+              description: Price quoted when the order was queued, at which it executes.
+            status:
+              type: string
+              description: pending, executed or failed.
+            error:
+              type: string
+              description: Why a failed order was rejected, such as not enough shares.
+            realized_profit_loss:
+              type: number
+              format: float
+              description: For an executed sell, its sale value less the cost basis of the shares sold.
+            created_at:
+              type: string
+              format: date-time
+              description: When the order was queued.
+            executed_at:
+              type: string
+              format: date-time
+              description: When the order was applied; null while pending.
+      404:
+        description: No such order for this account.
+    """
+    order = QueuedOrder.query.filter_by(id=order_id, account_id=request_account()).first()
+    if order is None:
+        return jsonify({"error": "Order not found."}), 404
+    return jsonify(order.to_dict())
+
+
+@api.route('/transactions/batch', methods=['POST'])
+def execute_batch():
+    """
+    Buy and sell several instruments in one request.
+    ---
+    description: All orders are priced with a single quote lookup and committed together. In all_or_nothing mode any failing order rolls back the whole batch; in best_effort mode the remaining orders still execute. Orders are applied in the given order, so a sell can use shares bought earlier in the same batch.
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            mode:
+              type: string
+              enum: [all_or_nothing, best_effort]
+              description: How to handle failing orders. Defaults to all_or_nothing.
+            orders:
+              type: array
+              items:
+                type: object
+                properties:
+                  ticker:
+                    type: string
+                    description: The ticker symbol of the instrument.
+                  operation:
+                    type: string
+                    description: The operation type (buy/sell).
+                  shares:
+                    type: number
+                    format: float
+                    description: The number of shares to buy or sell.
+    responses:
+      201:
+        description: At least one order was executed.
+        schema:
+          $ref: '#/definitions/BatchResult'
+      400:
+        description: Invalid request, or no order was executed.
+        schema:
+          $ref: '#/definitions/BatchResult'
+    definitions:
+      BatchResult:
+        type: object
+        properties:
+          mode:
+            type: string
+            description: The mode the batch was executed in.
+          executed:
+            type: integer
+            description: Number of orders executed.
+          results:
+            type: array
+            items:
+              type: object
+              properties:
+                ticker:
+                  type: string
+                  description: The ticker symbol of the instrument.
+                operation:
+                  type: string
+                  description: The operation type (buy/sell).
+                shares:
+                  type: number
+                  description: The number of shares bought or sold.
+                price:
+                  type: number
+                  format: float
+                  description: The price the order was executed at.
+                realized_profit_loss:
+                  type: number
+                  format: float
+                  description: For executed sells, the sale value less the cost basis of the shares sold.
+                status:
+                  type: string
+                  description: executed, failed, or rolled_back when another order failed an all_or_nothing batch.
+                error:
+                  type: string
+                  description: Why the order failed.
+          error:
+            type: string
+            description: Error message when the request itself is invalid.
+    """
+    account_id = request_account()
+    try:
+        orders, atomic = parse_orders(request.json, current_app.config['BATCH_MAX_ORDERS'])
+    except TradeError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Update the portfolio
-    portfolio.shares_owned -= shares
-    # Adjust cost basis (if needed, based on your policy)
-    portfolio.total_cost_basis -= shares * price
+    # Price every order with one quote lookup
+    tickers = list(dict.fromkeys(o['ticker'] for o in orders if not o.get('error')))
+    try:
+        price_orders(orders, get_quotes(tickers) if tickers else {})
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
 
-    if portfolio.shares_owned == 0:
-        # Remove from portfolio if all shares are sold
-        db.session.delete(portfolio)
+    rejected = {}
+    # An all-or-nothing batch with an invalid order never touches the database
+    if not (atomic and any(o.get('error') for o in orders)):
+        try:
+            rejected = execute_orders(account_id, orders, atomic)
+        except BatchRejected as e:
+            rejected = {e.index: str(e)}
 
-    db.session.commit()  # Save changes to the database
-    return jsonify({"message": "Shares sold!"}), 201
+    body, status = batch_response(orders, atomic, rejected)
+    return jsonify(body), status
 
 
 @api.route('/transactions', methods=['GET'])
 def get_transactions():
     """
-    Retrieve a list of recent transactions.
+    Retrieve a list of recent transactions, newest first.
     ---
     parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
       - name: limit
         in: query
         type: integer
         required: false
-        description: Limit the number of transactions returned.
+        description: Limit the number of transactions returned, TRANSACTIONS_PAGE_SIZE (50 by default) when omitted. When more transactions match, the X-Next-Cursor response header holds the cursor for the next page.
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Cursor from the X-Next-Cursor header of the previous page.
+      - name: ticker
+        in: query
+        type: string
+        required: false
+        description: Only return transactions of this ticker symbol.
+      - name: operation
+        in: query
+        type: string
+        required: false
+        description: Only return transactions of this operation type (buy/sell).
+      - name: start
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only return transactions made on or after this date (YYYY-MM-DD or ISO 8601 date-time).
+      - name: end
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only return transactions made before this date-time, or on or before this date if no time is given.
     responses:
       200:
         description: A list of transactions retrieved successfully, including ticker, shares, operation type, price, and date.
+        headers:
+          X-Next-Cursor:
+            type: string
+            description: Cursor for the next page, present only when more transactions match.
         schema:
           type: array
           items:
             type: object
             properties:
+              id:
+                type: integer
+                description: The transaction identifier.
               ticker:
                 type: string
                 description: The ticker symbol of the instrument.
@@ -280,27 +688,165 @@ def get_transactions():
                 type: string
                 format: date-time
                 description: The date and time of the transaction.
+              realized_profit_loss:
+                type: number
+                format: float
+                description: Sale value less the cost basis of the shares sold; null for buys.
+      400:
+        description: Invalid limit, cursor, operation or date.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              description: Error message indicating the issue.
     """
-    # Get the 'limit' parameter from the query string, default to None if not provided
-    limit = request.args.get('limit', default=None, type=int)
+    account_id = request_account()
+    try:
+        query, limit = transactions_query(account_id, request.args,
+                                          current_app.config['TRANSACTIONS_PAGE_SIZE'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Fetch transactions from the database, ordered by date in descending order
-    query = Transaction.query.order_by(Transaction.date.desc())
-    
-    # Apply limit if specified
-    if limit is not None:
-        query = query.limit(limit)
+    # Read from the replica when there is one; trades write to the primary
+    rows = db.session.execute(query, bind_arguments=read_bind()).scalars().all()
+    transactions, next_cursor = paginate(rows, limit)
 
-    transactions = query.all()
-    
     # Format the transactions for JSON response
-    return jsonify([{
-        'ticker': t.ticker,
-        'shares': t.shares,
-        'operation': t.operation,
-        'price': t.price,
-        'date': t.date.strftime('%Y-%m-%d %H:%M:%S')
-    } for t in transactions])
+    response = jsonify([t.to_dict() for t in transactions])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+@api.route('/transactions/import', methods=['POST'])
+def import_transactions_file():
+    """
+    Import a trade history from CSV or NDJSON.
+    ---
+    description: Trades keep the price and date given in the file instead of being priced at the current quote. The upload is read line by line and inserted in bulk, then the account's positions, lots and realized profit/loss are rebuilt from its whole history, so trades older than existing ones are applied in date order. Nothing is imported if any row is invalid or a sale exceeds the shares owned at its date. CSV uploads need a header row; columns other than ticker, shares, operation, price and date (such as those of an export) are ignored.
+    consumes:
+      - text/csv
+      - application/x-ndjson
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: format
+        in: query
+        type: string
+        enum: [csv, ndjson]
+        required: false
+        description: Format of the upload; taken from the Content-Type when omitted, CSV by default.
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: string
+          example: "ticker,shares,operation,price,date\nAAPL,10,buy,150.25,2023-03-01T15:30:00"
+    responses:
+      201:
+        description: The transactions were imported.
+        schema:
+          type: object
+          properties:
+            imported:
+              type: integer
+              description: Number of transactions imported.
+            earliest:
+              type: string
+              format: date-time
+              description: Date of the oldest imported transaction.
+      400:
+        description: Invalid format or row, or a sale exceeding the shares owned. Nothing was imported.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              description: Error message naming the line of the first invalid row.
+    """
+    account_id = request_account()
+    try:
+        format = parse_format(request.args.get('format'), request.content_type)
+        lines = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8-sig')
+        result = import_transactions(db.session, account_id, lines, format)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    valuation_engine.invalidate(account_id)
+    return jsonify(result), 201
+
+
+@api.route('/transactions/export', methods=['GET'])
+def export_transactions_file():
+    """
+    Download the transactions as CSV or NDJSON, newest first.
+    ---
+    description: The file is streamed from a server-side cursor, so any length of history is exported in constant memory. It can be imported again with /transactions/import.
+    produces:
+      - text/csv
+      - application/x-ndjson
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: format
+        in: query
+        type: string
+        enum: [csv, ndjson]
+        required: false
+        description: Format of the file, CSV by default.
+      - name: ticker
+        in: query
+        type: string
+        required: false
+        description: Only export transactions of this ticker symbol.
+      - name: operation
+        in: query
+        type: string
+        required: false
+        description: Only export transactions of this operation type (buy/sell).
+      - name: start
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only export transactions made on or after this date.
+      - name: end
+        in: query
+        type: string
+        format: date-time
+        required: false
+        description: Only export transactions made before this date-time, or on or before this date if no time is given.
+    responses:
+      200:
+        description: One transaction per row (CSV, with a header) or line (NDJSON) with id, ticker, shares, operation, price, date and realized_profit_loss.
+      400:
+        description: Invalid format, operation or date.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              description: Error message indicating the issue.
+    """
+    account_id = request_account()
+    try:
+        format = parse_format(request.args.get('format'))
+        chunks = export_transactions(db.session, account_id, request.args, format)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = Response(stream_with_context(chunks), mimetype=CONTENT_TYPES[format])
+    response.headers['Content-Disposition'] = f'attachment; filename=transactions.{format}'
+    return response
 
 
 @api.route('/portfolio', methods=['GET'])
@@ -308,7 +854,20 @@ def get_portfolio():
     """
     Retrieve the current user's portfolio details.
     ---
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: If-None-Match
+        in: header
+        type: string
+        required: false
+        description: ETag of a previous response; unchanged data is answered with 304.
     responses:
+      304:
+        description: Neither holdings nor prices changed since the response with this ETag.
       200:
         description: Successful retrieval of portfolio data, including ticker, name, total cost basis, shares owned, current market value, unrealized profit/loss, and unrealized return rate.
         schema:
@@ -342,57 +901,16 @@ def get_portfolio():
                 format: float
                 description: Unrealized return rate percentage based on the cost basis.
     """
-    # Fetch portfolio details
-    portfolio = Portfolio.query.all()
-
-    # Initialize an empty list to hold portfolio data
-    portfolio_data = []
-
-    # Gather all tickers from the portfolio and convert to uppercase
-    tickers = [p.ticker.upper() for p in portfolio]
+    # Shared with /portfolio/status, which the frontend calls right after
+    valuation = valuation_engine.snapshot(request_account())
 
-    if not tickers:
+    if not valuation:
         return jsonify([])
 
-    # Fetch instrument data for all tickers at once
-    try:
-        instrument_data_list = fetch_instrument_data(','.join(tickers))
-    except Exception as e:
-        # instrument_data_list = []  # Handle error gracefully
+    if valuation.quote_error is not None:
         raise Exception("Error fetching instrument data.")
 
-    # Create a dictionary for easy lookup of instrument data by ticker
-    instrument_data_dict = {
-        data['symbol'].upper(): data for data in instrument_data_list}
-
-    for p in portfolio:
-        # Convert ticker to uppercase for case-insensitive lookup
-        instrument_data = instrument_data_dict.get(p.ticker.upper(), {})
-        current_price = instrument_data.get('current_price', 0.0)
-        name = instrument_data.get('name')
-
-        # Calculate current market value
-        current_market_value = current_price * p.shares_owned
-
-        # Calculate Unrealized Profit/Loss
-        unrealized_profit_loss = current_market_value - p.total_cost_basis
-
-        # Calculate Unrealized Return Rate and round to 2 decimal places
-        unrealized_return_rate = round(
-            (unrealized_profit_loss / p.total_cost_basis) * 100, 2) if p.total_cost_basis > 0 else 0
-
-        # Append the processed data to the portfolio_data list
-        portfolio_data.append({
-            'ticker': p.ticker,
-            'name': name,
-            'total_cost_basis': p.total_cost_basis,
-            'shares_owned': p.shares_owned,
-            'current_market_value': current_market_value,
-            'unrealized_profit_loss': unrealized_profit_loss,
-            'unrealized_return_rate': unrealized_return_rate
-        })
-
-    return jsonify(portfolio_data)
+    return valuation_response(valuation, valuation.positions)
 
 
 @api.route('/portfolio/status', methods=['GET'])
@@ -400,7 +918,20 @@ def get_portfolio_status():
     """
     Retrieve summary status of the user's portfolio.
     ---
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: If-None-Match
+        in: header
+        type: string
+        required: false
+        description: ETag of a previous response; unchanged data is answered with 304.
     responses:
+      304:
+        description: Neither holdings nor prices changed since the response with this ETag.
       200:
         description: Successful retrieval of portfolio status, including total shares owned, total cost basis, total current market value, total unrealized profit/loss, and total unrealized return rate.
         schema:
@@ -426,56 +957,569 @@ def get_portfolio_status():
               format: float
               description: Total unrealized return rate percentage based on the cost basis.
     """
-    # Fetch portfolio details
-    portfolio = Portfolio.query.all()
-    
-    if not portfolio:
-        return jsonify([]) 
+    valuation = valuation_engine.snapshot(request_account())
+
+    if not valuation:
+        return jsonify([])
 
-    total_shares_owned = 0
-    total_cost_basis = 0.0
-    total_current_market_value = 0.0
-    total_unrealized_profit_loss = 0.0
+    # Positions are valued at 0 when quotes could not be fetched
+    return valuation_response(valuation, valuation.summary)
 
-    # Gather all tickers from the portfolio and convert to uppercase
-    tickers = [p.ticker.upper() for p in portfolio]
 
-    # Fetch instrument data for all tickers at once
+@api.route('/portfolio/history', methods=['GET'])
+def get_portfolio_history():
+    """
+    Retrieve the daily value of the portfolio over time.
+    ---
+    description: Positions are replayed from the transaction history and valued at the end of each day at the last recorded quote, or the last trade price when that is more recent. Replays start from stored checkpoints, so recent ranges stay fast however long the history is.
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: start
+        in: query
+        type: string
+        format: date
+        required: false
+        description: First day to include (YYYY-MM-DD). Defaults to the day of the first transaction.
+      - name: end
+        in: query
+        type: string
+        format: date
+        required: false
+        description: Last day to include (YYYY-MM-DD). Defaults to today.
+    responses:
+      200:
+        description: One point per day, oldest first.
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              date:
+                type: string
+                format: date
+                description: The day the values are at the end of.
+              market_value:
+                type: number
+                format: float
+                description: Market value of the positions held at the end of the day.
+              cost_basis:
+                type: number
+                format: float
+                description: Cost basis of the positions held at the end of the day.
+              profit_loss:
+                type: number
+                format: float
+                description: Unrealized profit or loss at the end of the day.
+      400:
+        description: Invalid dates, or a range longer than the configured maximum.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              description: Error message indicating the issue.
+    """
+    account_id = request_account()
     try:
-        instrument_data_list = fetch_instrument_data(','.join(tickers))
-    except Exception as e:
-        instrument_data_list = []  # Handle error gracefully
-
-    # Create a dictionary for easy lookup of instrument data by ticker
-    instrument_data_dict = {
-        data['symbol'].upper(): data for data in instrument_data_list}
-
-    for p in portfolio:
-        # Convert ticker to uppercase for case-insensitive lookup
-        instrument_data = instrument_data_dict.get(p.ticker.upper(), {})
-        current_price = instrument_data.get('current_price', 0.0)
-
-        # Calculate current market value
-        current_market_value = current_price * p.shares_owned
-
-        # Update totals
-        total_shares_owned += p.shares_owned
-        total_cost_basis += p.total_cost_basis
-        total_current_market_value += current_market_value
-        total_unrealized_profit_loss += (current_market_value -
-                                         p.total_cost_basis)
-
-    # Calculate total unrealized return rate
-    total_unrealized_return_rate = round((
-        (total_unrealized_profit_loss / total_cost_basis) * 100
-        if total_cost_basis > 0 else 0
-    ), 2)
-
-    # Return aggregated data
-    return jsonify({
-        'total_shares_owned': total_shares_owned,
-        'total_cost_basis': total_cost_basis,
-        'total_current_market_value': total_current_market_value,
-        'total_unrealized_profit_loss': total_unrealized_profit_loss,
-        'total_unrealized_return_rate': total_unrealized_return_rate
+        points = portfolio_history(db.session, account_id, request.args, current_app.config)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Saves the checkpoints taken while replaying
+        db.session.commit()
+    except IntegrityError:
+        # Another request saved them first
+        db.session.rollback()
+    return jsonify(points)
+
+
+@api.route('/portfolio/realized', methods=['GET'])
+def get_realized_profit_loss():
+    """
+    Retrieve the realized profit/loss of every ticker sold.
+    ---
+    description: The sale value of the shares sold less their cost basis, taken from the oldest lots first or at the average cost of the position depending on the configured cost basis method.
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+    responses:
+      200:
+        description: One entry per ticker with at least one sale.
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              ticker:
+                type: string
+                description: The ticker symbol of the instrument.
+              shares_sold:
+                type: number
+                description: Total number of shares sold.
+              realized_profit_loss:
+                type: number
+                format: float
+                description: Total realized profit or loss of the sales.
+    """
+    return jsonify(realized_by_ticker(db.session, request_account()))
+
+
+@api.route('/accounts', methods=['POST'])
+def create_account():
+    """
+    Create an account with its own portfolio and transaction history.
+    ---
+    description: Pass the returned id in the X-Account-Id header to act on this account.
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            name:
+              type: string
+              description: Unique name of the account.
+    responses:
+      201:
+        description: Account created.
+        schema:
+          type: object
+          properties:
+            id:
+              type: integer
+              description: Id of the account.
+            name:
+              type: string
+              description: Name of the account.
+            created_at:
+              type: string
+              format: date-time
+              description: When the account was created.
+      400:
+        description: Missing or invalid name.
+      409:
+        description: An account with this name already exists.
+    """
+    try:
+        name = parse_account_name(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    account = Account(name=name)
+    db.session.add(account)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Account name is already taken."}), 409
+
+    return jsonify(account.to_dict()), 201
+
+
+@api.route('/quotes/cache', methods=['GET'])
+def get_quote_cache_stats():
+    """
+    Retrieve quote cache statistics.
+    ---
+    responses:
+      200:
+        description: Counters for the per-symbol quote cache in front of the market data provider.
+        schema:
+          type: object
+          properties:
+            hits:
+              type: integer
+              description: Lookups served from a fresh cache entry.
+            misses:
+              type: integer
+              description: Lookups for symbols that were not cached.
+            stale:
+              type: integer
+              description: Lookups for symbols whose cached quote had expired.
+            upstream_calls:
+              type: integer
+              description: Requests made to the market data provider.
+            size:
+              type: integer
+              description: Number of symbols currently cached.
+            max_size:
+              type: integer
+              description: Maximum number of symbols kept before evicting the least recently used.
+            ttl:
+              type: number
+              format: float
+              description: Seconds a cached quote stays fresh.
+            hit_ratio:
+              type: number
+              format: float
+              description: Fraction of lookups served from the cache.
+    """
+    return jsonify(quote_cache.stats())
+
+
+@api.route('/quotes/stream', methods=['GET'])
+def stream_quotes():
+    """
+    Stream live quotes for held and watched tickers as Server-Sent Events.
+    ---
+    produces:
+      - text/event-stream
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: account
+        in: query
+        type: integer
+        required: false
+        description: Account to act on when the X-Account-Id header can't be sent, as with EventSource.
+      - name: symbols
+        in: query
+        type: string
+        required: false
+        description: Comma-separated ticker symbols to watch in addition to the ones the account holds or has on its watchlist.
+    responses:
+      200:
+        description: An event stream. Each "quotes" event carries a JSON object mapping ticker symbols to quote data (name, current price, bid, ask, change value and change percentage) for the quotes that changed since the previous event. Only the account's own tickers, the requested symbols and the server's configured watchlist are streamed. The first event holds the latest known quote of every streamed ticker.
+    """
+    account_id = stream_account()
+    tickers = quote_streamer.account_tickers(account_id)
+    symbols = [s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    heartbeat = current_app.config['QUOTE_STREAM_HEARTBEAT']
+
+    def events():
+        # Subscribed here so a client that never reads the stream isn't leaked
+        subscription = quote_streamer.subscribe(symbols, account_id, tickers)
+        try:
+            # Start the client off with everything already known
+            version, snapshot = quote_streamer.current()
+            snapshot = quote_streamer.visible(subscription, snapshot)
+            if snapshot:
+                yield format_event(version, snapshot)
+
+            while True:
+                try:
+                    version, quotes = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(version, quotes)
+        finally:
+            quote_streamer.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@api.route('/watchlist', methods=['GET'])
+def get_watchlist():
+    """
+    Retrieve the tickers the account watches, with their latest streamed quote.
+    ---
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+    responses:
+      200:
+        description: Watched tickers in the order they were added. Live updates come from /quotes/stream, which includes every watched ticker.
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              ticker:
+                type: string
+                description: The ticker symbol of the instrument.
+              created_at:
+                type: string
+                format: date-time
+                description: When the ticker was added to the watchlist.
+              quote:
+                type: object
+                description: Latest quote fetched by the quote streamer; null until it has refreshed the ticker.
+    """
+    items = WatchlistItem.query.filter_by(account_id=request_account()).order_by(WatchlistItem.id)
+    _, snapshot = quote_streamer.current()
+    return jsonify([dict(item.to_dict(), quote=snapshot.get(item.ticker)) for item in items])
+
+
+@api.route('/watchlist', methods=['POST'])
+def add_to_watchlist():
+    """
+    Add a ticker to the account's watchlist.
+    ---
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            ticker:
+              type: string
+              description: The ticker symbol to watch.
+    responses:
+      201:
+        description: Ticker added; the quote streamer refreshes it from now on.
+      400:
+        description: Missing or too long ticker.
+      409:
+        description: The ticker is already on the watchlist.
+    """
+    ticker = str((request.json or {}).get('ticker') or '').strip().upper()
+    if not ticker or len(ticker) > 10:
+        return jsonify({"error": "A ticker of at most 10 characters is required."}), 400
+
+    item = WatchlistItem(account_id=request_account(), ticker=ticker)
+    db.session.add(item)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Ticker is already on the watchlist."}), 409
+
+    return jsonify(item.to_dict()), 201
+
+
+@api.route('/watchlist/<ticker>', methods=['DELETE'])
+def remove_from_watchlist(ticker):
+    """
+    Remove a ticker from the account's watchlist.
+    ---
+    parameters:
+      - name: ticker
+        in: path
+        type: string
+        required: true
+        description: The ticker symbol to stop watching.
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+    responses:
+      204:
+        description: Ticker removed.
+      404:
+        description: The ticker is not on the watchlist.
+    """
+    item = WatchlistItem.query.filter_by(account_id=request_account(), ticker=ticker.upper()).first()
+    if item is None:
+        return jsonify({"error": "Ticker is not on the watchlist."}), 404
+    db.session.delete(item)
+    db.session.commit()
+    return '', 204
+
+
+@api.route('/alerts', methods=['GET'])
+def get_alerts():
+    """
+    Retrieve the account's price alerts, newest first.
+    ---
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: status
+        in: query
+        type: string
+        required: false
+        description: Only return alerts with this status (active/triggered).
+    responses:
+      200:
+        description: The alerts, including when and at what price triggered ones fired.
+        schema:
+          type: array
+          items:
+            $ref: '#/definitions/PriceAlert'
+    """
+    query = PriceAlert.query.filter_by(account_id=request_account())
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    return jsonify([alert.to_dict() for alert in query.order_by(PriceAlert.id.desc())])
+
+
+@api.route('/alerts', methods=['POST'])
+def create_alert():
+    """
+    Create a price alert.
+    ---
+    description: The alert triggers once, on the first quote refresh at which the price is at or above (direction above) or at or below (direction below) the given price, including the first refresh after it is created. It is then marked triggered and pushed to /alerts/stream.
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            ticker:
+              type: string
+              description: The ticker symbol to watch.
+            direction:
+              type: string
+              description: above or below.
+            price:
+              type: number
+              format: float
+              description: The price to alert at.
+    definitions:
+      PriceAlert:
+        type: object
+        properties:
+          id:
+            type: integer
+            description: Id of the alert.
+          ticker:
+            type: string
+            description: The ticker symbol of the instrument.
+          direction:
+            type: string
+            description: above or below.
+          price:
+            type: number
+            format: float
+            description: The price to alert at.
+          status:
+            type: string
+            description: active or triggered.
+          triggered_price:
+            type: number
+            format: float
+            description: The quoted price that triggered the alert; null while active.
+          created_at:
+            type: string
+            format: date-time
+            description: When the alert was created.
+          triggered_at:
+            type: string
+            format: date-time
+            description: When the alert triggered; null while active.
+    responses:
+      201:
+        description: Alert created.
+        schema:
+          $ref: '#/definitions/PriceAlert'
+      400:
+        description: Invalid ticker, direction or price.
+    """
+    try:
+        ticker, direction, price = parse_alert(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    alert = PriceAlert(account_id=request_account(), ticker=ticker, direction=direction, price=price)
+    db.session.add(alert)
+    db.session.commit()
+    # Indexed right away here; other workers pick it up on their next refresh
+    alert_engine.sync(db.session)
+    quote_streamer.start()
+    return jsonify(alert.to_dict()), 201
+
+
+@api.route('/alerts/<int:alert_id>', methods=['DELETE'])
+def delete_alert(alert_id):
+    """
+    Delete a price alert.
+    ---
+    parameters:
+      - name: alert_id
+        in: path
+        type: integer
+        required: true
+        description: Id of the alert.
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+    responses:
+      204:
+        description: Alert deleted; it no longer triggers.
+      404:
+        description: No such alert for this account.
+    """
+    alert = PriceAlert.query.filter_by(id=alert_id, account_id=request_account()).first()
+    if alert is None:
+        return jsonify({"error": "Alert not found."}), 404
+    # Taken out of the index while its fields are loaded; other workers drop
+    # it when it would have triggered
+    alert_engine.remove(alert)
+    db.session.delete(alert)
+    db.session.commit()
+    return '', 204
+
+
+@api.route('/alerts/stream', methods=['GET'])
+def stream_alerts():
+    """
+    Stream the account's triggered price alerts as Server-Sent Events.
+    ---
+    produces:
+      - text/event-stream
+    parameters:
+      - name: X-Account-Id
+        in: header
+        type: integer
+        required: false
+        description: Account to act on; the default account when omitted. Unknown accounts get 404.
+      - name: account
+        in: query
+        type: integer
+        required: false
+        description: Account to act on when the X-Account-Id header can't be sent, as with EventSource.
+    responses:
+      200:
+        description: An event stream. Each "alert" event carries one triggered alert as JSON (id, ticker, direction, price, triggered_price and triggered_at). Alerts triggered while no stream was open are listed by /alerts?status=triggered.
+    """
+    account_id = stream_account()
+    heartbeat = current_app.config['QUOTE_STREAM_HEARTBEAT']
+
+    def events():
+        # Subscribed here so a client that never reads the stream isn't leaked
+        subscription = alert_engine.subscribe(account_id)
+        quote_streamer.start()
+        try:
+            while True:
+                try:
+                    alert = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_alert_event(alert)
+        finally:
+            alert_engine.unsubscribe(account_id, subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
@@ -1,42 +1,99 @@
-import os
-import requests
-from dotenv import load_dotenv
+import time
+from config import Config
+from .cache import QuoteCache
+from .providers import create_provider
+from .history import price_history
+from .metrics import observe_quote_call
 
-load_dotenv()
+# Market data provider, selected from the app config by init_app
+provider = None
 
-API_URL = "https://yfapi.net/v6/finance/quote"
+# Shared by every route so repeated lookups within the TTL skip the upstream
+quote_cache = QuoteCache(ttl=Config.QUOTE_CACHE_TTL,
+                         max_size=Config.QUOTE_CACHE_MAX_SIZE)
+
+
+def init_app(app):
+    global provider
+    if provider is not None:
+        provider.close()
+    provider = create_provider(app.config)
+
+    quote_cache.ttl = app.config['QUOTE_CACHE_TTL']
+    quote_cache.max_size = app.config['QUOTE_CACHE_MAX_SIZE']
+    # Quotes from a previously configured provider must not leak through
+    quote_cache.clear()
+
+    price_history.init_app(app)
+
+
+def get_provider():
+    global provider
+    if provider is None:
+        provider = create_provider(
+            {key: getattr(Config, key) for key in dir(Config) if key.isupper()})
+    return provider
 
-headers = {
-    'x-api-key': os.getenv("YAHOO_FINANCE_API_KEY")
-}
 
 def fetch_instrument_data(tickers):
     # Expecting 'tickers' to be a comma-separated string
-    querystring = {"symbols": tickers}
-
-    response = requests.get(API_URL, headers=headers, params=querystring)
-    if response.status_code != 200:
-        raise Exception("Error fetching data from Yahoo Finance.")
-
-    data = response.json()
-
-    # Prepare a list to hold instrument data for all requested tickers
-    instruments = []
-
-    # Check if the response contains quote data
-    if data.get("quoteResponse") and data["quoteResponse"]["result"]:
-        for instrument in data["quoteResponse"]["result"]:
-            instruments.append({
-                "name": instrument.get("longName", "N/A"),
-                "bid": instrument.get("bid", "N/A"),
-                "ask": instrument.get("ask", "N/A"),
-                "current_price": instrument.get("regularMarketPrice", "N/A"),
-                "change_value": instrument.get("regularMarketChange", "N/A"),
-                "change_percent": instrument.get("regularMarketChangePercent", "N/A"),
-                # Include the ticker symbol
-                "symbol": instrument.get("symbol", "N/A")
-            })
-    else:
+    symbols = parse_tickers(tickers)
+
+    return _instruments(symbols, get_quotes(symbols))
+
+
+async def fetch_instrument_data_async(tickers):
+    # Same as fetch_instrument_data without blocking the event loop
+    symbols = parse_tickers(tickers)
+    return _instruments(symbols, await get_quotes_async(symbols))
+
+
+def get_quotes(symbols):
+    # Quotes of the known symbols by upper-case symbol. Cached symbols are
+    # served locally, all misses go out in one request
+    return quote_cache.get_many(symbols, fetch_quotes)
+
+
+async def get_quotes_async(symbols):
+    return await quote_cache.get_many_async(symbols, fetch_quotes_async)
+
+
+def fetch_quotes(symbols):
+    # Fetch quotes for a list of symbols with a single provider call. Every
+    # fetched price is kept in the price history, written in the background
+    started = time.perf_counter()
+    try:
+        quotes = get_provider().fetch_quotes(symbols)
+    except Exception:
+        observe_quote_call(started, failed=True)
+        raise
+    observe_quote_call(started, failed=False)
+    price_history.submit(quotes)
+    return quotes
+
+
+async def fetch_quotes_async(symbols):
+    started = time.perf_counter()
+    try:
+        quotes = await get_provider().fetch_quotes_async(symbols)
+    except Exception:
+        observe_quote_call(started, failed=True)
+        raise
+    observe_quote_call(started, failed=False)
+    price_history.submit(quotes)
+    return quotes
+
+
+def parse_tickers(tickers):
+    # Upper-case, de-duplicated symbols from a comma-separated string
+    return list(dict.fromkeys(
+        t.strip().upper() for t in tickers.split(',') if t.strip()))
+
+
+def _instruments(symbols, quotes):
+    # Copy the cached quotes so callers can safely add fields to them
+    instruments = [dict(quotes[symbol]) for symbol in symbols if symbol in quotes]
+    if not instruments:
         raise Exception("Instrument data not found.")
 
     return instruments
@@ -0,0 +1,190 @@
+import json
+import logging
+import queue
+import threading
+from collections import Counter
+from .models import db, Portfolio, WatchlistItem
+from . import services
+from .alerts import alert_engine
+from .valuation import valuation_engine
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteStreamer:
+    """
+    Refreshes quotes for every held and watched ticker on a fixed cadence.
+
+    One background thread fetches all symbols with a single provider call per
+    interval, keeps the latest quotes in a shared snapshot, warms the quote
+    cache and fans the changed quotes out to every subscriber, so N connected
+    clients cost one upstream fetch per interval instead of N. Watchlists and
+    price alerts add their tickers, and the loop keeps running while any
+    alert is active so alerts trigger with nobody subscribed, and while an
+    alert stream is open so it gets the alerts other workers trigger.
+    Subscribers only receive the quotes of the symbols they asked for, the
+    configured watchlist and the tickers their own account holds or watches.
+    """
+
+    def __init__(self, interval=5.0, watchlist=(), max_queue=16, always_on=False):
+        self.interval = interval
+        # Keep refreshing with no subscribers, so polling routes hit a warm cache
+        self.always_on = always_on
+        self.max_queue = max_queue
+        self.version = 0
+        # symbol -> latest quote
+        self.snapshot = {}
+        self._watchlist = {s.upper() for s in watchlist}
+        # symbol -> number of subscribers watching it
+        self._watched = Counter()
+        self._subscribers = set()
+        # account id -> tickers it holds or watches, as of the last refresh
+        self._account_tickers = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self.stop()
+        self._app = app
+        self.interval = app.config['QUOTE_STREAM_INTERVAL']
+        self._watchlist = {s.upper() for s in app.config['QUOTE_STREAM_WATCHLIST']}
+        self.always_on = app.config['QUOTE_STREAM_ALWAYS_ON']
+        with self._lock:
+            self.snapshot = {}
+        if self.always_on or len(alert_engine):
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='quote-streamer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.interval + 1)
+        self._thread = None
+
+    def subscribe(self, symbols=(), account_id=None, tickers=()):
+        # Returns a queue that receives (version, quotes) events. 'tickers'
+        # are the ones 'account_id' holds or watches now; later refreshes
+        # keep them up to date
+        subscription = queue.Queue(maxsize=self.max_queue)
+        subscription.symbols = [s.upper() for s in symbols]
+        subscription.account_id = account_id
+        with self._lock:
+            self._subscribers.add(subscription)
+            self._watched.update(subscription.symbols)
+            if account_id is not None:
+                self._account_tickers.setdefault(account_id, set()).update(tickers)
+        # The first subscriber starts the refresh loop
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            self._watched.subtract(subscription.symbols)
+            self._watched += Counter()  # Drop symbols nobody watches anymore
+
+    def current(self):
+        with self._lock:
+            return self.version, dict(self.snapshot)
+
+    def account_tickers(self, account_id):
+        # Tickers an account holds or watches; needs an app context
+        held = db.session.query(Portfolio.ticker).filter_by(account_id=account_id)
+        followed = db.session.query(WatchlistItem.ticker).filter_by(account_id=account_id)
+        return {ticker.upper() for (ticker,) in held.union(followed)}
+
+    def visible(self, subscription, quotes):
+        # The part of 'quotes' a subscriber may see, so no client learns what
+        # other accounts hold
+        with self._lock:
+            allowed = self._account_tickers.get(subscription.account_id, set())
+            return {symbol: quote for symbol, quote in quotes.items()
+                    if symbol in allowed or symbol in self._watchlist or symbol in subscription.symbols}
+
+    def refresh(self):
+        # Held tickers come from the database, so this needs an app context
+        held = db.session.query(Portfolio.account_id, Portfolio.ticker)
+        followed = db.session.query(WatchlistItem.account_id, WatchlistItem.ticker)
+        account_tickers = {}
+        for account_id, ticker in held.union(followed):
+            account_tickers.setdefault(account_id, set()).add(ticker.upper())
+        # Alerts created by other workers since the last refresh
+        alert_engine.sync(db.session)
+
+        with self._lock:
+            self._account_tickers = account_tickers
+            symbols = sorted(set().union(*account_tickers.values()) | alert_engine.symbols()
+                             | self._watchlist | set(self._watched))
+        if not symbols:
+            # Other workers may still have triggered alerts of our subscribers
+            alert_engine.publish_triggered(db.session)
+            return
+
+        quotes = services.fetch_quotes(symbols)
+        services.quote_cache.put_many(quotes)
+        # Revalues only the held rows whose quote moved
+        valuation_engine.update_prices(quotes)
+        alert_engine.evaluate(db.session, quotes)
+
+        with self._lock:
+            changed = {symbol: quote for symbol, quote in quotes.items()
+                       if self.snapshot.get(symbol) != quote}
+            if not changed:
+                return
+            self.snapshot.update(changed)
+            self.version += 1
+            version = self.version
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            visible = self.visible(subscription, changed)
+            if visible:
+                self._publish(subscription, (version, visible))
+
+    def _publish(self, subscription, event):
+        # Slow consumers lose their oldest event rather than blocking the loop
+        while True:
+            try:
+                subscription.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    subscription.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                if (not self._subscribers and not self.always_on and not len(alert_engine)
+                        and not alert_engine.has_subscribers()):
+                    # Nobody is listening and no alert is waiting; stop until
+                    # the next subscriber or alert arrives
+                    self._thread = None
+                    return
+
+            try:
+                with self._app.app_context():
+                    self.refresh()
+            except Exception:
+                logger.exception("Quote refresh failed")
+
+            self._stop.wait(self.interval)
+
+
+def format_event(version, quotes):
+    # Server-Sent Events frame carrying the changed quotes
+    return f"id: {version}\nevent: quotes\ndata: {json.dumps(quotes)}\n\n"
+
+
+quote_streamer = QuoteStreamer()
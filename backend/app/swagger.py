@@ -0,0 +1,45 @@
+import json
+import click
+from flask import current_app
+
+
+def init_app(app):
+    """
+    Serves the Swagger UI at /apidocs/ when SWAGGER_ENABLED is set.
+
+    flasgger is only imported here, so workers running without the docs don't
+    load it at all. The spec is built from the route docstrings on its first
+    request, or read from SWAGGER_SPEC_PATH when a file exported by
+    swagger-export is given. Call after the routes are registered: flasgger
+    inspects every route added after it.
+    """
+    if not app.config['SWAGGER_ENABLED']:
+        return
+    from flasgger import Swagger
+
+    swagger = Swagger(app)
+    if app.config['SWAGGER_SPEC_PATH']:
+        with open(app.config['SWAGGER_SPEC_PATH']) as f:
+            # Seeds flasgger's own cache, which it only bypasses in debug mode
+            swagger.apispecs[Swagger.DEFAULT_ENDPOINT] = json.load(f)
+
+
+def build_spec(app):
+    # The spec flasgger builds from the route docstrings
+    from flasgger import Swagger
+
+    app.swag.apispecs.pop(Swagger.DEFAULT_ENDPOINT, None)  # Not a previously exported one
+    with app.test_request_context():
+        return app.swag.get_apispecs(Swagger.DEFAULT_ENDPOINT)
+
+
+@click.command('swagger-export')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+def swagger_export_command(path):
+    """Write the Swagger spec to PATH, for SWAGGER_SPEC_PATH."""
+    if not hasattr(current_app, 'swag'):
+        raise click.ClickException("Swagger is disabled, set SWAGGER_ENABLED=true.")
+    spec = build_spec(current_app)
+    with open(path, 'w') as f:
+        json.dump(spec, f, indent=2)
+    click.echo(f"Wrote the spec of {len(spec['paths'])} paths to {path}.")
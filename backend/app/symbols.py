@@ -0,0 +1,190 @@
+import bisect
+import csv
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Header names accepted for the symbol and company name columns of a listing
+SYMBOL_COLUMNS = ('symbol', 'ticker', 'act symbol')
+NAME_COLUMNS = ('name', 'security name', 'company name', 'company', 'description')
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def _normalize_name(name):
+    # 'Coca-Cola Co.' -> 'coca cola co', so punctuation never blocks a match
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', name.lower()).split())
+
+
+def _deletes(key):
+    # Every string one character shorter than 'key'
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+class _Listing:
+    """
+    Immutable, searchable form of one listing file.
+
+    Tickers are kept in a sorted list so a prefix is one bisect plus a short
+    scan. Company names are indexed from the start of every word, so 'depot'
+    finds 'The Home Depot, Inc.'. Typos in tickers are matched through a map
+    of every ticker with one character deleted, which covers a missing, extra,
+    wrong or swapped character with a handful of dict lookups.
+    """
+
+    def __init__(self, entries):
+        entries = sorted(entries.items())
+        self.symbols = [symbol for symbol, _ in entries]
+        self.names = [name for _, name in entries]
+        self._rows = {symbol: row for row, symbol in enumerate(self.symbols)}
+
+        # (name suffix starting at a word, row), sorted for bisect
+        name_keys = []
+        for row, name in enumerate(self.names):
+            words = _normalize_name(name)
+            for match in re.finditer(r'\S+', words):
+                name_keys.append((words[match.start():], row))
+        name_keys.sort()
+        self._name_keys = name_keys
+
+        # ticker with one character deleted -> rows
+        self._deleted = {}
+        for row, symbol in enumerate(self.symbols):
+            if len(symbol) > 1:
+                for key in _deletes(symbol):
+                    self._deleted.setdefault(key, []).append(row)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def search(self, query, limit):
+        symbol = query.strip().upper()
+        name = _normalize_name(query)
+        if not symbol or limit <= 0:
+            return []
+
+        rows = {}  # Insertion ordered, deduplicates matches across passes
+
+        # Ticker prefix matches, shortest (and exact) first
+        lo = bisect.bisect_left(self.symbols, symbol)
+        hi = bisect.bisect_left(self.symbols, symbol + '\uffff', lo)
+        for row in heapq.nsmallest(limit, range(lo, hi), key=lambda r: (len(self.symbols[r]), r)):
+            rows.setdefault(row)
+
+        # Company names with a word starting with the query
+        if name and len(rows) < limit:
+            position = bisect.bisect_left(self._name_keys, (name,))
+            while len(rows) < limit and position < len(self._name_keys):
+                key, row = self._name_keys[position]
+                if not key.startswith(name):
+                    break
+                rows.setdefault(row)
+                position += 1
+
+        # Tickers one typo away
+        if len(symbol) > 1 and len(rows) < limit:
+            for row in self._fuzzy(symbol):
+                if len(rows) >= limit:
+                    break
+                rows.setdefault(row)
+
+        return [{'symbol': self.symbols[row], 'name': self.names[row]} for row in rows]
+
+    def _fuzzy(self, symbol):
+        candidates = set(self._deleted.get(symbol, ()))  # One character missing
+        for key in _deletes(symbol):
+            if key in self._rows:
+                candidates.add(self._rows[key])  # One character too many
+            candidates.update(self._deleted.get(key, ()))  # Wrong or swapped character
+        return sorted(candidates, key=lambda r: self.symbols[r])
+
+
+def read_listing(path):
+    """
+    Reads a listing file into a dict of symbol -> company name.
+
+    Accepts comma, tab or pipe separated files with a header row naming the
+    symbol and name columns, e.g. the bundled app/data/symbols.csv or an
+    exchange's pipe-separated symbol directory.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = f.readline()
+        delimiter = max(',|\t', key=header.count)
+        columns = [c.strip().lower() for c in next(csv.reader([header], delimiter=delimiter))]
+        try:
+            symbol_at = next(columns.index(c) for c in SYMBOL_COLUMNS if c in columns)
+            name_at = next(columns.index(c) for c in NAME_COLUMNS if c in columns)
+        except StopIteration:
+            raise ValueError(f"{path} needs a symbol and a name column.")
+
+        entries = {}
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) <= max(symbol_at, name_at):
+                continue
+            symbol, name = row[symbol_at].strip().upper(), row[name_at].strip()
+            # Skips blank lines and trailers such as 'File Creation Time: ...'
+            if symbol and name and ' ' not in symbol:
+                entries[symbol] = name
+        return entries
+
+
+class SymbolIndex:
+    """
+    In-memory symbol and company name index for autocomplete.
+
+    Loaded from a listing file and searched without any database or network
+    access. The file is re-read when it changes on disk, checked at most every
+    'check_interval' seconds, so the listing can be refreshed without a restart.
+    """
+
+    def __init__(self, path=None, check_interval=60.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._listing = _Listing({})
+        self._mtime = None
+        self._next_check = 0.0
+
+    def init_app(self, app):
+        self.path = app.config['SYMBOL_LISTING_PATH']
+        self.check_interval = app.config['SYMBOL_LISTING_CHECK_INTERVAL']
+        self._mtime = None
+        self._next_check = 0.0
+        self._listing = _Listing({})
+
+    def __len__(self):
+        self._refresh()
+        return len(self._listing)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        # Best matches for 'query' as [{'symbol', 'name'}], at most 'limit'
+        self._refresh()
+        return self._listing.search(query, min(limit, MAX_LIMIT))
+
+    def _refresh(self):
+        if self._clock() < self._next_check:
+            return
+        with self._lock:
+            if self._clock() < self._next_check:
+                return
+            self._next_check = self._clock() + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    # Swapped in whole, so searches never see a partial listing
+                    self._listing = _Listing(read_listing(self.path))
+                    self._mtime = mtime
+                    logger.info("Loaded %d symbols from %s", len(self._listing), self.path)
+            except (OSError, ValueError):
+                logger.exception("Could not load symbol listing %s", self.path)
+
+
+symbol_index = SymbolIndex(Config.SYMBOL_LISTING_PATH, Config.SYMBOL_LISTING_CHECK_INTERVAL)
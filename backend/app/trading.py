@@ -0,0 +1,426 @@
+import asyncio
+import datetime
+import random
+import time
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from .models import db, Lot, Transaction, Portfolio
+from .valuation import valuation_engine
+from .lots import open_lot, removed_basis, take_lots, take_lots_async
+
+# Attempts made when a trade hits a lock or serialization conflict
+MAX_ATTEMPTS = 5
+
+
+class TradeError(Exception):
+    pass
+
+
+class InsufficientShares(TradeError):
+    def __init__(self):
+        super().__init__("Not enough shares to sell.")
+
+
+class BatchRejected(TradeError):
+    # An all-or-nothing batch rolled back because of the order at 'index'
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+# Batch modes: commit every order or none, or commit the orders that succeed
+ALL_OR_NOTHING = 'all_or_nothing'
+BEST_EFFORT = 'best_effort'
+
+
+# Every trade is applied with single-statement guarded writes, so the row
+# lock taken by the UPDATE is the only synchronization needed: a sell can't
+# drive a position negative and a first buy racing another one hits the unique
+# (account, ticker) index and is retried as an update. A sell holds that lock
+# while it takes shares from the position's lots and then reduces its cost
+# basis by what those shares cost (see lots.py).
+
+def _add_to_position(account_id, ticker, shares, cost):
+    return (update(Portfolio)
+            .where(Portfolio.account_id == account_id, Portfolio.ticker == ticker)
+            .values(shares_owned=Portfolio.shares_owned + shares,
+                    total_cost_basis=Portfolio.total_cost_basis + cost)
+            .execution_options(synchronize_session=False))
+
+
+def _open_position(account_id, ticker, shares, cost):
+    return insert(Portfolio).values(account_id=account_id, ticker=ticker, shares_owned=shares,
+                                    total_cost_basis=cost)
+
+
+def _take_from_position(account_id, ticker, shares):
+    # Matches no row unless enough shares are owned
+    return (update(Portfolio)
+            .where(Portfolio.account_id == account_id, Portfolio.ticker == ticker,
+                   Portfolio.shares_owned >= shares)
+            .values(shares_owned=Portfolio.shares_owned - shares)
+            .execution_options(synchronize_session=False))
+
+
+def _position(account_id, ticker):
+    return (select(Portfolio.shares_owned, Portfolio.total_cost_basis)
+            .where(Portfolio.account_id == account_id, Portfolio.ticker == ticker))
+
+
+def _reduce_cost_basis(account_id, ticker, cost):
+    return (update(Portfolio)
+            .where(Portfolio.account_id == account_id, Portfolio.ticker == ticker)
+            .values(total_cost_basis=Portfolio.total_cost_basis - cost)
+            .execution_options(synchronize_session=False))
+
+
+def _close_empty_position(account_id, ticker):
+    # Remove from portfolio if all shares are sold
+    return (delete(Portfolio)
+            .where(Portfolio.account_id == account_id, Portfolio.ticker == ticker,
+                   Portfolio.shares_owned == 0)
+            .execution_options(synchronize_session=False))
+
+
+def _transaction_row(account_id, ticker, shares, operation, price, cost, date):
+    # Sells record the sale value less the cost basis of the shares sold
+    realized = shares * price - cost if operation == 'sell' else None
+    return {'account_id': account_id, 'ticker': ticker, 'shares': shares, 'operation': operation,
+            'price': price, 'date': date, 'realized_profit_loss': realized}
+
+
+def _update_position(session, account_id, ticker, shares, operation, price, date):
+    # Returns the cost basis the trade added to or removed from the position
+    if operation == 'buy':
+        if session.execute(_add_to_position(account_id, ticker, shares, price * shares)).rowcount == 0:
+            session.execute(_open_position(account_id, ticker, shares, price * shares))
+        session.execute(open_lot(account_id, ticker, shares, price, date))
+        return price * shares
+
+    if session.execute(_take_from_position(account_id, ticker, shares)).rowcount == 0:
+        raise InsufficientShares()
+    shares_left, cost_basis = session.execute(_position(account_id, ticker)).one()
+    cost = removed_basis(take_lots(session, account_id, ticker, shares), shares,
+                         shares_left + shares, cost_basis)
+    session.execute(_reduce_cost_basis(account_id, ticker, cost))
+    session.execute(_close_empty_position(account_id, ticker))
+    return cost
+
+
+async def _update_position_async(session, account_id, ticker, shares, operation, price, date):
+    if operation == 'buy':
+        if (await session.execute(_add_to_position(account_id, ticker, shares, price * shares))).rowcount == 0:
+            await session.execute(_open_position(account_id, ticker, shares, price * shares))
+        await session.execute(open_lot(account_id, ticker, shares, price, date))
+        return price * shares
+
+    if (await session.execute(_take_from_position(account_id, ticker, shares))).rowcount == 0:
+        raise InsufficientShares()
+    shares_left, cost_basis = (await session.execute(_position(account_id, ticker))).one()
+    cost = removed_basis(await take_lots_async(session, account_id, ticker, shares), shares,
+                         shares_left + shares, cost_basis)
+    await session.execute(_reduce_cost_basis(account_id, ticker, cost))
+    await session.execute(_close_empty_position(account_id, ticker))
+    return cost
+
+
+def apply_trade(session, account_id, ticker, shares, operation, price):
+    # Applies one order of 'account_id' to 'session' without committing;
+    # returns the cost basis it added or removed
+    ticker = ticker.upper()
+    date = datetime.datetime.now()
+    cost = _update_position(session, account_id, ticker, shares, operation, price, date)
+    session.execute(insert(Transaction), [_transaction_row(account_id, ticker, shares, operation, price,
+                                                           cost, date)])
+    return cost
+
+
+async def apply_trade_async(session, account_id, ticker, shares, operation, price):
+    # apply_trade for an AsyncSession
+    ticker = ticker.upper()
+    date = datetime.datetime.now()
+    cost = await _update_position_async(session, account_id, ticker, shares, operation, price, date)
+    await session.execute(insert(Transaction), [_transaction_row(account_id, ticker, shares, operation,
+                                                                 price, cost, date)])
+    return cost
+
+
+def apply_orders(session, account_id, orders, atomic):
+    """
+    Applies priced orders to 'session' without committing.
+
+    Positions are updated order by order, so a sell can use shares bought
+    earlier in the same batch, and all transactions are then written with one
+    multi-row insert. Orders that already carry an 'error' are skipped; the
+    others get the 'cost' basis they added or removed. Returns a dict of order
+    index -> error for orders rejected here; in atomic mode the first
+    rejection raises BatchRejected instead.
+    """
+    rejected = {}
+    rows = []
+    date = datetime.datetime.now()
+    for index, order in enumerate(orders):
+        if order.get('error'):
+            continue
+        try:
+            order['cost'] = _update_position(session, account_id, order['ticker'], order['shares'],
+                                             order['operation'], order['price'], date)
+        except TradeError as e:
+            if atomic:
+                raise BatchRejected(index, str(e))
+            rejected[index] = str(e)
+            continue
+        rows.append(_transaction_row(account_id, order['ticker'], order['shares'], order['operation'],
+                                     order['price'], order['cost'], date))
+
+    if rows:
+        session.execute(insert(Transaction), rows)
+    return rejected
+
+
+async def apply_orders_async(session, account_id, orders, atomic):
+    # apply_orders for an AsyncSession
+    rejected = {}
+    rows = []
+    date = datetime.datetime.now()
+    for index, order in enumerate(orders):
+        if order.get('error'):
+            continue
+        try:
+            order['cost'] = await _update_position_async(session, account_id, order['ticker'],
+                                                         order['shares'], order['operation'],
+                                                         order['price'], date)
+        except TradeError as e:
+            if atomic:
+                raise BatchRejected(index, str(e))
+            rejected[index] = str(e)
+            continue
+        rows.append(_transaction_row(account_id, order['ticker'], order['shares'], order['operation'],
+                                     order['price'], order['cost'], date))
+
+    if rows:
+        await session.execute(insert(Transaction), rows)
+    return rejected
+
+
+def _add_buys(session, account_id, ticker, shares, cost):
+    if session.execute(_add_to_position(account_id, ticker, shares, cost)).rowcount == 0:
+        session.execute(_open_position(account_id, ticker, shares, cost))
+
+
+def apply_order_batch(session, orders):
+    """
+    Applies priced orders of any accounts to 'session' in order, without
+    committing, for the order writer.
+
+    Works like apply_orders in best-effort mode, but the buys of a position
+    are folded into one position update and every lot and transaction is
+    written by one multi-row insert, so a batch costs a few statements per
+    position rather than per order. A sell first writes the buys of its
+    position queued before it. Sets each order's 'cost' basis and returns a
+    dict of order index -> error for the rejected ones.
+    """
+    rejected = {}
+    buys = {}  # (account id, ticker) -> [shares, cost]
+    lots = []
+    rows = []
+    date = datetime.datetime.now()
+    for index, order in enumerate(orders):
+        account_id, ticker = key = order['account_id'], order['ticker']
+        if order['operation'] == 'buy':
+            order['cost'] = order['price'] * order['shares']
+            pending = buys.setdefault(key, [0, 0.0])
+            pending[0] += order['shares']
+            pending[1] += order['cost']
+            lots.append({'account_id': account_id, 'ticker': ticker, 'shares': order['shares'],
+                         'price': order['price'], 'opened_at': date})
+        else:
+            if key in buys:
+                _add_buys(session, account_id, ticker, *buys.pop(key))
+                session.execute(insert(Lot), lots)
+                lots = []
+            try:
+                order['cost'] = _update_position(session, account_id, ticker, order['shares'], 'sell',
+                                                 order['price'], date)
+            except TradeError as e:
+                rejected[index] = str(e)
+                continue
+        rows.append(_transaction_row(account_id, ticker, order['shares'], order['operation'],
+                                     order['price'], order['cost'], date))
+
+    for (account_id, ticker), (shares, cost) in buys.items():
+        _add_buys(session, account_id, ticker, shares, cost)
+    if lots:
+        session.execute(insert(Lot), lots)
+    if rows:
+        session.execute(insert(Transaction), rows)
+    return rejected
+
+
+def is_retryable(error):
+    # Lock timeouts, serialization failures and deadlocks succeed when retried;
+    # an IntegrityError here is a concurrent first buy of the same ticker
+    if isinstance(error, IntegrityError):
+        return True
+    if isinstance(error, OperationalError):
+        code = getattr(error.orig, 'pgcode', None) or getattr(error.orig, 'sqlstate', None)
+        return code in ('40001', '40P01') or 'database is locked' in str(error.orig)
+    return False
+
+
+def retry_delay(attempt):
+    return random.uniform(0, 0.01 * 2 ** attempt)
+
+
+def _realized(shares, operation, price, cost):
+    return shares * price - cost if operation == 'sell' else None
+
+
+def execute_trade(account_id, ticker, shares, operation, price):
+    # Applies and commits one order in its own transaction, retrying
+    # conflicts; returns the realized profit/loss of a sell
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            cost = apply_trade(db.session, account_id, ticker, shares, operation, price)
+            db.session.commit()
+            valuation_engine.record_trade(account_id, ticker.upper(), shares, operation, price, cost)
+            return _realized(shares, operation, price, cost)
+        except Exception as e:
+            db.session.rollback()
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+        time.sleep(retry_delay(attempt))
+
+
+async def execute_trade_async(sessionmaker, account_id, ticker, shares, operation, price):
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            async with sessionmaker() as session, session.begin():
+                cost = await apply_trade_async(session, account_id, ticker, shares, operation, price)
+            valuation_engine.record_trade(account_id, ticker.upper(), shares, operation, price, cost)
+            return _realized(shares, operation, price, cost)
+        except Exception as e:
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+        await asyncio.sleep(retry_delay(attempt))
+
+
+def _record_orders(account_id, orders, rejected):
+    # Applies the committed orders of a batch to the valuation snapshot
+    for index, order in enumerate(orders):
+        if not order.get('error') and index not in rejected:
+            valuation_engine.record_trade(account_id, order['ticker'], order['shares'], order['operation'],
+                                          order['price'], order['cost'])
+
+
+def execute_orders(account_id, orders, atomic):
+    # Applies a batch of priced orders with a single commit, retrying conflicts
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            rejected = apply_orders(db.session, account_id, orders, atomic)
+            db.session.commit()
+            _record_orders(account_id, orders, rejected)
+            return rejected
+        except Exception as e:
+            db.session.rollback()
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+        time.sleep(retry_delay(attempt))
+
+
+async def execute_orders_async(sessionmaker, account_id, orders, atomic):
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            async with sessionmaker() as session, session.begin():
+                rejected = await apply_orders_async(session, account_id, orders, atomic)
+            _record_orders(account_id, orders, rejected)
+            return rejected
+        except Exception as e:
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+        await asyncio.sleep(retry_delay(attempt))
+
+
+def parse_orders(payload, max_orders):
+    """
+    Validates the orders of a batch request.
+
+    Returns (orders, atomic) where each order is a dict with an upper-case
+    ticker, float shares and operation, plus an 'error' for invalid orders.
+    Raises TradeError when the request itself is malformed.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('orders'), list):
+        raise TradeError("Request body must contain a list of orders.")
+
+    mode = payload.get('mode', ALL_OR_NOTHING)
+    if mode not in (ALL_OR_NOTHING, BEST_EFFORT):
+        raise TradeError(f"Mode must be '{ALL_OR_NOTHING}' or '{BEST_EFFORT}'.")
+    if not payload['orders']:
+        raise TradeError("At least one order is required.")
+    if len(payload['orders']) > max_orders:
+        raise TradeError(f"A batch can contain at most {max_orders} orders.")
+
+    orders = []
+    for raw in payload['orders']:
+        raw = raw if isinstance(raw, dict) else {}
+        order = {'ticker': str(raw.get('ticker') or '').strip().upper(),
+                 'operation': str(raw.get('operation') or '').lower()}
+        try:
+            order['shares'] = float(raw.get('shares'))
+        except (TypeError, ValueError):
+            order['shares'] = None
+
+        if not order['ticker']:
+            order['error'] = "Ticker is required."
+        elif order['operation'] not in ('buy', 'sell'):
+            order['error'] = "Operation must be 'buy' or 'sell'."
+        elif order['shares'] is None or order['shares'] <= 0:
+            order['error'] = "Invalid number of shares."
+        orders.append(order)
+
+    return orders, mode == ALL_OR_NOTHING
+
+
+def price_orders(orders, quotes):
+    # Sets each valid order's price from 'quotes' (symbol -> quote data)
+    for order in orders:
+        if order.get('error'):
+            continue
+        quote = quotes.get(order['ticker'])
+        if quote is None:
+            order['error'] = "Instrument data not found."
+        else:
+            order['price'] = quote['current_price']
+
+
+def batch_response(orders, atomic, rejected):
+    # Per-order results and status code of a batch request
+    results = []
+    for index, order in enumerate(orders):
+        error = order.get('error') or rejected.get(index)
+        results.append({
+            'ticker': order['ticker'],
+            'operation': order['operation'],
+            'shares': order['shares'],
+            'price': order.get('price'),
+            'realized_profit_loss': None if error else _realized(order['shares'], order['operation'],
+                                                                 order.get('price'), order.get('cost')),
+            'status': 'failed' if error else 'executed',
+            'error': error
+        })
+
+    executed = sum(1 for r in results if r['status'] == 'executed')
+    if atomic and executed < len(results):
+        # Nothing was committed, so no order of the batch went through
+        for r in results:
+            if r['status'] == 'executed':
+                r['status'] = 'rolled_back'
+                r['realized_profit_loss'] = None
+        executed = 0
+
+    body = {
+        'mode': ALL_OR_NOTHING if atomic else BEST_EFFORT,
+        'executed': executed,
+        'results': results
+    }
+    return body, 201 if executed else 400
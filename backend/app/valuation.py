@@ -0,0 +1,446 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import func, select
+from config import Config
+from .models import db, Portfolio, QueuedOrder
+from .database import read_bind
+from . import services
+
+
+def quotes_by_symbol(instrument_data_list):
+    # Create a dictionary for easy lookup of instrument data by ticker
+    return {data['symbol'].upper(): data for data in instrument_data_list}
+
+
+# Float error left in a cost basis by selling a whole position in parts
+COST_TOLERANCE = 1e-6
+
+
+def _price(instrument_data):
+    # Positions without a usable quote are valued at 0
+    price = (instrument_data or {}).get('current_price')
+    return float(price) if isinstance(price, (int, float)) else 0.0
+
+
+class Valuation:
+    """
+    Market value and unrealized profit/loss of every position.
+
+    Holdings are kept as columns (one NumPy array per field) and priced in a
+    single vectorized pass, so per-position rows and portfolio-wide totals come
+    from the same computation. 'quote_error' is set when quotes could not be
+    fetched, in which case every position is valued at 0.
+
+    A Valuation is never modified once published: trades and price changes
+    produce a copy in which only the affected rows are revalued, so readers
+    can serialize it without locking. 'version' is assigned by the engine.
+    """
+
+    def __init__(self, tickers, shares, cost_basis, instrument_data_dict, quote_error=None):
+        self.tickers = list(tickers)
+        self.names = [instrument_data_dict.get(t, {}).get('name') for t in self.tickers]
+        self.quote_error = quote_error
+        self.version = 0
+
+        # Shares keep their integer dtype so totals serialize like the column
+        self.shares = np.asarray(shares) if self.tickers else np.zeros(0, dtype=np.int64)
+        self.cost_basis = np.asarray(cost_basis, dtype=np.float64)
+        self.prices = np.fromiter((_price(instrument_data_dict.get(t)) for t in self.tickers),
+                                  dtype=np.float64, count=len(self.tickers))
+        self._reindex()
+        self._revalue()
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def _reindex(self):
+        self._index = {ticker: row for row, ticker in enumerate(self.tickers)}
+        # Serialized forms, built on first use
+        self._positions = None
+        self._summary = None
+
+    def _revalue(self, rows=slice(None)):
+        if isinstance(rows, slice):
+            self.market_value = np.empty(len(self.tickers))
+            self.profit_loss = np.empty(len(self.tickers))
+            self.return_rate = np.empty(len(self.tickers))
+
+        self.market_value[rows] = self.prices[rows] * self.shares[rows]
+        self.profit_loss[rows] = self.market_value[rows] - self.cost_basis[rows]
+        # Positions without a cost basis have a return rate of 0
+        cost_basis = self.cost_basis[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(cost_basis > 0, self.profit_loss[rows] / cost_basis * 100, 0.0)
+        self.return_rate[rows] = np.round(rate, 2)
+
+    def _copy(self):
+        copy = object.__new__(Valuation)
+        copy.__dict__.update(self.__dict__)
+        copy.tickers = list(self.tickers)
+        copy.names = list(self.names)
+        for column in ('shares', 'cost_basis', 'prices', 'market_value', 'profit_loss', 'return_rate'):
+            setattr(copy, column, getattr(self, column).copy())
+        copy._positions = None
+        copy._summary = None
+        return copy
+
+    def with_prices(self, instrument_data_dict):
+        # Copy with new quotes applied to the rows they change; self if none do
+        changed = []
+        for ticker, instrument_data in instrument_data_dict.items():
+            row = self._index.get(ticker.upper())
+            if row is None:
+                continue
+            price, name = _price(instrument_data), instrument_data.get('name')
+            if price != self.prices[row] or name != self.names[row]:
+                changed.append((row, price, name))
+
+        if not changed:
+            return self
+
+        valuation = self._copy()
+        rows = np.fromiter((row for row, _, _ in changed), dtype=np.intp, count=len(changed))
+        valuation.prices[rows] = [price for _, price, _ in changed]
+        for row, _, name in changed:
+            valuation.names[row] = name
+        valuation._revalue(rows)
+        return valuation
+
+    def with_trade(self, ticker, shares, cost_basis, price):
+        # Copy with a committed trade applied: 'shares' and 'cost_basis' are
+        # signed deltas, mirroring the guarded updates in trading.py. None
+        # when the snapshot can't be holding what the trade was applied to,
+        # such as a sale of shares it doesn't have, since it missed trades
+        # committed elsewhere
+        row = self._index.get(ticker)
+        if shares < 0 and (row is None or self.shares[row] + shares < 0
+                           or self.cost_basis[row] + cost_basis < -COST_TOLERANCE):
+            return None
+
+        valuation = self._copy()
+        if row is None:
+            # New position, priced at the trade price until quotes refresh it
+            valuation.tickers.append(ticker)
+            valuation.names.append(None)
+            valuation.shares = np.append(valuation.shares, shares)
+            valuation.cost_basis = np.append(valuation.cost_basis, float(cost_basis))
+            valuation.prices = np.append(valuation.prices, float(price))
+            valuation._reindex()
+            valuation._revalue()
+            return valuation
+
+        if valuation.shares[row] + shares == 0:
+            # Remove from portfolio if all shares are sold
+            del valuation.tickers[row]
+            del valuation.names[row]
+            for column in ('shares', 'cost_basis', 'prices', 'market_value', 'profit_loss', 'return_rate'):
+                setattr(valuation, column, np.delete(getattr(valuation, column), row))
+            valuation._reindex()
+            return valuation
+
+        if valuation.shares.dtype.kind == 'i' and shares != int(shares):
+            valuation.shares = valuation.shares.astype(np.float64)
+        valuation.shares[row] += shares
+        valuation.cost_basis[row] += cost_basis
+        valuation._revalue(np.array([row]))
+        return valuation
+
+    def same_as(self, other):
+        # True when both value the same holdings at the same prices
+        return (self.tickers == other.tickers and self.names == other.names
+                and np.array_equal(self.shares, other.shares)
+                and np.array_equal(self.cost_basis, other.cost_basis)
+                and np.array_equal(self.prices, other.prices))
+
+    def positions(self):
+        # Per-position rows of /portfolio
+        if self._positions is None:
+            columns = zip(self.tickers, self.names, self.cost_basis.tolist(), self.shares.tolist(),
+                          self.market_value.tolist(), self.profit_loss.tolist(), self.return_rate.tolist())
+            self._positions = [{
+                'ticker': ticker,
+                'name': name,
+                'total_cost_basis': cost_basis,
+                'shares_owned': shares,
+                'current_market_value': market_value,
+                'unrealized_profit_loss': profit_loss,
+                'unrealized_return_rate': return_rate
+            } for ticker, name, cost_basis, shares, market_value, profit_loss, return_rate in columns]
+        return self._positions
+
+    def summary(self):
+        # Portfolio-wide totals of /portfolio/status
+        if self._summary is None:
+            total_cost_basis = self.cost_basis.sum().item()
+            total_unrealized_profit_loss = self.profit_loss.sum().item()
+            total_unrealized_return_rate = round((
+                (total_unrealized_profit_loss / total_cost_basis) * 100
+                if total_cost_basis > 0 else 0
+            ), 2)
+
+            self._summary = {
+                'total_shares_owned': self.shares.sum().item(),
+                'total_cost_basis': total_cost_basis,
+                'total_current_market_value': self.market_value.sum().item(),
+                'total_unrealized_profit_loss': total_unrealized_profit_loss,
+                'total_unrealized_return_rate': total_unrealized_return_rate
+            }
+        return self._summary
+
+
+def _holdings_query(account_id):
+    # Only the columns valuation needs, without building ORM objects. The
+    # (account_id, ticker) index keeps this to the rows of one account.
+    return (select(Portfolio.ticker, Portfolio.shares_owned, Portfolio.total_cost_basis)
+            .where(Portfolio.account_id == account_id))
+
+
+def _latest_order_query(account_id):
+    # Id of the account's last executed queued order, found through the
+    # (account_id, status, id) index
+    return (select(func.max(QueuedOrder.id))
+            .where(QueuedOrder.account_id == account_id, QueuedOrder.status == 'executed'))
+
+
+def _columns(rows):
+    return tuple(zip(*rows)) if rows else ((), (), ())
+
+
+class _Book:
+    # Snapshot state of one account
+    def __init__(self):
+        self.snapshot = None
+        self.loaded_at = 0.0
+        self.priced_at = 0.0
+        # Last executed queued order the snapshot holds
+        self.order_id = 0
+        # Bumped by every trade so a load racing it is not kept
+        self.generation = 0
+        # Serializes loads so concurrent requests wait for one computation
+        self.lock = threading.Lock()
+
+
+class ValuationEngine:
+    """
+    Keeps a versioned Valuation of each account's portfolio, shared by
+    /portfolio and /portfolio/status.
+
+    Holdings are loaded from the database once and then kept current by
+    committed trades (record_trade), which change only the traded row. Prices
+    are re-checked through the quote cache once they are older than 'ttl'
+    seconds, or pushed in by the quote streamer (update_prices); rows whose
+    quote did not change are left alone. Every change bumps the version, which
+    the routes expose as an ETag, so a client polling an unchanged portfolio
+    gets a 304 without any database or upstream work.
+
+    Snapshots of the 'max_accounts' most recently used accounts are kept. They
+    are per process: holdings are re-read after 'max_age' seconds to pick up
+    trades committed by other workers. With the order queue on, queued orders
+    may be applied by a writer in another process, so every read also looks up
+    the account's last executed order and reloads holdings once it is newer
+    than the snapshot, so a client told an order was executed sees it.
+    """
+
+    def __init__(self, ttl=5.0, max_age=60.0, max_accounts=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_accounts = max_accounts
+        self.track_orders = False
+        self._clock = clock
+        self._lock = threading.Lock()
+        # account id -> _Book, least recently used first
+        self._books = OrderedDict()
+        self._version = 0
+        # Tells ETags of different processes and restarts apart
+        self.token = secrets.token_hex(4)
+
+    def init_app(self, app):
+        self.ttl = app.config['PORTFOLIO_SNAPSHOT_TTL']
+        self.max_age = app.config['PORTFOLIO_SNAPSHOT_MAX_AGE']
+        self.max_accounts = app.config['PORTFOLIO_SNAPSHOT_MAX_ACCOUNTS']
+        self.track_orders = app.config['ORDER_QUEUE_ENABLED']
+        self.token = secrets.token_hex(4)
+        self.invalidate()
+
+    def invalidate(self, account_id=None):
+        # Drops snapshots, e.g. after positions were changed outside trading.py
+        with self._lock:
+            books = self._books.values() if account_id is None else [self._books.get(account_id)]
+            for book in books:
+                if book is not None:
+                    book.snapshot = None
+                    book.generation += 1
+
+    def etag(self, valuation):
+        return f"{self.token}-{valuation.version}"
+
+    def snapshot(self, account_id):
+        # Current Valuation of an account's portfolio; needs an app context
+        latest = 0
+        if self.track_orders:
+            # Read before the holdings, so an order executed meanwhile is
+            # picked up by the next read
+            latest = db.session.execute(_latest_order_query(account_id),
+                                        bind_arguments=read_bind()).scalar() or 0
+        book, valuation, stale, generation = self._check(account_id, latest)
+        if not stale:
+            return valuation
+
+        with book.lock:
+            book, valuation, stale, generation = self._check(account_id, latest)
+            if not stale:
+                return valuation
+
+            if stale == 'prices':
+                try:
+                    instrument_data_list = services.fetch_instrument_data(','.join(valuation.tickers))
+                except Exception as e:
+                    return self._failed(valuation, e)
+                return self._reprice(book, quotes_by_symbol(instrument_data_list)) or valuation
+
+            # From the replica when there is one
+            rows = db.session.execute(_holdings_query(account_id), bind_arguments=read_bind()).all()
+            tickers, shares, cost_basis = _columns(rows)
+            instrument_data_dict, error = {}, None
+            if tickers:
+                # Fetch instrument data for all tickers at once
+                try:
+                    instrument_data_dict = quotes_by_symbol(services.fetch_instrument_data(','.join(tickers)))
+                except Exception as e:
+                    error = e
+            valuation = Valuation(tickers, shares, cost_basis, instrument_data_dict, error)
+            return self._keep(account_id, book, valuation, generation, latest)
+
+    async def snapshot_async(self, session_factory, account_id):
+        # snapshot() for the async app; 'session_factory' opens an AsyncSession
+        latest = 0
+        if self.track_orders:
+            async with session_factory() as session:
+                latest = (await session.execute(_latest_order_query(account_id))).scalar() or 0
+        book, valuation, stale, generation = self._check(account_id, latest)
+        if not stale:
+            return valuation
+
+        if stale == 'prices':
+            try:
+                instrument_data_list = await services.fetch_instrument_data_async(','.join(valuation.tickers))
+            except Exception as e:
+                return self._failed(valuation, e)
+            return self._reprice(book, quotes_by_symbol(instrument_data_list)) or valuation
+
+        async with session_factory() as session:
+            tickers, shares, cost_basis = _columns((await session.execute(_holdings_query(account_id))).all())
+        instrument_data_dict, error = {}, None
+        if tickers:
+            try:
+                instrument_data_dict = quotes_by_symbol(
+                    await services.fetch_instrument_data_async(','.join(tickers)))
+            except Exception as e:
+                error = e
+        valuation = Valuation(tickers, shares, cost_basis, instrument_data_dict, error)
+        return self._keep(account_id, book, valuation, generation, latest)
+
+    def update_prices(self, instrument_data_dict):
+        # Applies fresh quotes to the rows they change in every kept snapshot
+        with self._lock:
+            books = list(self._books.values())
+        for book in books:
+            self._reprice(book, instrument_data_dict)
+
+    def record_trade(self, account_id, ticker, shares, operation, price, cost, order_id=None):
+        # Applies a committed trade, which added or removed 'cost' from the
+        # position's cost basis, to the snapshot instead of reloading it.
+        # 'order_id' is the queued order it executed, if any
+        with self._lock:
+            book = self._books.get(account_id)
+            if book is None:
+                return
+            book.generation += 1
+            if book.snapshot is None:
+                return
+            sign = 1 if operation == 'buy' else -1
+            if float(shares).is_integer():
+                shares = int(shares)
+            new_position = ticker not in book.snapshot._index
+            valuation = book.snapshot.with_trade(ticker, sign * shares, sign * cost, price)
+            if valuation is None:
+                # Reloaded from the database on the next read
+                book.snapshot = None
+                return
+            self._publish(book, valuation)
+            if order_id is not None:
+                book.order_id = max(book.order_id, order_id)
+            if new_position:
+                # Fetch the name and current price on the next read
+                book.priced_at = 0.0
+
+    def _check(self, account_id, latest=0):
+        # (book, snapshot, what needs refreshing if anything, generation);
+        # 'latest' is the account's last executed queued order
+        with self._lock:
+            book = self._books.get(account_id)
+            if book is None:
+                book = self._books[account_id] = _Book()
+                while len(self._books) > self.max_accounts:
+                    self._books.popitem(last=False)
+            self._books.move_to_end(account_id)
+
+            now = self._clock()
+            valuation = book.snapshot
+            if valuation is None or now >= book.loaded_at + self.max_age or latest > book.order_id:
+                return book, valuation, 'holdings', book.generation
+            if valuation.tickers and now >= book.priced_at + self.ttl:
+                return book, valuation, 'prices', book.generation
+            return book, valuation, None, book.generation
+
+    def _reprice(self, book, instrument_data_dict):
+        # Returns the repriced snapshot of 'book', None if it has none
+        with self._lock:
+            if book.snapshot is None:
+                return None
+            valuation = book.snapshot.with_prices(instrument_data_dict)
+            if valuation is not book.snapshot:
+                self._publish(book, valuation)
+            book.priced_at = self._clock()
+            return valuation
+
+    def _keep(self, account_id, book, valuation, generation, latest=0):
+        with self._lock:
+            if (valuation.quote_error is not None or self.ttl <= 0 or generation != book.generation
+                    or self._books.get(account_id) is not book):
+                # Not kept: quotes failed, caching is off, a trade raced the
+                # load or the account was evicted meanwhile
+                self._version += 1
+                valuation.version = self._version
+                return valuation
+
+            if book.snapshot is not None and book.snapshot.same_as(valuation):
+                # Nothing moved since the last load, keep the version (and ETag)
+                valuation = book.snapshot
+            else:
+                self._publish(book, valuation)
+            book.loaded_at = book.priced_at = self._clock()
+            book.order_id = max(book.order_id, latest)
+            return valuation
+
+    def _failed(self, valuation, error):
+        # Positions are valued at 0 while quotes are failing, as on a first load
+        failed = Valuation(valuation.tickers, valuation.shares, valuation.cost_basis, {}, error)
+        with self._lock:
+            self._version += 1
+            failed.version = self._version
+        return failed
+
+    def _publish(self, book, valuation):
+        # Caller must hold the lock
+        self._version += 1
+        valuation.version = self._version
+        book.snapshot = valuation
+
+
+valuation_engine = ValuationEngine(ttl=Config.PORTFOLIO_SNAPSHOT_TTL,
+                                   max_age=Config.PORTFOLIO_SNAPSHOT_MAX_AGE,
+                                   max_accounts=Config.PORTFOLIO_SNAPSHOT_MAX_ACCOUNTS)
@@ -0,0 +1,89 @@
+"""
+Show that per-account reads stay proportional to the size of that account,
+not to the number of positions and transactions stored for all accounts.
+
+Seeds SQLite databases with a growing number of accounts of the same size and
+times the portfolio and first transactions page queries of one account:
+
+    python -m benchmarks.accounts --accounts 100 1000 10000 --positions 20
+"""
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+from werkzeug.datastructures import MultiDict
+from app.app import create_app
+from app.models import db, Account, Portfolio, Transaction
+from app.pagination import transactions_query
+from app.valuation import _holdings_query
+from config import Config
+
+
+def seed(accounts, positions, transactions):
+    now = datetime.datetime(2024, 1, 1)
+    db.session.execute(db.insert(Account), [
+        {'id': account_id, 'name': f"account-{account_id}", 'created_at': now}
+        for account_id in range(2, accounts + 2)])
+    for account_id in range(2, accounts + 2):
+        db.session.execute(db.insert(Portfolio), [
+            {'account_id': account_id, 'ticker': f"T{i:04d}", 'shares_owned': 10, 'total_cost_basis': 1000.0}
+            for i in range(positions)])
+        db.session.execute(db.insert(Transaction), [
+            {'account_id': account_id, 'ticker': f"T{i % positions:04d}", 'shares': 1, 'operation': 'buy',
+             'price': 100.0, 'date': now + datetime.timedelta(minutes=i)}
+            for i in range(transactions)])
+    db.session.commit()
+
+
+def measure(statement, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        db.session.execute(statement).all()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def plan(statement):
+    # SQLite's query plan, showing which index serves the query
+    compiled = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return '; '.join(row[-1] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--accounts', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--positions', type=int, default=20)
+    parser.add_argument('--transactions', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{args.positions} positions and {args.transactions} transactions per account")
+    print(f"{'accounts':>9} {'positions':>10} {'portfolio':>11} {'transactions':>13}")
+    for accounts in args.accounts:
+        class BenchmarkConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'accounts.db')}"
+            QUOTE_PROVIDER = "synthetic"
+
+        app = create_app(BenchmarkConfig)
+        with app.app_context():
+            seed(accounts, args.positions, args.transactions)
+            # An account in the middle of the key range
+            account_id = 2 + accounts // 2
+            holdings = _holdings_query(account_id)
+            page, _ = transactions_query(account_id, MultiDict({'limit': '50'}))
+
+            print(f"{accounts:>9} {accounts * args.positions:>10} "
+                  f"{measure(holdings, args.rounds):>8.3f} ms {measure(page, args.rounds):>10.3f} ms")
+            plans = plan(holdings), plan(page)
+            db.engine.dispose()
+
+    print(f"portfolio plan:    {plans[0]}")
+    print(f"transactions plan: {plans[1]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Time price alert evaluation per quote refresh against a million alerts.
+
+Indexes the alerts in an AlertEngine, then moves every symbol's price by a
+random step per tick and times taking out the alerts the new prices reach.
+For comparison, it also times checking every alert on a few ticks, which is
+what evaluation costs without the sorted per-symbol index:
+
+    python -m benchmarks.alerts --alerts 1000000 --symbols 500 --ticks 200
+"""
+import argparse
+import random
+import statistics
+import time
+from app.alerts import AlertEngine
+
+
+def seed(alerts, symbols, rng):
+    # Alerts up to 30% away from each symbol's starting price of 100
+    prices = {f"S{i:04d}": 100.0 for i in range(symbols)}
+    tickers = list(prices)
+    rows = []
+    for alert_id in range(1, alerts + 1):
+        price = 100.0 * (1 + rng.choice((-1, 1)) * rng.uniform(0.001, 0.3))
+        rows.append((alert_id, alert_id % 1000, rng.choice(tickers), 'above' if price > 100 else 'below', price))
+    return prices, rows
+
+
+def scan(rows, fired, quotes):
+    # Every alert checked against the quote of its symbol
+    triggered = []
+    for alert_id, _, ticker, direction, price in rows:
+        if alert_id in fired:
+            continue
+        current = quotes[ticker]['current_price']
+        if (current >= price) if direction == 'above' else (current <= price):
+            triggered.append(alert_id)
+    return triggered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--alerts', type=int, default=1000000)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--scan-ticks', type=int, default=3)
+    parser.add_argument('--volatility', type=float, default=0.002, help="standard deviation of a tick's return")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    prices, rows = seed(args.alerts, args.symbols, rng)
+    engine = AlertEngine()
+    start = time.perf_counter()
+    engine.add(rows)
+    print(f"{args.alerts} alerts on {args.symbols} symbols indexed in {time.perf_counter() - start:.2f}s")
+
+    samples, fired = [], set()
+    for tick in range(args.ticks):
+        for symbol in prices:
+            prices[symbol] *= 1 + rng.gauss(0, args.volatility)
+        quotes = {symbol: {'current_price': price} for symbol, price in prices.items()}
+        if tick < args.scan_ticks:
+            started = time.perf_counter()
+            scanned = scan(rows, fired, quotes)
+            scan_time = time.perf_counter() - started
+        started = time.perf_counter()
+        triggered = engine.match(quotes)
+        samples.append((time.perf_counter() - started, len(triggered)))
+        if tick < args.scan_ticks:
+            assert sorted(a['id'] for a in triggered) == sorted(scanned)
+            print(f"tick {tick}: scan {scan_time * 1000:8.1f} ms, index {samples[-1][0] * 1000:6.2f} ms, "
+                  f"{len(triggered)} triggered")
+        fired.update(a['id'] for a in triggered)
+
+    times = sorted(t for t, _ in samples)
+    print(f"{args.ticks} ticks: median={statistics.median(times) * 1000:.2f} ms  "
+          f"p99={times[int(len(times) * 0.99) - 1] * 1000:.2f} ms  "
+          f"{sum(k for _, k in samples) / len(samples):.0f} triggered per tick, {len(engine)} alerts left")
+
+
+if __name__ == '__main__':
+    main()
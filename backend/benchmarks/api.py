@@ -0,0 +1,178 @@
+"""
+Time the API hot paths end to end at several database sizes and keep the
+results as JSON, so a regression shows up as a diff between two commits.
+
+Each size gets a fresh in-memory database seeded with the given number of
+positions (one lot each) and transactions, and the synthetic quote provider
+behind a warm quote cache. Every endpoint is called through the Flask test
+client, so routing, the ORM and JSON encoding are all part of the numbers:
+
+    python -m benchmarks.api --transactions 100,10000,1000000 --positions 10,1000
+    python -m benchmarks.api --baseline instance/benchmarks/<commit>.json
+
+Results go to --output (instance/benchmarks/<commit>.json by default). With
+--baseline, medians more than --threshold slower than the baseline's are
+reported and the exit status is 1.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from app.app import create_app
+from app.models import db, Lot, Portfolio, Transaction
+from config import Config
+
+ACCOUNT_ID = Config.DEFAULT_ACCOUNT_ID
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    QUOTE_PROVIDER = "synthetic"
+    SYNTHETIC_LATENCY_MS = 0
+    SYNTHETIC_ERROR_RATE = 0
+    QUOTE_CACHE_TTL = 3600
+    QUOTE_CACHE_MAX_SIZE = 100000
+    PRICE_HISTORY_DIR = ''
+    METRICS_ENABLED = False
+
+
+def seed(transactions, positions):
+    tickers = [f"T{i:05d}" for i in range(positions)]
+    opened = datetime.datetime(2020, 1, 1)
+    db.session.execute(db.insert(Portfolio), [
+        {'account_id': ACCOUNT_ID, 'ticker': ticker, 'shares_owned': 1000000, 'total_cost_basis': 1e8}
+        for ticker in tickers])
+    db.session.execute(db.insert(Lot), [
+        {'account_id': ACCOUNT_ID, 'ticker': ticker, 'shares': 1000000, 'price': 100.0, 'opened_at': opened}
+        for ticker in tickers])
+    for offset in range(0, transactions, 100000):
+        db.session.execute(db.insert(Transaction), [
+            {'account_id': ACCOUNT_ID, 'ticker': tickers[i % positions], 'shares': 1 + i % 3,
+             'operation': 'sell' if i % 4 == 3 else 'buy', 'price': 100.0 + i % 17,
+             'date': opened + datetime.timedelta(minutes=i)}
+            for i in range(offset, min(offset + 100000, transactions))])
+    db.session.commit()
+    return tickers
+
+
+def cases(client, tickers):
+    # name -> function making one call; each asserts its own success
+    def call(method, url, **kwargs):
+        response = client.open(url, method=method, **kwargs)
+        assert response.status_code < 300, (url, response.status_code, response.get_data(as_text=True))
+
+    ticker = tickers[len(tickers) // 2]
+    return {
+        'search_instrument': lambda: call('GET', f'/api/instruments/search?ticker={ticker}'),
+        'buy': lambda: call('POST', '/api/transactions/buy', json={'ticker': ticker, 'shares': 1}),
+        'sell': lambda: call('POST', '/api/transactions/sell', json={'ticker': ticker, 'shares': 1}),
+        'get_transactions': lambda: call('GET', '/api/transactions?limit=50'),
+        'get_transactions_by_ticker': lambda: call('GET', f'/api/transactions?limit=50&ticker={ticker}'),
+        'get_portfolio': lambda: call('GET', '/api/portfolio'),
+        'get_portfolio_status': lambda: call('GET', '/api/portfolio/status'),
+    }
+
+
+def measure(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'rounds': rounds,
+        'median_ms': statistics.median(samples) * 1000,
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        'max_ms': samples[-1] * 1000
+    }
+
+
+def run(transactions, positions, rounds):
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        tickers = seed(transactions, positions)
+        client = app.test_client()
+        results = []
+        for name, fn in cases(client, tickers).items():
+            fn()  # Warm the quote cache and the valuation snapshot
+            result = {'name': name, 'transactions': transactions, 'positions': positions}
+            result.update(measure(fn, rounds))
+            results.append(result)
+        db.drop_all()
+    return results
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def regressions(results, baseline, threshold):
+    # (result, baseline median) of results more than 'threshold' slower
+    before = {(r['name'], r['transactions'], r['positions']): r['median_ms'] for r in baseline['results']}
+    slower = []
+    for result in results:
+        median = before.get((result['name'], result['transactions'], result['positions']))
+        if median is not None and result['median_ms'] > median * (1 + threshold):
+            slower.append((result, median))
+    return slower
+
+
+def sizes(value):
+    return [int(size) for size in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=sizes, default=[100, 10000, 1000000])
+    parser.add_argument('--positions', type=sizes, default=[10, 1000])
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--output', help="JSON file to write the results to")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    report = {
+        'commit': commit(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': []
+    }
+    for transactions in args.transactions:
+        for positions in args.positions:
+            print(f"{transactions} transactions, {positions} positions, {args.rounds} rounds")
+            for result in run(transactions, positions, args.rounds):
+                report['results'].append(result)
+                print(f"  {result['name']:<27} median={result['median_ms']:8.2f} ms  "
+                      f"p95={result['p95_ms']:8.2f} ms  max={result['max_ms']:8.2f} ms")
+
+    output = args.output or os.path.join(Config.INSTANCE_DIR, 'benchmarks', f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = regressions(report['results'], baseline, args.threshold)
+        for result, median in slower:
+            print(f"REGRESSION {result['name']} ({result['transactions']} transactions, "
+                  f"{result['positions']} positions): {median:.2f} -> {result['median_ms']:.2f} ms")
+        print(f"{len(slower)} regressions against {baseline['commit']} (threshold {args.threshold:.0%})")
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Time a worker cold start: a fresh interpreter importing the app, building it
+with create_app() and serving its first request, as gunicorn does when a
+worker is added.
+
+Compares the development defaults, which migrate the schema and set up the
+Swagger UI in every worker, with the production settings, which leave both to
+a one-off 'db-upgrade' and 'swagger-export' before the workers start. Also
+times the first /apispec_1.json request with the spec parsed from the route
+docstrings against one read from an exported file:
+
+    python -m benchmarks.cold_start --rounds 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Run in each fresh interpreter; prints the time of each phase in ms
+WORKER = """
+import json, time
+started = time.perf_counter()
+from app.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+assert client.get('/api/portfolio').status_code == 200
+served = time.perf_counter()
+docs = None
+if app.config['SWAGGER_ENABLED']:
+    assert client.get('/apispec_1.json').status_code == 200
+    docs = (time.perf_counter() - served) * 1000
+print(json.dumps({'import': (imported - started) * 1000, 'create_app': (created - imported) * 1000,
+                  'first request': (served - created) * 1000, 'first spec': docs}))
+"""
+
+PHASES = ('import', 'create_app', 'first request', 'first spec')
+
+
+def cold_start(env):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', WORKER], env=env, capture_output=True, text=True,
+                            check=True).stdout
+    phases = json.loads(output.splitlines()[-1])
+    phases['total'] = (time.perf_counter() - start) * 1000
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    spec = os.path.join(directory, 'swagger.json')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(directory, 'cold_start.db')}",
+               QUOTE_PROVIDER='synthetic',
+               PRICE_HISTORY_DIR='')
+    flask = [sys.executable, '-m', 'flask', '--app', 'app.app']
+    subprocess.run(flask + ['db-upgrade'], env=env, check=True, capture_output=True)
+    subprocess.run(flask + ['swagger-export', spec], env=env, check=True, capture_output=True)
+
+    variants = {
+        'defaults': dict(env, AUTO_MIGRATE='true', SWAGGER_ENABLED='true'),
+        'no migrate': dict(env, AUTO_MIGRATE='false', SWAGGER_ENABLED='true'),
+        'exported spec': dict(env, AUTO_MIGRATE='false', SWAGGER_ENABLED='true', SWAGGER_SPEC_PATH=spec),
+        'no swagger': dict(env, AUTO_MIGRATE='false', SWAGGER_ENABLED='false'),
+    }
+    print(f"Median of {args.rounds} cold starts, in ms")
+    print(f"{'':<14}" + ''.join(f"{phase:>15}" for phase in PHASES + ('total',)))
+    for label, variant_env in variants.items():
+        runs = [cold_start(variant_env) for _ in range(args.rounds)]
+        medians = []
+        for phase in PHASES + ('total',):
+            values = [run[phase] for run in runs if run[phase] is not None]
+            medians.append(f"{statistics.median(values):15.1f}" if values else f"{'-':>15}")
+        print(f"{label:<14}" + ''.join(medians))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Time OHLC history queries against a large per-symbol price history.
+
+Writes a synthetic tick every few seconds for the requested span straight
+into the column files, then times a full-range daily query and a one-day
+five-minute query:
+
+    python -m benchmarks.history --ticks 5000000 --rounds 20
+"""
+import argparse
+import datetime
+import statistics
+import tempfile
+import time
+import numpy as np
+from app.history import PriceHistory, TIME_DTYPE, PRICE_DTYPE
+
+
+def seed(directory, ticks, spacing):
+    # A random walk starting on 2024-01-01 with one tick every 'spacing' seconds
+    start = int(datetime.datetime(2024, 1, 1).timestamp() * 1000)
+    times = start + np.arange(ticks, dtype=TIME_DTYPE) * spacing * 1000
+    prices = 100 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.0005, ticks)))
+    times.astype(TIME_DTYPE).tofile(f"{directory}/BENCH.time")
+    prices.astype(PRICE_DTYPE).tofile(f"{directory}/BENCH.price")
+    return datetime.datetime.fromtimestamp(int(times[ticks // 2]) / 1000)
+
+
+def measure(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, max(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ticks', type=int, default=5000000)
+    parser.add_argument('--spacing', type=int, default=6, help="seconds between ticks")
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    middle = seed(directory, args.ticks, args.spacing)
+    history = PriceHistory(directory)
+
+    queries = {
+        'all, 1d': lambda: history.bars('BENCH', interval='1d'),
+        'one day, 5m': lambda: history.bars('BENCH', middle, middle + datetime.timedelta(days=1), '5m'),
+    }
+    print(f"{args.ticks} ticks every {args.spacing}s, {args.rounds} rounds")
+    for label, fn in queries.items():
+        bars = len(fn()[1])
+        median, worst = measure(fn, args.rounds)
+        print(f"{label:<12} {bars:6d} bars  median={median:8.1f} ms  max={worst:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Closed-loop HTTP load test reporting requests/second and latency percentiles.
+
+Load an already running server:
+
+    python -m benchmarks.load_test --url http://127.0.0.1:5000/api/instruments/search?ticker=AAPL
+
+Or start the sync (gunicorn) and async (uvicorn) apps side by side against the
+synthetic quote provider and compare them:
+
+    python -m benchmarks.load_test --compare --concurrency 200 --latency-ms 100
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def load(url, concurrency, duration):
+    # Each simulated client holds one keep-alive connection. Plain asyncio
+    # streams keep the load generator cheap enough to share a box with the server.
+    target = urlsplit(url)
+    path = target.path + (f"?{target.query}" if target.query else '')
+    request = (f"GET {path} HTTP/1.1\r\nHost: {target.netloc}\r\n"
+               f"Connection: keep-alive\r\n\r\n").encode()
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop():
+        nonlocal errors
+        reader = writer = None
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(target.hostname, target.port)
+                writer.write(request)
+                status, headers = await read_head(reader)
+                body_length = int(headers.get('content-length', 0))
+                await reader.readexactly(body_length)
+                if status >= 500:
+                    errors += 1
+                if headers.get('connection') == 'close':
+                    writer.close()
+                    writer = None
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                writer = None
+            latencies.append(time.perf_counter() - start)
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return len(latencies), errors, elapsed, sorted(latencies)
+
+
+async def read_head(reader):
+    # Status code and lower-cased headers of an HTTP/1.1 response
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            return status, headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+def report(label, count, errors, elapsed, latencies):
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000 if latencies else 0
+
+    print(f"{label:<10} {count / elapsed:9.1f} req/s  p50={pct(50):8.1f} ms  "
+          f"p99={pct(99):8.1f} ms  errors={errors}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spawn(command, port, env):
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Wait for the server to accept connections
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Server did not start: {' '.join(command)}")
+
+
+def compare(args):
+    database = os.path.join(tempfile.mkdtemp(), 'load_test.db')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{database}",
+               QUOTE_PROVIDER='synthetic',
+               SYNTHETIC_LATENCY_MS=str(args.latency_ms),
+               # Every request pays the upstream latency, as on a cold cache
+               QUOTE_CACHE_TTL='0',
+               AUTO_MIGRATE='false')
+    # Once up front, so the workers of either server don't race to create tables
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app.app', 'db-upgrade'], env=env, check=True)
+
+    servers = {
+        'sync': lambda port: [sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{port}",
+                              '--workers', str(args.workers), '--threads', str(args.threads),
+                              'app.app:create_app()'],
+        'async': lambda port: [sys.executable, '-m', 'uvicorn', '--factory', 'app.asgi:create_app',
+                               '--port', str(port), '--workers', str(args.workers),
+                               '--log-level', 'warning'],
+    }
+
+    print(f"{args.path} with {args.concurrency} clients for {args.duration}s, "
+          f"{args.latency_ms} ms upstream latency, {args.workers} worker(s)")
+    for label, command in servers.items():
+        port = free_port()
+        process = spawn(command(port), port, env)
+        try:
+            url = f"http://127.0.0.1:{port}{args.path}"
+            asyncio.run(load(url, args.concurrency, 1))  # Warm up
+            report(label, *asyncio.run(load(url, args.concurrency, args.duration)))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help="URL to load when not using --compare")
+    parser.add_argument('--compare', action='store_true',
+                        help="start the sync and async apps and load both")
+    parser.add_argument('--path', default='/api/instruments/search?ticker=AAPL')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--latency-ms', type=float, default=100)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8,
+                        help="gunicorn threads per sync worker, as in the Dockerfile")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args)
+    elif args.url:
+        report('load', *asyncio.run(load(args.url, args.concurrency, args.duration)))
+    else:
+        parser.error("either --url or --compare is required")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Compare trade throughput on a SQLite file with and without the order queue.
+
+Runs several worker processes, as gunicorn would, each posting buys and sells
+to /api/transactions/buy and /sell through its own app. The direct run
+commits every trade in its own transaction; the queued run sets
+ORDER_QUEUE_ENABLED, so the trades are queued and applied by the one writer
+holding the lock. Throughput counts an order once it is applied, so the queued
+run also waits for the writer to drain the queue:
+
+    python -m benchmarks.order_queue --workers 4 --orders 2000 --sell-ratio 0.25
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+TICKERS = ['AAPL', 'MSFT', 'TSLA', 'AMZN']
+
+
+def worker(env, count, sell_ratio, ready, go, done):
+    os.environ.update(env)
+    from app.app import create_app
+    client = create_app().test_client()
+    # Warm the quote cache, and own some shares of every ticker to sell
+    for ticker in TICKERS:
+        client.post('/api/transactions/buy', json={'ticker': ticker, 'shares': count})
+    ready.release()
+    go.wait()
+    sells = 0
+    for i in range(count):
+        ticker = TICKERS[i % len(TICKERS)]
+        sell = sells < sell_ratio * (i + 1)
+        sells += sell
+        response = client.post(f"/api/transactions/{'sell' if sell else 'buy'}",
+                               json={'ticker': ticker, 'shares': 1})
+        assert response.status_code in (201, 202), response.get_data(as_text=True)
+    ready.release()
+    # Stays up like a gunicorn worker, so its writer thread keeps draining
+    done.wait()
+
+
+def applied(database):
+    with sqlite3.connect(database, timeout=30) as conn:
+        return conn.execute('SELECT COUNT(*) FROM "transaction"').fetchone()[0]
+
+
+def run(label, args, env):
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'orders.db')
+    env = dict(env, DATABASE_URL=f"sqlite:///{database}",
+               ORDER_QUEUE_LOCK_PATH=os.path.join(directory, 'order-writer.lock'))
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app.app', 'db-upgrade'],
+                   env=dict(os.environ, **env), check=True, capture_output=True)
+
+    per_worker = args.orders // args.workers
+    ready = multiprocessing.Semaphore(0)
+    go = multiprocessing.Event()
+    done = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=worker,
+                                       args=(env, per_worker, args.sell_ratio, ready, go, done))
+               for _ in range(args.workers)]
+    for process in workers:
+        process.start()
+    for _ in workers:
+        ready.acquire()
+    # The warm-up trades of every worker, applied before starting the clock
+    expected = len(TICKERS) * args.workers
+    while applied(database) < expected:
+        time.sleep(0.01)
+
+    start = time.perf_counter()
+    go.set()
+    for _ in workers:
+        ready.acquire()
+    accepted = time.perf_counter() - start
+    expected += per_worker * args.workers
+    while applied(database) < expected:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    done.set()
+    for process in workers:
+        process.join()
+    print(f"{label:<8} {per_worker * args.workers / elapsed:9.1f} orders/s applied  "
+          f"(accepted in {accepted:.2f}s, applied in {elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--sell-ratio', type=float, default=0.25)
+    args = parser.parse_args()
+
+    env = {'QUOTE_PROVIDER': 'synthetic', 'PRICE_HISTORY_DIR': '', 'AUTO_MIGRATE': 'false',
+           'METRICS_ENABLED': 'false'}
+    print(f"{args.orders} orders ({args.sell_ratio:.0%} sells) from {args.workers} workers")
+    run('direct', args, dict(env, ORDER_QUEUE_ENABLED='false'))
+    run('queued', args, dict(env, ORDER_QUEUE_ENABLED='true'))
+
+
+if __name__ == '__main__':
+    main()
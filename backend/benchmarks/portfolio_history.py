@@ -0,0 +1,87 @@
+"""
+Time /portfolio/history over a long transaction history: a 30-day range
+replayed from the first transaction against one replayed from the nearest
+checkpoint.
+
+Seeds an in-memory database with one account trading every few minutes for
+the requested number of transactions, ending a week ago:
+
+    python -m benchmarks.portfolio_history --transactions 1000000 --rounds 5
+"""
+import argparse
+import datetime
+import statistics
+import tempfile
+import time
+from app.app import create_app
+from app.models import db, PortfolioCheckpoint, Transaction
+from app.performance import equity_curve
+from config import Config
+
+ACCOUNT_ID = Config.DEFAULT_ACCOUNT_ID
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    QUOTE_PROVIDER = "synthetic"
+    PRICE_HISTORY_DIR = tempfile.mkdtemp()
+
+
+def seed(transactions, spacing):
+    end = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=7), datetime.time())
+    start = end - datetime.timedelta(minutes=spacing * transactions)
+    for offset in range(0, transactions, 100000):
+        db.session.execute(db.insert(Transaction), [
+            {'account_id': ACCOUNT_ID, 'ticker': f"T{i % 50:02d}", 'shares': 1 + i % 3,
+             'operation': 'sell' if i % 4 == 3 else 'buy', 'price': 100.0 + i % 17,
+             'date': start + datetime.timedelta(minutes=spacing * i)}
+            for i in range(offset, min(offset + 100000, transactions))])
+    db.session.commit()
+    return end.date()
+
+
+def measure(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, max(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--spacing', type=int, default=5, help="minutes between transactions")
+    parser.add_argument('--interval', type=int, default=Config.PORTFOLIO_CHECKPOINT_INTERVAL,
+                        help="transactions between checkpoints")
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        last_day = seed(args.transactions, args.spacing)
+        first_day = last_day - datetime.timedelta(days=29)
+
+        def from_start():
+            db.session.query(PortfolioCheckpoint).delete()
+            equity_curve(db.session, ACCOUNT_ID, first_day, last_day, args.transactions + 1)
+
+        def from_checkpoint():
+            equity_curve(db.session, ACCOUNT_ID, first_day, last_day, args.interval)
+
+        # Takes the checkpoints
+        equity_curve(db.session, ACCOUNT_ID, first_day - datetime.timedelta(days=1), last_day,
+                     args.interval)
+        db.session.commit()
+        checkpoints = PortfolioCheckpoint.query.count()
+
+        print(f"30 days of {args.transactions} transactions, {checkpoints} checkpoints, {args.rounds} rounds")
+        for label, fn in (('from start', from_start), ('checkpoint', from_checkpoint)):
+            median, worst = measure(fn, args.rounds)
+            db.session.rollback()
+            print(f"{label:<11} median={median:8.1f} ms  max={worst:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
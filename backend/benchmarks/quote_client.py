@@ -0,0 +1,111 @@
+"""
+Compare quote fetch latency with a new connection per request (the old
+module-level requests.get) against the pooled keep-alive QuoteClient.
+
+Runs against a local stub server, so no network or API key is needed:
+
+    python -m benchmarks.quote_client --requests 2000 --concurrency 8
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from app.quote_client import QuoteClient
+
+QUOTE_RESPONSE = json.dumps({
+    "quoteResponse": {
+        "result": [{
+            "symbol": "AAPL",
+            "longName": "Apple Inc.",
+            "bid": 227.5,
+            "ask": 227.6,
+            "regularMarketPrice": 227.55,
+            "regularMarketChange": 1.25,
+            "regularMarketChangePercent": 0.55
+        }]
+    }
+}).encode()
+
+
+class StubQuoteHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment so keep-alive isn't skewed by
+    # Nagle's algorithm interacting with delayed ACKs
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(QUOTE_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(QUOTE_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubQuoteHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(fetch, total, concurrency):
+    def timed(_):
+        start = time.perf_counter()
+        fetch()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, range(total)))
+
+
+def report(label, samples):
+    print(f"{label:<28} p50={percentile(samples, 50):7.3f} ms  "
+          f"p99={percentile(samples, 99):7.3f} ms  "
+          f"mean={statistics.mean(samples):7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v6/finance/quote"
+    params = {"symbols": "AAPL"}
+
+    client = QuoteClient(url, pool_size=args.concurrency)
+
+    # Warm up both paths so the first connection isn't counted
+    requests.get(url, params=params, timeout=5).json()
+    client.get_json(params)
+
+    unpooled = run(lambda: requests.get(url, params=params, timeout=5).json(),
+                   args.requests, args.concurrency)
+    pooled = run(lambda: client.get_json(params), args.requests, args.concurrency)
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    report("requests.get (no session)", unpooled)
+    report("QuoteClient (pooled)", pooled)
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Time /portfolio plus /portfolio/status for a large portfolio: the old
+per-endpoint query-and-loop valuation against one shared vectorized snapshot.
+
+Quotes come from the synthetic provider through a warm quote cache, so the
+numbers are the database read and valuation cost only:
+
+    python -m benchmarks.valuation --positions 10000 --rounds 20
+"""
+import argparse
+import statistics
+import time
+from app.app import create_app
+from app.models import db, Portfolio
+from app.services import fetch_instrument_data
+from app.valuation import quotes_by_symbol, valuation_engine
+from config import Config
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    QUOTE_PROVIDER = "synthetic"
+    SYNTHETIC_LATENCY_MS = 0
+    SYNTHETIC_ERROR_RATE = 0
+    QUOTE_CACHE_TTL = 3600
+    QUOTE_CACHE_MAX_SIZE = 100000
+
+
+def seed(positions):
+    db.session.execute(db.insert(Portfolio), [
+        {'account_id': Config.DEFAULT_ACCOUNT_ID, 'ticker': f"T{i:05d}", 'shares_owned': 1 + i % 500, 'total_cost_basis': 100.0 * (1 + i % 500)}
+        for i in range(positions)])
+    db.session.commit()
+
+
+def legacy_pair():
+    # What the two endpoints did before: each one loads ORM rows, fetches
+    # quotes and loops over every position in Python
+    portfolio = Portfolio.query.filter_by(account_id=Config.DEFAULT_ACCOUNT_ID).all()
+    quotes = quotes_by_symbol(fetch_instrument_data(','.join(p.ticker for p in portfolio)))
+    rows = []
+    for p in portfolio:
+        instrument_data = quotes.get(p.ticker, {})
+        value = instrument_data.get('current_price', 0.0) * p.shares_owned
+        pl = value - p.total_cost_basis
+        rows.append({'ticker': p.ticker, 'name': instrument_data.get('name'),
+                     'total_cost_basis': p.total_cost_basis, 'shares_owned': p.shares_owned,
+                     'current_market_value': value, 'unrealized_profit_loss': pl,
+                     'unrealized_return_rate': round(pl / p.total_cost_basis * 100, 2)})
+
+    portfolio = Portfolio.query.filter_by(account_id=Config.DEFAULT_ACCOUNT_ID).all()
+    quotes = quotes_by_symbol(fetch_instrument_data(','.join(p.ticker for p in portfolio)))
+    totals = [0, 0.0, 0.0]
+    for p in portfolio:
+        value = quotes.get(p.ticker, {}).get('current_price', 0.0) * p.shares_owned
+        totals[0] += p.shares_owned
+        totals[1] += p.total_cost_basis
+        totals[2] += value
+    return rows, totals
+
+
+def engine_pair():
+    # Cold snapshot: the first endpoint loads it and the second one reuses it
+    valuation_engine.invalidate()
+    rows = valuation_engine.snapshot(Config.DEFAULT_ACCOUNT_ID).positions()
+    return rows, valuation_engine.snapshot(Config.DEFAULT_ACCOUNT_ID).summary()
+
+
+def measure(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, max(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--positions', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        seed(args.positions)
+        legacy_pair()  # Warm the quote cache
+
+        print(f"/portfolio + /portfolio/status, {args.positions} positions, {args.rounds} rounds")
+        for label, fn in (('legacy', legacy_pair), ('vectorized', engine_pair)):
+            median, worst = measure(fn, args.rounds)
+            print(f"{label:<11} median={median:8.1f} ms  max={worst:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
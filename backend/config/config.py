@@ -1,4 +1,8 @@
 import os
+from dotenv import load_dotenv
+
+# Load settings such as the API key from backend/.env
+load_dotenv()
 
 class Config:
     # Set the base directory to the current directory
@@ -6,11 +10,142 @@ class Config:
     # Define the path to the instance folder in the parent directory
     INSTANCE_DIR = os.path.join(BASE_DIR, '..', 'instance')
     
-    # Create the instance directory if it does not exist
-    os.makedirs(INSTANCE_DIR, exist_ok=True)
-    
     # Set the database URI to the instance folder
     DATABASE_PATH = os.path.join(INSTANCE_DIR, 'rocketfin.db')
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", f"sqlite:///{DATABASE_PATH}")
     
+    # Optional read replica of DATABASE_URL serving /api/transactions and the
+    # portfolio valuation; trades always go to DATABASE_URL
+    DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+
+    # Connection pool of a database server (SQLite keeps SQLAlchemy's
+    # defaults): connections kept open and opened on top of them under load,
+    # seconds to wait for a free one, and the age in seconds after which one
+    # is reopened. Pre-ping tests each connection as it is checked out, so
+    # ones dropped by the server or a proxy are replaced instead of failing
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    # Postgres cancels statements running longer than this many milliseconds
+    # (0 for no limit)
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+    # Prepared statement reuse: executions before psycopg (postgresql+psycopg)
+    # prepares a statement, and statements cached per asyncpg connection. 0
+    # turns them off, as needed behind PgBouncer in transaction mode
+    DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", 5))
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Create tables and apply pending migrations in create_app. Turn off when
+    # 'flask --app app.app db-upgrade' runs once before the workers start
+    AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() == "true"
+
+    # Swagger UI at /apidocs/, and an optional spec file written by
+    # 'flask --app app.app swagger-export' to serve instead of parsing the
+    # route docstrings on the first request
+    SWAGGER_ENABLED = os.getenv("SWAGGER_ENABLED", "true").lower() == "true"
+    SWAGGER_SPEC_PATH = os.getenv("SWAGGER_SPEC_PATH", "")
+
+    # Account used by requests without an X-Account-Id header; created by the
+    # accounts migration and owning everything recorded before accounts existed
+    DEFAULT_ACCOUNT_ID = int(os.getenv("DEFAULT_ACCOUNT_ID", 1))
+
+    # Quote cache: seconds a quote stays fresh and the max number of symbols kept
+    QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", 5))
+    QUOTE_CACHE_MAX_SIZE = int(os.getenv("QUOTE_CACHE_MAX_SIZE", 1024))
+    # Seconds the portfolio valuation reuses its prices before re-checking
+    # quotes, and before re-reading holdings committed by other workers
+    PORTFOLIO_SNAPSHOT_TTL = float(os.getenv("PORTFOLIO_SNAPSHOT_TTL", QUOTE_CACHE_TTL))
+    PORTFOLIO_SNAPSHOT_MAX_AGE = float(os.getenv("PORTFOLIO_SNAPSHOT_MAX_AGE", 60))
+    # Accounts whose snapshot is kept in memory, least recently used dropped first
+    PORTFOLIO_SNAPSHOT_MAX_ACCOUNTS = int(os.getenv("PORTFOLIO_SNAPSHOT_MAX_ACCOUNTS", 1024))
+    # Transactions replayed by /portfolio/history between stored checkpoints of
+    # an account's positions, and the longest range it returns, in days
+    PORTFOLIO_CHECKPOINT_INTERVAL = int(os.getenv("PORTFOLIO_CHECKPOINT_INTERVAL", 5000))
+    PORTFOLIO_HISTORY_MAX_DAYS = int(os.getenv("PORTFOLIO_HISTORY_MAX_DAYS", 3660))
+
+    # Listing of symbols and company names behind /api/instruments/autocomplete,
+    # re-read when it changes (checked every SYMBOL_LISTING_CHECK_INTERVAL seconds)
+    SYMBOL_LISTING_PATH = os.getenv("SYMBOL_LISTING_PATH",
+                                    os.path.join(BASE_DIR, '..', 'app', 'data', 'symbols.csv'))
+    SYMBOL_LISTING_CHECK_INTERVAL = float(os.getenv("SYMBOL_LISTING_CHECK_INTERVAL", 60))
+
+    # Directory of the per-symbol price history recorded from every quote fetch
+    # (empty to disable) and the most bars /instruments/<ticker>/history returns
+    PRICE_HISTORY_DIR = os.getenv("PRICE_HISTORY_DIR", os.path.join(INSTANCE_DIR, 'history'))
+    PRICE_HISTORY_MAX_BARS = int(os.getenv("PRICE_HISTORY_MAX_BARS", 2000))
+
+    # Market data provider: 'yahoo' (live API), 'synthetic' (generated in
+    # process) or 'replay' (recorded quote JSON served from disk)
+    QUOTE_PROVIDER = os.getenv("QUOTE_PROVIDER", "yahoo")
+    YAHOO_FINANCE_API_KEY = os.getenv("YAHOO_FINANCE_API_KEY")
+    # Directory to save raw Yahoo responses to, for later use with 'replay'
+    QUOTE_RECORD_DIR = os.getenv("QUOTE_RECORD_DIR")
+    # JSON file or directory of files served by the 'replay' provider
+    QUOTE_REPLAY_PATH = os.getenv("QUOTE_REPLAY_PATH")
+    # Added latency, fraction of failing fetches and seed for 'synthetic'
+    SYNTHETIC_LATENCY_MS = float(os.getenv("SYNTHETIC_LATENCY_MS", 0))
+    SYNTHETIC_ERROR_RATE = float(os.getenv("SYNTHETIC_ERROR_RATE", 0))
+    SYNTHETIC_SEED = int(os.getenv("SYNTHETIC_SEED", 0))
+
+    # Quote provider HTTP client: timeouts in seconds, retries with backoff and
+    # a circuit breaker that fails fast after consecutive failures
+    QUOTE_CONNECT_TIMEOUT = float(os.getenv("QUOTE_CONNECT_TIMEOUT", 3.05))
+    QUOTE_READ_TIMEOUT = float(os.getenv("QUOTE_READ_TIMEOUT", 5))
+    QUOTE_MAX_RETRIES = int(os.getenv("QUOTE_MAX_RETRIES", 2))
+    QUOTE_BACKOFF_BASE = float(os.getenv("QUOTE_BACKOFF_BASE", 0.2))
+    QUOTE_BACKOFF_MAX = float(os.getenv("QUOTE_BACKOFF_MAX", 5))
+    QUOTE_POOL_SIZE = int(os.getenv("QUOTE_POOL_SIZE", 10))
+    QUOTE_BREAKER_THRESHOLD = int(os.getenv("QUOTE_BREAKER_THRESHOLD", 5))
+    QUOTE_BREAKER_RESET_TIMEOUT = float(os.getenv("QUOTE_BREAKER_RESET_TIMEOUT", 30))
+
+    # Background quote streamer: seconds between refreshes, extra tickers to
+    # refresh besides held ones, and whether to keep refreshing while no client
+    # is subscribed to /api/quotes/stream
+    QUOTE_STREAM_INTERVAL = float(os.getenv("QUOTE_STREAM_INTERVAL", 5))
+    QUOTE_STREAM_WATCHLIST = [s for s in os.getenv("QUOTE_STREAM_WATCHLIST", "").split(",") if s]
+    QUOTE_STREAM_ALWAYS_ON = os.getenv("QUOTE_STREAM_ALWAYS_ON", "false").lower() == "true"
+    # Seconds between keep-alive comments on idle streams
+    QUOTE_STREAM_HEARTBEAT = float(os.getenv("QUOTE_STREAM_HEARTBEAT", 15))
+
+    # How a sale's cost basis is taken from its position: 'fifo' (the oldest
+    # lots first) or 'average' (the average cost of the position)
+    COST_BASIS_METHOD = os.getenv("COST_BASIS_METHOD", "fifo")
+
+    # Serve Prometheus metrics at /metrics and time requests, quote provider
+    # calls and SQL statements for them
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # Sampling profiler for the Flask app: profiles a PROFILE_SAMPLE_RATE
+    # fraction of requests plus any request carrying the PROFILE_HEADER
+    # header, taking a stack sample every PROFILE_INTERVAL seconds, and writes
+    # them to PROFILE_DIR (flask --app app.app profile-report summarizes them)
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.001))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(INSTANCE_DIR, 'profiles'))
+
+    # Write-ahead order queue for SQLite deployments: /api/transactions/buy and
+    # /sell store the priced order and answer 202 with an id to poll at
+    # /api/orders/<id>, and one writer applies up to ORDER_QUEUE_BATCH_SIZE
+    # queued orders per commit. ORDER_QUEUE_WRITER starts a writer thread in
+    # each worker, of which only the one holding ORDER_QUEUE_LOCK_PATH drains;
+    # turn it off to run 'flask --app app.app order-writer' on its own instead
+    ORDER_QUEUE_ENABLED = os.getenv("ORDER_QUEUE_ENABLED", "false").lower() == "true"
+    ORDER_QUEUE_WRITER = os.getenv("ORDER_QUEUE_WRITER", "true").lower() == "true"
+    ORDER_QUEUE_BATCH_SIZE = int(os.getenv("ORDER_QUEUE_BATCH_SIZE", 500))
+    # Seconds the writer waits for orders queued by other workers
+    ORDER_QUEUE_POLL_INTERVAL = float(os.getenv("ORDER_QUEUE_POLL_INTERVAL", 0.05))
+    ORDER_QUEUE_LOCK_PATH = os.getenv("ORDER_QUEUE_LOCK_PATH", os.path.join(INSTANCE_DIR, 'order-writer.lock'))
+    # SQLite syncs every commit to disk ('FULL'); 'NORMAL' only syncs at WAL
+    # checkpoints, which is faster but lets a power loss undo orders and
+    # trades already acknowledged
+    ORDER_QUEUE_SQLITE_SYNCHRONOUS = os.getenv("ORDER_QUEUE_SQLITE_SYNCHRONOUS", "FULL")
+
+    # Transactions per page of /api/transactions when no limit is given
+    TRANSACTIONS_PAGE_SIZE = int(os.getenv("TRANSACTIONS_PAGE_SIZE", 50))
+
+    # Largest number of orders accepted by /api/transactions/batch
+    BATCH_MAX_ORDERS = int(os.getenv("BATCH_MAX_ORDERS", 500))
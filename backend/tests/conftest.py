@@ -0,0 +1,41 @@
+import os
+import pytest
+from app import create_app, db
+from config import Config
+
+
+class TestingConfig(Config):
+    TESTING = True
+    # Keep tests off the development database
+    SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    # Serve recorded quotes so tests don't need the network or an API key
+    QUOTE_PROVIDER = "replay"
+    QUOTE_REPLAY_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'quotes.json')
+    # Record no price history into the instance folder
+    PRICE_HISTORY_DIR = ''
+
+
+class FakeClock:
+    # Clock for the caches and clients that take one, moved by setting 'now'
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def config():
+    # Config the app fixture is created from; modules override it with a subclass
+    return TestingConfig
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+    with app.app_context():
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,52 @@
+from app.models import Portfolio, Transaction
+from config import Config
+
+
+def create_account(client, name):
+    response = client.post('/api/accounts', json={'name': name})
+    assert response.status_code == 201
+    return {'X-Account-Id': str(response.json['id'])}
+
+def test_create_account(client):
+    response = client.post('/api/accounts', json={'name': 'alice'})
+    assert response.status_code == 201
+    assert response.json['name'] == 'alice'
+    assert response.json['id'] != Config.DEFAULT_ACCOUNT_ID
+
+    assert client.post('/api/accounts', json={'name': 'alice'}).status_code == 409
+    assert client.post('/api/accounts', json={'name': ' '}).status_code == 400
+
+def test_unknown_account(client):
+    for value in ('999', 'abc', '-1'):
+        response = client.get('/api/portfolio', headers={'X-Account-Id': value})
+        assert response.status_code == 404
+        assert response.json['error'] == 'Account not found.'
+
+def test_accounts_are_isolated(client):
+    alice = create_account(client, 'alice')
+    bob = create_account(client, 'bob')
+
+    client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 10}, headers=alice)
+    client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 3}, headers=bob)
+    # Bob can't sell shares only Alice owns
+    response = client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 5}, headers=bob)
+    assert response.status_code == 400
+
+    assert client.get('/api/portfolio', headers=alice).json[0]['shares_owned'] == 10
+    assert client.get('/api/portfolio/status', headers=bob).json['total_shares_owned'] == 3
+    assert client.get('/api/portfolio').json == []
+    assert client.get('/api/instruments/search?ticker=AAPL', headers=bob).json['shares_owned'] == 3
+    assert len(client.get('/api/transactions', headers=alice).json) == 1
+
+    assert Portfolio.query.count() == 2
+    assert Transaction.query.filter_by(ticker='AAPL').count() == 2
+
+def test_batch_is_scoped_to_account(client):
+    alice = create_account(client, 'alice')
+    response = client.post('/api/transactions/batch', headers=alice, json={'orders': [
+        {'ticker': 'MSFT', 'operation': 'buy', 'shares': 2}
+    ]})
+    assert response.status_code == 201
+
+    assert client.get('/api/portfolio', headers=alice).json[0]['ticker'] == 'MSFT'
+    assert client.get('/api/portfolio').json == []
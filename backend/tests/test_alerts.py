@@ -0,0 +1,136 @@
+import datetime
+import pytest
+from sqlalchemy import update
+from app import db
+from app.alerts import AlertEngine, alert_engine
+from app.models import PriceAlert
+from app.streamer import quote_streamer
+from config import Config
+from .conftest import TestingConfig
+
+
+class AlertsConfig(TestingConfig):
+    QUOTE_STREAM_HEARTBEAT = 0.01
+
+@pytest.fixture
+def config():
+    return AlertsConfig
+
+@pytest.fixture(autouse=True)
+def manual_refresh(monkeypatch):
+    # Refreshes are driven by hand
+    monkeypatch.setattr(quote_streamer, 'start', lambda: None)
+
+def quote(price):
+    return {'current_price': price}
+
+def test_match_takes_only_reached_alerts():
+    engine = AlertEngine()
+    engine.add([(1, 7, 'AAPL', 'above', 100.0), (2, 7, 'AAPL', 'above', 110.0),
+                (3, 8, 'AAPL', 'below', 90.0), (4, 8, 'AAPL', 'below', 80.0),
+                (5, 7, 'AAPL', 'above', 100.0), (6, 7, 'MSFT', 'below', 300.0)])
+    assert engine.match({'AAPL': quote(95.0), 'MSFT': quote(None)}) == []
+
+    triggered = engine.match({'AAPL': quote(105.0)})
+    assert sorted(a['id'] for a in triggered) == [1, 5]
+    assert triggered[0] == {'id': triggered[0]['id'], 'account_id': 7, 'ticker': 'AAPL', 'direction': 'above',
+                            'price': 100.0, 'triggered_price': 105.0}
+    # Alerts fire once
+    assert engine.match({'AAPL': quote(105.0)}) == []
+    assert [a['id'] for a in engine.match({'AAPL': quote(85.0)})] == [3]
+    assert len(engine) == 3
+
+    engine.remove(PriceAlert(id=6, ticker='MSFT', direction='below', price=300.0))
+    assert engine.symbols() == {'AAPL'}
+    assert sorted(a['id'] for a in engine.match({'AAPL': quote(200.0)}) + engine.match({'AAPL': quote(1.0)})) == [2, 4]
+    assert (len(engine), engine.symbols()) == (0, set())
+
+def test_alerts_trigger_on_refresh_and_are_pushed(client):
+    assert client.post('/api/alerts', json={'ticker': 'aapl', 'direction': 'up', 'price': 1}).status_code == 400
+    assert client.post('/api/alerts', json={'ticker': 'AAPL', 'direction': 'above', 'price': -1}).status_code == 400
+    reached = client.post('/api/alerts', json={'ticker': 'aapl', 'direction': 'above', 'price': 200}).json
+    client.post('/api/alerts', json={'ticker': 'AAPL', 'direction': 'above', 'price': 300})
+    deleted = client.post('/api/alerts', json={'ticker': 'MSFT', 'direction': 'below', 'price': 500}).json
+    other = {'X-Account-Id': str(client.post('/api/accounts', json={'name': 'other'}).json['id'])}
+    client.post('/api/alerts', json={'ticker': 'TSLA', 'direction': 'below', 'price': 250}, headers=other)
+    assert (reached['ticker'], reached['status']) == ('AAPL', 'active')
+    assert client.delete(f"/api/alerts/{deleted['id']}", headers=other).status_code == 404
+    assert client.delete(f"/api/alerts/{deleted['id']}").status_code == 204
+
+    subscription = alert_engine.subscribe(Config.DEFAULT_ACCOUNT_ID)
+    quote_streamer.refresh()
+    pushed = subscription.get_nowait()
+    assert (pushed['id'], pushed['triggered_price']) == (reached['id'], 227.55)
+    assert subscription.empty()
+    alert_engine.unsubscribe(Config.DEFAULT_ACCOUNT_ID, subscription)
+
+    triggered = client.get('/api/alerts?status=triggered').json
+    assert [(a['id'], a['triggered_price']) for a in triggered] == [(reached['id'], 227.55)]
+    assert [a['price'] for a in client.get('/api/alerts?status=active').json] == [300]
+    assert client.get('/api/alerts', headers=other).json[0]['status'] == 'triggered'
+    assert len(alert_engine) == 1
+
+def test_alerts_recorded_by_another_worker_are_pushed(client):
+    first = client.post('/api/alerts', json={'ticker': 'AAPL', 'direction': 'above', 'price': 200}).json
+    second = client.post('/api/alerts', json={'ticker': 'AAPL', 'direction': 'above', 'price': 210}).json
+    subscription = alert_engine.subscribe(Config.DEFAULT_ACCOUNT_ID)
+    # Another worker's refresh reached the first alert before this one's
+    db.session.execute(update(PriceAlert).where(PriceAlert.id == first['id'])
+                       .values(status='triggered', triggered_price=230.0, triggered_at=datetime.datetime.now()))
+    db.session.commit()
+
+    quote_streamer.refresh()
+    quote_streamer.refresh()
+    pushed = [subscription.get_nowait() for _ in range(2)]
+    assert subscription.empty()
+    alert_engine.unsubscribe(Config.DEFAULT_ACCOUNT_ID, subscription)
+    assert sorted((a['id'], a['triggered_price']) for a in pushed) == [(first['id'], 230.0),
+                                                                      (second['id'], 227.55)]
+    triggered = client.get('/api/alerts?status=triggered').json
+    assert sorted((a['id'], a['triggered_price']) for a in triggered) == [(first['id'], 230.0),
+                                                                         (second['id'], 227.55)]
+
+def test_every_worker_pushes_each_alert_once(app):
+    alert = PriceAlert(account_id=Config.DEFAULT_ACCOUNT_ID, ticker='AAPL', direction='above', price=200.0)
+    db.session.add(alert)
+    db.session.commit()
+    workers = [AlertEngine(), AlertEngine()]
+    subscriptions = []
+    for engine in workers:
+        engine.sync(db.session)
+        subscriptions.append(engine.subscribe(Config.DEFAULT_ACCOUNT_ID))
+
+    # The second worker's quote reaches the alert a refresh later, after the
+    # first worker recorded it
+    for prices in ((227.55, 190.0), (227.55, 227.55)):
+        for engine, price in zip(workers, prices):
+            engine.evaluate(db.session, {'AAPL': quote(price)})
+
+    for subscription in subscriptions:
+        pushed = subscription.get_nowait()
+        assert (pushed['id'], pushed['triggered_price']) == (alert.id, 227.55)
+        assert subscription.empty()
+
+def test_alert_stream(client):
+    response = client.get('/api/alerts/stream')
+    assert response.mimetype == 'text/event-stream'
+    assert next(response.response) == b": keep-alive\n\n"
+    client.post('/api/alerts', json={'ticker': 'MSFT', 'direction': 'above', 'price': 400})
+    quote_streamer.refresh()
+    event = next(response.response)
+    response.close()
+    assert event.startswith(b'id: 1\nevent: alert\ndata: {"id": 1, "ticker": "MSFT"')
+
+def test_watchlist(client):
+    assert client.post('/api/watchlist', json={'ticker': 'tsla'}).status_code == 201
+    assert client.post('/api/watchlist', json={'ticker': 'TSLA'}).status_code == 409
+    assert client.post('/api/watchlist', json={}).status_code == 400
+    assert client.get('/api/watchlist').json[0]['quote'] is None
+
+    # Watched tickers are refreshed by the streamer without being held
+    quote_streamer.refresh()
+    assert client.get('/api/watchlist').json[0]['quote']['current_price'] == 249.02
+
+    assert client.delete('/api/watchlist/tsla').status_code == 204
+    assert client.delete('/api/watchlist/tsla').status_code == 404
+    assert client.get('/api/watchlist').json == []
@@ -0,0 +1,64 @@
+import json
+import os
+import sys
+from sqlalchemy import inspect
+from app import create_app, db
+from .conftest import TestingConfig
+
+def test_import_creates_no_app():
+    assert not hasattr(sys.modules['app.app'], 'app')
+
+def test_schema_left_to_db_upgrade():
+    class NoMigrateConfig(TestingConfig):
+        AUTO_MIGRATE = False
+
+    app = create_app(NoMigrateConfig)
+    with app.app_context():
+        assert inspect(db.engine).get_table_names() == []
+        result = app.test_cli_runner().invoke(args=['db-upgrade'])
+        assert 'schema version' in result.output
+        assert 'transaction' in inspect(db.engine).get_table_names()
+        db.drop_all()
+
+def test_creates_sqlite_directory(tmp_path):
+    class FileConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'new' / 'rocketfin.db'}"
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        assert os.path.exists(tmp_path / 'new' / 'rocketfin.db')
+        db.session.remove()
+        db.engine.dispose()
+
+def test_swagger_disabled():
+    class NoSwaggerConfig(TestingConfig):
+        SWAGGER_ENABLED = False
+
+    app = create_app(NoSwaggerConfig)
+    with app.app_context():
+        client = app.test_client()
+        assert client.get('/apidocs/').status_code == 404
+        assert client.get('/apispec_1.json').status_code == 404
+        db.drop_all()
+
+def test_exported_swagger_spec(tmp_path):
+    path = tmp_path / 'swagger.json'
+    app = create_app(TestingConfig)
+    with app.app_context():
+        result = app.test_cli_runner().invoke(args=['swagger-export', str(path)])
+        assert result.exit_code == 0, result.output
+        db.drop_all()
+
+    spec = json.loads(path.read_text())
+    assert '/api/portfolio' in spec['paths']
+    spec['info']['title'] = 'Exported'
+    path.write_text(json.dumps(spec))
+
+    class ExportedSpecConfig(TestingConfig):
+        SWAGGER_SPEC_PATH = str(path)
+
+    app = create_app(ExportedSpecConfig)
+    with app.app_context():
+        response = app.test_client().get('/apispec_1.json')
+        assert response.json['info']['title'] == 'Exported'
+        db.drop_all()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import sqlite3
+import pytest
+from app.asgi import create_app
+from app.async_db import async_database_url
+from .conftest import TestingConfig
+
+
+def run_client(scenario, config=TestingConfig):
+    # Runs 'scenario(client)' against a freshly started ASGI app
+    async def main():
+        app = create_app(config)
+        async with app.test_app() as test_app:
+            return await scenario(test_app.test_client())
+    return asyncio.run(main())
+
+
+def test_async_database_url():
+    assert async_database_url('sqlite:///rocketfin.db') == 'sqlite+aiosqlite:///rocketfin.db'
+    assert async_database_url('postgresql://u@h/db') == 'postgresql+asyncpg://u@h/db'
+    assert async_database_url('postgresql+psycopg2://u@h/db') == 'postgresql+asyncpg://u@h/db'
+
+def test_schema_left_to_db_upgrade(tmp_path):
+    path = tmp_path / 'rocketfin.db'
+
+    class NoMigrateConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+        AUTO_MIGRATE = False
+
+    async def scenario(client):
+        return (await client.get('/api/instruments/autocomplete?q=a')).status_code
+
+    assert run_client(scenario, NoMigrateConfig) == 200
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall() == []
+    connection.close()
+
+def test_search_instrument():
+    async def scenario(client):
+        response = await client.get('/api/instruments/search?ticker=aapl')
+        return response.status_code, await response.get_json()
+
+    status, data = run_client(scenario)
+    assert status == 200
+    assert data['current_price'] == 227.55
+    assert data['shares_owned'] == 0
+
+def test_search_instrument_invalid_ticker():
+    async def scenario(client):
+        response = await client.get('/api/instruments/search?ticker=INVALID')
+        return await response.get_json()
+
+    assert run_client(scenario)['error'] == 'Instrument data not found.'
+
+def test_buy_sell_and_portfolio():
+    async def scenario(client):
+        buy = await client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 10})
+        sell = await client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 4})
+        oversell = await client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 100})
+        portfolio = await (await client.get('/api/portfolio')).get_json()
+        status = await (await client.get('/api/portfolio/status')).get_json()
+        transactions = await (await client.get('/api/transactions?limit=1')).get_json()
+        return buy.status_code, sell.status_code, oversell.status_code, portfolio, status, transactions
+
+    buy, sell, oversell, portfolio, status, transactions = run_client(scenario)
+    assert (buy, sell, oversell) == (201, 201, 400)
+    assert portfolio[0]['ticker'] == 'AAPL'
+    assert portfolio[0]['shares_owned'] == 6
+    assert portfolio[0]['current_market_value'] == pytest.approx(227.55 * 6)
+    assert status['total_shares_owned'] == 6
+    assert len(transactions) == 1
+    assert transactions[0]['operation'] == 'sell'
+
+def test_buy_invalid_shares():
+    async def scenario(client):
+        response = await client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': -5})
+        return response.status_code, await response.get_json()
+
+    status, data = run_client(scenario)
+    assert status == 400
+    assert data['error'] == 'Invalid number of shares.'
+
+def test_empty_portfolio():
+    async def scenario(client):
+        portfolio = await (await client.get('/api/portfolio')).get_json()
+        status = await (await client.get('/api/portfolio/status')).get_json()
+        return portfolio, status
+
+    assert run_client(scenario) == ([], [])
+
+def test_batch_orders():
+    async def scenario(client):
+        response = await client.post('/api/transactions/batch', json={'orders': [
+            {'ticker': 'AAPL', 'operation': 'buy', 'shares': 10},
+            {'ticker': 'AAPL', 'operation': 'sell', 'shares': 12}
+        ]})
+        rolled_back = response.status_code, await response.get_json()
+        response = await client.post('/api/transactions/batch', json={'mode': 'best_effort', 'orders': [
+            {'ticker': 'AAPL', 'operation': 'buy', 'shares': 10},
+            {'ticker': 'AAPL', 'operation': 'sell', 'shares': 12}
+        ]})
+        partial = response.status_code, await response.get_json()
+        portfolio = await (await client.get('/api/portfolio')).get_json()
+        return rolled_back, partial, portfolio
+
+    rolled_back, partial, portfolio = run_client(scenario)
+    assert rolled_back[0] == 400
+    assert [r['status'] for r in rolled_back[1]['results']] == ['rolled_back', 'failed']
+    assert partial[0] == 201
+    assert partial[1]['executed'] == 1
+    assert portfolio[0]['shares_owned'] == 10
+
+def test_portfolio_etag():
+    async def scenario(client):
+        await client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 10})
+        first = await client.get('/api/portfolio/status')
+        etag = first.headers['ETag']
+        second = await client.get('/api/portfolio/status', headers={'If-None-Match': etag})
+        return etag, second.status_code
+
+    etag, status = run_client(scenario)
+    assert etag.startswith('W/')
+    assert status == 304
+
+def test_accounts_are_isolated():
+    async def scenario(client):
+        account = await (await client.post('/api/accounts', json={'name': 'alice'})).get_json()
+        headers = {'X-Account-Id': str(account['id'])}
+        await client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 10}, headers=headers)
+        mine = await (await client.get('/api/portfolio', headers=headers)).get_json()
+        default = await (await client.get('/api/portfolio')).get_json()
+        missing = await client.get('/api/portfolio', headers={'X-Account-Id': '999'})
+        return mine, default, missing.status_code
+
+    mine, default, missing = run_client(scenario)
+    assert mine[0]['shares_owned'] == 10
+    assert default == []
+    assert missing == 404
+
+def test_portfolio_history():
+    async def scenario(client):
+        await client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 2})
+        history = await client.get('/api/portfolio/history')
+        invalid = await client.get('/api/portfolio/history?start=2024-02-01&end=2024-01-01')
+        return await history.get_json(), invalid.status_code
+
+    points, invalid = run_client(scenario)
+    assert len(points) == 1
+    assert points[0]['cost_basis'] == 2 * 227.55
+    assert invalid == 400
+
+def test_import_and_export():
+    async def scenario(client):
+        body = ("ticker,shares,operation,price,date\n"
+                "AAPL,10,buy,100,2023-01-02\n"
+                "AAPL,4,sell,130,2023-01-09\n")
+        imported = await client.post('/api/transactions/import', data=body,
+                                     headers={'Content-Type': 'text/csv'})
+        invalid = await client.post('/api/transactions/import', data='ticker\n',
+                                    headers={'Content-Type': 'text/csv'})
+        portfolio = await client.get('/api/portfolio')
+        export = await client.get('/api/transactions/export?format=ndjson')
+        return (imported.status_code, invalid.status_code, await portfolio.get_json(),
+                await export.get_data(as_text=True))
+
+    imported, invalid, portfolio, export = run_client(scenario)
+    assert (imported, invalid) == (201, 400)
+    assert portfolio[0]['shares_owned'] == 6
+    assert portfolio[0]['total_cost_basis'] == 600
+    rows = [json.loads(line) for line in export.splitlines()]
+    assert [row['operation'] for row in rows] == ['sell', 'buy']
+    assert rows[0]['realized_profit_loss'] == 4 * 130 - 4 * 100
@@ -0,0 +1,113 @@
+import datetime
+import io
+import json
+import pytest
+from sqlalchemy import event, select
+from app import db
+from app.bulk import import_transactions, CSV
+from app.models import Lot, Portfolio, PortfolioCheckpoint, Transaction
+from config import Config
+
+ACCOUNT_ID = Config.DEFAULT_ACCOUNT_ID
+
+HISTORY = ("ticker,shares,operation,price,date\n"
+           "AAPL,10,buy,100,2023-01-02T10:00:00\n"
+           "aapl,5,buy,120,2023-01-03\n"
+           "AAPL,12,sell,150,2023-02-01T12:00:00\n"
+           "MSFT,3,buy,250.5,2023-01-05\n")
+
+def position(ticker, account_id=ACCOUNT_ID):
+    return db.session.execute(select(Portfolio).where(Portfolio.account_id == account_id,
+                                                      Portfolio.ticker == ticker)).scalar()
+
+def test_import_csv_with_historical_prices(client):
+    response = client.post('/api/transactions/import', data=HISTORY, content_type='text/csv')
+    assert response.status_code == 201
+    assert response.json == {'imported': 4, 'earliest': '2023-01-02T10:00:00'}
+
+    # FIFO: the sale takes all 10 shares at 100 and 2 at 120
+    sale = db.session.execute(select(Transaction).where(Transaction.operation == 'sell')).scalar()
+    assert sale.price == 150
+    assert sale.realized_profit_loss == 12 * 150 - (10 * 100 + 2 * 120)
+    assert (position('AAPL').shares_owned, position('AAPL').total_cost_basis) == (3, 360)
+    assert [(lot.shares, lot.price) for lot in Lot.query.filter_by(ticker='AAPL')] == [(3, 120)]
+    assert position('MSFT').total_cost_basis == 3 * 250.5
+
+def test_backdated_import_replays_existing_trades(client):
+    client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 4})
+    db.session.add(PortfolioCheckpoint(account_id=ACCOUNT_ID, as_of=datetime.datetime(2023, 6, 1),
+                                       positions='{}'))
+    db.session.commit()
+
+    body = "ticker,shares,operation,price,date\nAAPL,2,buy,50,2022-06-01\n"
+    assert client.post('/api/transactions/import', data=body, content_type='text/csv').status_code == 201
+    assert position('AAPL').shares_owned == 6
+    assert position('AAPL').total_cost_basis == 2 * 50 + 4 * 227.55
+    assert PortfolioCheckpoint.query.count() == 0
+
+    # The oldest lot, from the import, is sold first
+    response = client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 2})
+    assert response.json['realized_profit_loss'] == pytest.approx(2 * 227.55 - 2 * 50)
+
+def test_import_ndjson(client):
+    lines = [{'ticker': 'TSLA', 'shares': 2, 'operation': 'buy', 'price': 200, 'date': '2023-01-02'},
+             {'ticker': 'TSLA', 'shares': 1, 'operation': 'sell', 'price': 250, 'date': '2023-01-03'}]
+    body = '\n'.join(json.dumps(line) for line in lines) + '\n'
+    response = client.post('/api/transactions/import', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 201
+    assert position('TSLA').shares_owned == 1
+
+@pytest.mark.parametrize('body, error', [
+    ("ticker,shares,price,date\n", "Line 1: Missing columns: operation."),
+    ("ticker,shares,operation,price,date\nAAPL,1,buy,100,2023-01-02\nAAPL,-1,buy,100,2023-01-02\n",
+     "Line 3: Invalid number of shares."),
+    ("ticker,shares,operation,price,date\nAAPL,1,hold,100,2023-01-02\n",
+     "Line 2: Operation must be 'buy' or 'sell'."),
+    ("ticker,shares,operation,price,date\nAAPL,1,buy,100,2999-01-02\n", "Line 2: Date is in the future."),
+    ("ticker,shares,operation,price,date\n", "No transactions to import."),
+    ("ticker,shares,operation,price,date\nAAPL,1,buy,100,2023-01-02\nAAPL,2,sell,100,2023-01-03\n",
+     "Selling 2 AAPL on 2023-01-03T00:00:00 exceeds the 1 shares owned then."),
+])
+def test_invalid_import_changes_nothing(client, body, error):
+    response = client.post('/api/transactions/import', data=body, content_type='text/csv')
+    assert response.status_code == 400
+    assert response.json['error'] == error
+    assert Transaction.query.count() == 0
+    assert Portfolio.query.count() == 0
+
+def test_export_and_import_round_trip(client):
+    client.post('/api/transactions/import', data=HISTORY, content_type='text/csv')
+
+    response = client.get('/api/transactions/export?format=csv')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'attachment' in response.headers['Content-Disposition']
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,ticker,shares,operation,price,date,realized_profit_loss'
+    assert len(lines) == 5
+
+    other = {'X-Account-Id': str(client.post('/api/accounts', json={'name': 'copy'}).json['id'])}
+    response = client.post('/api/transactions/import', data='\n'.join(lines), content_type='text/csv',
+                           headers=other)
+    assert response.json['imported'] == 4
+    copied = position('AAPL', int(other['X-Account-Id']))
+    assert (copied.shares_owned, copied.total_cost_basis) == (3, 360)
+
+    response = client.get('/api/transactions/export?format=ndjson&ticker=msft')
+    [row] = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert row['ticker'] == 'MSFT' and row['price'] == 250.5 and row['realized_profit_loss'] is None
+    assert client.get('/api/transactions/export?format=xml').status_code == 400
+
+def test_import_inserts_in_chunks(app):
+    inserts = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO "transaction"'):
+            inserts.append(len(parameters) if executemany else 1)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        import_transactions(db.session, ACCOUNT_ID, io.StringIO(HISTORY), CSV, chunk_size=3)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert inserts == [3, 1]
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.cache import QuoteCache
+from .conftest import FakeClock
+
+
+def make_loader(calls):
+    def loader(symbols):
+        calls.append(list(symbols))
+        return {s: {'symbol': s, 'current_price': 100.0} for s in symbols if s != 'INVALID'}
+    return loader
+
+
+def test_hit_after_miss():
+    calls = []
+    cache = QuoteCache(ttl=5, clock=FakeClock())
+    loader = make_loader(calls)
+
+    cache.get_many(['AAPL'], loader)
+    quotes = cache.get_many(['AAPL'], loader)
+
+    assert quotes['AAPL']['current_price'] == 100.0
+    assert calls == [['AAPL']]
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+def test_misses_are_batched():
+    calls = []
+    cache = QuoteCache(ttl=5, clock=FakeClock())
+    loader = make_loader(calls)
+
+    cache.get_many(['AAPL'], loader)
+    quotes = cache.get_many(['AAPL', 'MSFT', 'TSLA'], loader)
+
+    assert set(quotes) == {'AAPL', 'MSFT', 'TSLA'}
+    assert calls == [['AAPL'], ['MSFT', 'TSLA']]
+
+def test_expired_entry_is_refetched():
+    calls = []
+    clock = FakeClock()
+    cache = QuoteCache(ttl=5, clock=clock)
+    loader = make_loader(calls)
+
+    cache.get_many(['AAPL'], loader)
+    clock.now = 6
+    cache.get_many(['AAPL'], loader)
+
+    assert len(calls) == 2
+    assert cache.stats()['stale'] == 1
+
+def test_least_recently_used_is_evicted():
+    calls = []
+    cache = QuoteCache(ttl=5, max_size=2, clock=FakeClock())
+    loader = make_loader(calls)
+
+    cache.get_many(['AAPL', 'MSFT'], loader)
+    cache.get_many(['AAPL'], loader)  # MSFT is now least recently used
+    cache.get_many(['TSLA'], loader)
+    cache.get_many(['AAPL', 'MSFT'], loader)
+
+    assert calls[-1] == ['MSFT']
+    assert cache.stats()['size'] == 2
+
+def test_unknown_symbols_are_not_cached():
+    calls = []
+    cache = QuoteCache(ttl=5, clock=FakeClock())
+    loader = make_loader(calls)
+
+    assert cache.get_many(['INVALID'], loader) == {}
+    cache.get_many(['INVALID'], loader)
+    assert len(calls) == 2
+
+def test_concurrent_misses_share_one_upstream_call():
+    calls = []
+    release = threading.Event()
+    cache = QuoteCache(ttl=5)
+
+    def slow_loader(symbols):
+        calls.append(list(symbols))
+        release.wait(timeout=5)
+        return {s: {'symbol': s} for s in symbols}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_many(['AAPL'], slow_loader)))
+               for _ in range(10)]
+    for t in threads:
+        t.start()
+    # Give every thread the chance to join the in-flight lookup
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [['AAPL']]
+    assert len(results) == 10
+    assert all('AAPL' in r for r in results)
+
+def test_loader_error_is_raised_to_every_waiter():
+    cache = QuoteCache(ttl=5)
+
+    def failing_loader(symbols):
+        raise Exception("Error fetching data from Yahoo Finance.")
+
+    with pytest.raises(Exception, match="Error fetching data"):
+        cache.get_many(['AAPL'], failing_loader)
+    # A failed lookup must not leave the symbol stuck in flight
+    assert cache.get_many(['AAPL'], make_loader([]))['AAPL']['symbol'] == 'AAPL'
+
+def test_cancelled_async_lookup_cancels_its_waiters():
+    cache = QuoteCache(ttl=5)
+
+    async def slow_loader(symbols):
+        await asyncio.sleep(5)
+        return {s: {'symbol': s} for s in symbols}
+
+    async def main():
+        owner = asyncio.create_task(cache.get_many_async(['AAPL'], slow_loader))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_many_async(['AAPL'], slow_loader))
+        await asyncio.sleep(0)
+        owner.cancel()
+        results = await asyncio.gather(owner, waiter, return_exceptions=True)
+        # The symbol is free to be looked up again
+        retry = await cache.get_many_async(['AAPL'], lambda symbols: asyncio.sleep(0, {'AAPL': {'symbol': 'AAPL'}}))
+        return results, retry
+
+    results, retry = asyncio.run(main())
+    assert [type(r) for r in results] == [asyncio.CancelledError, asyncio.CancelledError]
+    assert retry['AAPL']['symbol'] == 'AAPL'
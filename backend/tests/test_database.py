@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import create_engine, exc
+from app import create_app, db
+from app.database import engine_options, TimedAsyncQueuePool, TimedQueuePool
+from app.metrics import POOL_CHECKOUTS, POOL_TIMEOUTS, POOL_WAIT
+from app.models import Transaction
+from app.valuation import valuation_engine
+from .conftest import TestingConfig
+
+
+class DatabaseConfig(TestingConfig):
+    DB_STATEMENT_TIMEOUT_MS = 5000
+
+def test_server_databases_get_the_pool_settings():
+    config = {key: getattr(DatabaseConfig, key) for key in dir(DatabaseConfig) if key.startswith('DB_')}
+    options = engine_options('postgresql+psycopg://app@db/rocketfin', config)
+    assert options['poolclass'] is TimedQueuePool
+    assert (options['pool_size'], options['max_overflow'], options['pool_pre_ping']) == (5, 10, True)
+    assert options['connect_args'] == {'options': '-c statement_timeout=5000', 'prepare_threshold': 5}
+
+    options = engine_options('postgresql+asyncpg://app@db/rocketfin', config, 'async')
+    assert (options['poolclass'], options['pool_logging_name']) == (TimedAsyncQueuePool, 'async')
+    assert options['connect_args'] == {'prepared_statement_cache_size': 100,
+                                       'server_settings': {'statement_timeout': '5000'}}
+    assert 'connect_args' not in engine_options('postgresql://app@db/rocketfin', dict(config, DB_STATEMENT_TIMEOUT_MS=0))
+
+    # SQLite only gets the instrumented pool
+    assert engine_options('sqlite:///x.db', config) == {'poolclass': TimedQueuePool, 'pool_logging_name': 'primary'}
+    assert engine_options('sqlite:///:memory:', config) == {}
+
+def test_reads_go_to_the_replica(tmp_path):
+    class ReplicaConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        DATABASE_REPLICA_URL = f"sqlite:///{tmp_path / 'replica.db'}"
+
+    class ReplicaSchemaConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = ReplicaConfig.DATABASE_REPLICA_URL
+
+    # The replica has the schema but, lagging behind, none of the trades
+    create_app(ReplicaSchemaConfig)
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        client = app.test_client()
+        checkouts = POOL_CHECKOUTS.labels('replica').value
+        assert client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 2}).status_code == 201
+        assert Transaction.query.count() == 1
+        assert client.get('/api/transactions').json == []
+        valuation_engine.invalidate()
+        assert client.get('/api/portfolio').json == []
+        assert POOL_CHECKOUTS.labels('replica').value > checkouts
+        db.session.remove()
+        db.engine.dispose()
+        app.extensions['replica'].dispose()
+
+def test_pool_checkouts_and_timeouts_are_counted(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool,
+                           pool_logging_name='test', pool_size=1, max_overflow=0, pool_timeout=0.01)
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    with engine.connect():
+        pass
+    engine.dispose()
+    assert POOL_CHECKOUTS.labels('test').value == 2
+    assert POOL_TIMEOUTS.labels('test').value == 1
+    histogram = POOL_WAIT.labels('test')
+    assert sum(histogram.counts) == 3
+    assert histogram.sum >= 0.01
@@ -0,0 +1,135 @@
+import datetime
+import os
+import numpy as np
+import pytest
+from app.history import PriceHistory, ohlc_bars, price_history, INTERVALS
+from app.services import quote_cache
+from .conftest import FakeClock, TestingConfig
+
+
+def quote(price):
+    return {'current_price': price}
+
+def moment(seconds):
+    return datetime.datetime.fromtimestamp(seconds)
+
+
+@pytest.fixture
+def clock():
+    # Monday 2024-01-01 00:00:00 UTC
+    return FakeClock(1704067200.0)
+
+@pytest.fixture
+def history(tmp_path, clock):
+    return PriceHistory(str(tmp_path), max_bars=100, clock=clock)
+
+def test_records_and_reads_ranges(history, clock):
+    for price in (10.0, 11.0, 12.0):
+        history.record({'AAPL': quote(price), 'MSFT': quote(price * 10)})
+        clock.now += 60
+
+    times, prices = history.ticks('aapl')
+    assert prices.tolist() == [10.0, 11.0, 12.0]
+    assert (np.diff(times) == 60000).all()
+
+    start = clock.now - 120  # Second tick onwards
+    _, prices = history.ticks('MSFT', start=moment(start), end=moment(start + 60))
+    assert prices.tolist() == [110.0]
+    assert len(history.ticks('TSLA')[0]) == 0
+
+def test_skips_unusable_ticks(history, clock):
+    history.record({'AAPL': quote(10.0)})
+    history.record({'AAPL': quote(11.0)})  # Same instant
+    history.record({'AAPL': quote('N/A'), '../X': quote(1.0)})
+    clock.now -= 1
+    history.record({'AAPL': quote(9.0)})  # Clock went backwards
+    assert history.ticks('AAPL')[1].tolist() == [10.0]
+    assert sorted(os.listdir(history.directory)) == ['AAPL.price', 'AAPL.time']
+
+def test_submit_returns_while_the_writer_is_busy(history):
+    # The writer holds this lock while it appends
+    with history._lock:
+        history.submit({'AAPL': quote(10.0)})
+        history.submit({'MSFT': quote(20.0)})
+        assert len(history.ticks('AAPL')[0]) == 0
+    history.flush()
+    assert history.ticks('AAPL')[1].tolist() == [10.0]
+    assert history.ticks('MSFT')[1].tolist() == [20.0]
+
+def test_drops_partial_tick(history, clock):
+    history.record({'AAPL': quote(10.0)})
+    # A crash after writing only the time of the next tick
+    with open(os.path.join(history.directory, 'AAPL.time'), 'ab') as f:
+        f.write(np.array([1], '<i8').tobytes())
+    assert history.ticks('AAPL')[1].tolist() == [10.0]
+
+    clock.now += 1
+    fresh = PriceHistory(history.directory, clock=clock)
+    fresh.record({'AAPL': quote(11.0)})
+    assert fresh.ticks('AAPL')[1].tolist() == [10.0, 11.0]
+
+def test_workers_sharing_a_directory_keep_times_sorted(tmp_path):
+    # Two worker processes, each with its own clock reading and instance
+    first_clock, second_clock = FakeClock(100.0), FakeClock(200.0)
+    first = PriceHistory(str(tmp_path), clock=first_clock)
+    second = PriceHistory(str(tmp_path), clock=second_clock)
+    first.record({'AAPL': quote(10.0)})
+    second.record({'AAPL': quote(20.0)})
+    first_clock.now = 150.0
+    first.record({'AAPL': quote(15.0)})  # Older than the other worker's tick
+    first_clock.now = 300.0
+    first.record({'AAPL': quote(30.0)})
+    assert first.ticks('AAPL')[0].tolist() == [100000, 200000, 300000]
+
+def test_ohlc_bars():
+    start = 1704067200 * 1000
+    times = np.array([start, start + 10000, start + 50000, start + 60000, start + 3600000])
+    prices = np.array([10.0, 12.0, 9.0, 11.0, 15.0])
+
+    bars = ohlc_bars(times, prices, INTERVALS['1m'])
+    assert bars[0] == {'time': 1704067200, 'open': 10.0, 'high': 12.0, 'low': 9.0, 'close': 9.0,
+                       'ticks': 3}
+    assert [b['time'] for b in bars] == [1704067200, 1704067260, 1704070800]
+
+    # Weekly bars start on Monday
+    sunday = start - 86400000
+    assert [b['time'] for b in ohlc_bars(np.array([sunday, start]), np.array([1.0, 2.0]),
+                                         INTERVALS['1w'])] == [1704067200 - 7 * 86400, 1704067200]
+
+def test_picks_interval_for_range(history, clock):
+    for _ in range(3):
+        history.record({'AAPL': quote(10.0)})
+        clock.now += 3600
+
+    start = moment(clock.now - 3 * 3600)
+    assert history.bars('AAPL', start, moment(clock.now))[0] == '5m'
+    assert history.bars('AAPL', start, moment(clock.now + 86400 * 30))[0] == '1d'
+    with pytest.raises(ValueError):
+        history.bars('AAPL', start, moment(clock.now + 86400 * 30), interval='1m')
+
+
+@pytest.fixture
+def config(tmp_path):
+    class HistoryConfig(TestingConfig):
+        PRICE_HISTORY_DIR = str(tmp_path)
+    return HistoryConfig
+
+def test_history_endpoint_records_fetched_quotes(client):
+    client.get('/api/instruments/search?ticker=AAPL')
+    quote_cache.clear()
+    client.get('/api/instruments/search?ticker=MSFT')
+    price_history.flush()
+
+    response = client.get('/api/instruments/aapl/history?interval=1d')
+    assert response.status_code == 200
+    body = response.json
+    assert body['symbol'] == 'AAPL' and body['interval'] == '1d'
+    assert len(body['bars']) == 1
+    assert body['bars'][0]['close'] == 227.55
+    assert client.get('/api/instruments/MSFT/history').json['bars'][0]['open'] == 416.21
+
+def test_history_endpoint_validates_arguments(client):
+    assert client.get('/api/instruments/AAPL/history?interval=2m').status_code == 400
+    assert client.get('/api/instruments/AAPL/history?start=yesterday').status_code == 400
+    assert client.get('/api/instruments/AAPL/history?start=2024-02-01&end=2024-01-01').status_code == 400
+    assert client.get('/api/instruments/AAPL/history').json['bars'] == []
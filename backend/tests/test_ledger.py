@@ -0,0 +1,115 @@
+import datetime
+import io
+import pytest
+from sqlalchemy import select
+from app import db
+from app.bulk import import_transactions, CSV
+from app.ledger import compact, repair, verify
+from app.lots import rebuild
+from app.models import Lot, Portfolio, PortfolioCheckpoint, Transaction, TransactionArchive
+from app.performance import realized_by_ticker
+from app.trading import execute_trade
+from config import Config
+from .conftest import TestingConfig
+
+ACCOUNT_ID = Config.DEFAULT_ACCOUNT_ID
+
+
+@pytest.fixture(params=['fifo', 'average'])
+def config(request):
+    class MethodConfig(TestingConfig):
+        COST_BASIS_METHOD = request.param
+    return MethodConfig
+
+HISTORY = ("ticker,shares,operation,price,date\n"
+           "AAPL,10,buy,100,2020-01-02\n"
+           "AAPL,10,buy,120,2020-02-03\n"
+           "AAPL,15,sell,130,2020-03-02\n"
+           "MSFT,5,buy,200,2020-01-06\n"
+           "MSFT,5,sell,210,2020-04-01\n"
+           "AAPL,4,buy,140,2021-05-03\n"
+           "AAPL,6,sell,150,2021-06-01\n")
+
+def positions():
+    return {p.ticker: (p.shares_owned, pytest.approx(p.total_cost_basis)) for p in Portfolio.query}
+
+def lots():
+    return [(lot.ticker, lot.shares, pytest.approx(lot.price), lot.opened_at)
+            for lot in Lot.query.order_by(Lot.ticker, Lot.opened_at, Lot.id)]
+
+def test_verify_and_repair_drift(app):
+    execute_trade(ACCOUNT_ID, 'AAPL', 10, 'buy', 100.0)
+    execute_trade(ACCOUNT_ID, 'AAPL', 4, 'sell', 110.0)
+    execute_trade(ACCOUNT_ID, 'MSFT', 5, 'buy', 200.0)
+    execute_trade(ACCOUNT_ID, 'TSLA', 2, 'buy', 50.0)
+    db.session.add(Portfolio(account_id=ACCOUNT_ID, ticker='UNTRADED', shares_owned=1, total_cost_basis=1.0))
+    db.session.commit()
+    assert verify(db.session) == []
+
+    db.session.execute(select(Portfolio).where(Portfolio.ticker == 'AAPL')).scalar().shares_owned = 7
+    db.session.delete(db.session.execute(select(Portfolio).where(Portfolio.ticker == 'MSFT')).scalar())
+    execute_trade(ACCOUNT_ID, 'TSLA', 2, 'sell', 60.0)
+    db.session.add(Portfolio(account_id=ACCOUNT_ID, ticker='TSLA', shares_owned=2, total_cost_basis=100.0))
+    db.session.commit()
+
+    drift = verify(db.session)
+    assert [(d['ticker'], d['shares_owned'], d['expected_shares']) for d in drift] == [
+        ('AAPL', 7, 6), ('MSFT', 0, 5), ('TSLA', 2, 0)]
+    assert drift[0]['expected_cost_basis'] == pytest.approx(600.0)
+
+    repair(db.session, drift)
+    db.session.commit()
+    assert verify(db.session) == []
+    assert positions() == {'AAPL': (6, 600.0), 'MSFT': (5, 1000.0), 'UNTRADED': (1, 1.0)}
+
+def test_verify_ledger_command(app):
+    execute_trade(ACCOUNT_ID, 'AAPL', 10, 'buy', 100.0)
+    Portfolio.query.one().total_cost_basis = 1.0
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['verify-ledger'])
+    assert result.exit_code == 1
+    assert 'AAPL: 10 shares costing 1.00, expected 10 costing 1000.00' in result.output
+    assert 'Repaired 1 positions.' in runner.invoke(args=['verify-ledger', '--repair']).output
+    assert runner.invoke(args=['verify-ledger']).exit_code == 0
+
+def test_compaction_keeps_positions_lots_and_realized(app):
+    import_transactions(db.session, ACCOUNT_ID, io.StringIO(HISTORY), CSV)
+    db.session.add(PortfolioCheckpoint(account_id=ACCOUNT_ID, as_of=datetime.datetime(2020, 6, 1),
+                                       positions='{}'))
+    db.session.commit()
+    before = (positions(), lots(), realized_by_ticker(db.session, ACCOUNT_ID))
+
+    assert compact(db.session, datetime.datetime(2021, 1, 1)) == {'archived': 5, 'openings': 1}
+    db.session.commit()
+
+    # The 5 AAPL shares left of the second buy open the compacted log
+    opening = Transaction.query.filter_by(opening=True).one()
+    assert (opening.shares, opening.date) == (5, datetime.datetime(2020, 2, 3))
+    assert Transaction.query.count() == 3
+    assert {a.id for a in TransactionArchive.query} == {1, 2, 3, 4, 5}
+    assert PortfolioCheckpoint.query.count() == 0
+    assert (positions(), lots(), realized_by_ticker(db.session, ACCOUNT_ID)) == before
+    assert verify(db.session) == []
+
+    # Replaying the compacted log gives the same books
+    rebuild(db.session)
+    assert (positions(), lots(), realized_by_ticker(db.session, ACCOUNT_ID)) == before
+
+    # A later compaction replaces the opening row instead of archiving it
+    assert compact(db.session, datetime.datetime(2022, 1, 1)) == {'archived': 2, 'openings': 1}
+    db.session.commit()
+    assert TransactionArchive.query.count() == 7
+    assert Transaction.query.one().opening
+    assert (positions(), realized_by_ticker(db.session, ACCOUNT_ID)) == before[0::2]
+
+def test_compact_ledger_command_scoped_to_account(app):
+    import_transactions(db.session, ACCOUNT_ID, io.StringIO(HISTORY), CSV)
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['compact-ledger', '2021-01-01', '--account', '99'])
+    assert 'Archived 0 transactions and wrote 0 opening rows.' in result.output
+    result = app.test_cli_runner().invoke(args=['compact-ledger', '2021-01-01',
+                                                '--account', str(ACCOUNT_ID)])
+    assert 'Archived 5 transactions and wrote 1 opening rows.' in result.output
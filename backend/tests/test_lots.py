@@ -0,0 +1,88 @@
+import pytest
+from app import db
+from app.lots import LotBook, rebuild
+from app.models import Lot, Portfolio, Transaction
+from app.trading import execute_trade
+from config import Config
+from .conftest import TestingConfig
+
+ACCOUNT_ID = Config.DEFAULT_ACCOUNT_ID
+
+
+class FifoConfig(TestingConfig):
+    COST_BASIS_METHOD = 'fifo'
+
+
+class AverageCostConfig(TestingConfig):
+    COST_BASIS_METHOD = 'average'
+
+
+@pytest.fixture
+def config():
+    return FifoConfig
+
+def trade_two_lots_and_sell():
+    execute_trade(ACCOUNT_ID, 'AAPL', 10, 'buy', 100.0)
+    execute_trade(ACCOUNT_ID, 'AAPL', 10, 'buy', 120.0)
+    return execute_trade(ACCOUNT_ID, 'AAPL', 15, 'sell', 130.0)
+
+def position():
+    return Portfolio.query.filter_by(account_id=ACCOUNT_ID, ticker='AAPL').one()
+
+def test_fifo_sells_oldest_lots_first(app):
+    assert trade_two_lots_and_sell() == 15 * 130.0 - (10 * 100.0 + 5 * 120.0)
+    assert position().total_cost_basis == 5 * 120.0
+    assert [(lot.shares, lot.price) for lot in Lot.query.all()] == [(5, 120.0)]
+    sale = Transaction.query.filter_by(operation='sell').one()
+    assert sale.to_dict()['realized_profit_loss'] == 350.0
+
+@pytest.mark.parametrize('config', [AverageCostConfig])
+def test_average_cost(app):
+    assert trade_two_lots_and_sell() == 15 * 130.0 - 15 * 110.0
+    assert position().total_cost_basis == 5 * 110.0
+    # Lots still track which shares are left
+    assert Lot.query.one().shares == 5
+
+def test_selling_everything_clears_position_and_lots(app):
+    execute_trade(ACCOUNT_ID, 'AAPL', 3, 'buy', 100.0)
+    execute_trade(ACCOUNT_ID, 'AAPL', 3, 'sell', 90.0)
+    assert Portfolio.query.count() == 0
+    assert Lot.query.count() == 0
+
+def test_lot_book_matches_trading(app):
+    book = LotBook()
+    book.buy(10, 100.0)
+    book.buy(10, 120.0)
+    assert book.sell(15) == 1600.0
+    assert (book.shares, book.cost_basis) == (5, 600.0)
+    assert book.sell(5) == 600.0 and not book.lots
+
+def test_rebuild_restores_lots_positions_and_realized(app):
+    trade_two_lots_and_sell()
+    execute_trade(ACCOUNT_ID, 'MSFT', 2, 'buy', 50.0)
+    expected = (position().total_cost_basis, [(l.ticker, l.shares, l.price) for l in Lot.query.all()])
+
+    # Drifted books, as left by the old sale-value cost basis
+    position().total_cost_basis = -100.0
+    Lot.query.delete()
+    Transaction.query.filter_by(operation='sell').one().realized_profit_loss = None
+    db.session.commit()
+
+    assert rebuild(db.session) == 4
+    db.session.commit()
+    assert (position().total_cost_basis, [(l.ticker, l.shares, l.price) for l in Lot.query.all()]) == expected
+    assert Transaction.query.filter_by(operation='sell').one().realized_profit_loss == 350.0
+
+def test_realized_endpoints(app):
+    client = app.test_client()
+    client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 10})
+    response = client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 4})
+    # Bought and sold at the same replayed quote
+    assert response.json['realized_profit_loss'] == 0.0
+
+    assert client.get('/api/portfolio/realized').json == [
+        {'ticker': 'AAPL', 'shares_sold': 4, 'realized_profit_loss': 0.0}]
+    batch = client.post('/api/transactions/batch', json={'orders': [
+        {'ticker': 'AAPL', 'shares': 1, 'operation': 'sell'},
+        {'ticker': 'MSFT', 'shares': 1, 'operation': 'buy'}]}).json
+    assert [r['realized_profit_loss'] for r in batch['results']] == [0.0, None]
@@ -0,0 +1,84 @@
+import asyncio
+import re
+import pytest
+from app import create_app, db
+from app.asgi import create_app as create_async_app
+from app.metrics import Histogram, Family, Counter
+from .conftest import TestingConfig
+
+
+class MetricsConfig(TestingConfig):
+    METRICS_ENABLED = True
+
+
+@pytest.fixture
+def config():
+    return MetricsConfig
+
+
+def sample(text, name, **labels):
+    # Value of one sample in a /metrics page, 0 when it isn't there yet
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = '^' + re.escape(name + (f'{{{wanted}}}' if wanted else '')) + r' (\S+)$'
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+    samples = {(name, labels[-1][1] if labels else None): value
+               for name, labels, value in histogram.samples('t', ())}
+    assert samples[('t_bucket', '0.1')] == 1
+    assert samples[('t_bucket', '1.0')] == 3
+    assert samples[('t_bucket', '+Inf')] == 4
+    assert samples[('t_count', None)] == 4
+    assert samples[('t_sum', None)] == 6.05
+
+def test_family_reuses_children_and_escapes_labels():
+    family = Family('things_total', "Things.", 'counter', ('kind', 'name'), Counter)
+    family.labels('a', 'x"y').inc()
+    family.labels('a', 'x"y').inc(2)
+    assert list(family.render())[-1] == 'things_total{kind="a",name="x\\"y"} 3'
+
+def test_metrics_endpoint(client):
+    before = client.get('/metrics').get_data(as_text=True)
+    assert client.get('/api/instruments/search?ticker=AAPL').status_code == 200
+    assert client.get('/api/instruments/search?ticker=AAPL').status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    after = response.get_data(as_text=True)
+
+    def delta(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    route = {'route': '/api/instruments/search', 'method': 'GET'}
+    assert delta('http_request_duration_seconds_count', **route) == 2
+    assert delta('http_requests_total', **route, status=200) == 2
+    # The second search is served from the quote cache
+    assert delta('quote_upstream_duration_seconds_count') == 1
+    assert sample(after, 'quote_cache_hits_total') >= 1
+    assert delta('db_query_duration_seconds_count', statement='SELECT') > 0
+
+def test_metrics_disabled():
+    class DisabledConfig(MetricsConfig):
+        METRICS_ENABLED = False
+
+    app = create_app(DisabledConfig)
+    with app.app_context():
+        assert app.test_client().get('/metrics').status_code == 404
+        db.drop_all()
+
+def test_async_metrics_endpoint():
+    async def main():
+        app = create_async_app(MetricsConfig)
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            await client.get('/api/portfolio')
+            response = await client.get('/metrics')
+            return response.status_code, await response.get_data(as_text=True)
+
+    status, text = asyncio.run(main())
+    assert status == 200
+    assert sample(text, 'http_requests_total', route='/api/portfolio', method='GET', status=200) >= 1
@@ -0,0 +1,76 @@
+import sqlite3
+import pytest
+from sqlalchemy import inspect
+from app import db
+from app.migrations import MIGRATIONS, upgrade
+from app.models import Account, Lot, Portfolio, Transaction, SchemaVersion
+from config import Config
+from .conftest import TestingConfig
+
+
+@pytest.fixture
+def legacy_database(tmp_path):
+    # Schema and data as written before tickers were normalized
+    path = tmp_path / 'legacy.db'
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE "transaction" (
+            id INTEGER PRIMARY KEY, ticker VARCHAR(10) NOT NULL, shares INTEGER NOT NULL,
+            operation VARCHAR(4) NOT NULL, price FLOAT NOT NULL, date DATETIME);
+        CREATE TABLE portfolio (
+            id INTEGER PRIMARY KEY, ticker VARCHAR(10) NOT NULL,
+            total_cost_basis FLOAT NOT NULL, shares_owned INTEGER NOT NULL);
+        INSERT INTO "transaction" (ticker, shares, operation, price, date) VALUES
+            ('aapl', 5, 'buy', 100.0, '2024-01-01 10:00:00'),
+            ('AAPL', 3, 'buy', 110.0, '2024-01-02 10:00:00');
+        INSERT INTO portfolio (ticker, total_cost_basis, shares_owned) VALUES
+            ('aapl', 500.0, 5), ('AAPL', 330.0, 3), ('msft', 400.0, 1);
+    """)
+    connection.commit()
+    connection.close()
+    return f"sqlite:///{path}"
+
+
+@pytest.fixture
+def config(legacy_database):
+    class LegacyConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = legacy_database
+    return LegacyConfig
+
+
+def test_upgrade_normalizes_and_merges_positions(app):
+    positions = {p.ticker: p for p in Portfolio.query.all()}
+    assert set(positions) == {'AAPL', 'MSFT'}
+    assert positions['AAPL'].shares_owned == 8
+    assert positions['AAPL'].total_cost_basis == 830.0
+    assert {t.ticker for t in Transaction.query.all()} == {'AAPL'}
+
+def test_upgrade_creates_indexes(app):
+    inspector = inspect(db.engine)
+    portfolio_indexes = {i['name']: i for i in inspector.get_indexes('portfolio')}
+    assert portfolio_indexes['ux_portfolio_account_ticker']['unique']
+    # Superseded by the account-led indexes
+    assert 'ix_portfolio_ticker' not in portfolio_indexes
+    transaction_indexes = {i['name'] for i in inspector.get_indexes('transaction')}
+    assert {'ix_transaction_account_date_id', 'ix_transaction_account_ticker_date_id'} <= transaction_indexes
+    assert 'ix_transaction_date_id' not in transaction_indexes
+
+def test_upgrade_moves_existing_data_to_default_account(app):
+    assert db.session.get(Account, Config.DEFAULT_ACCOUNT_ID).name == 'default'
+    assert {p.account_id for p in Portfolio.query.all()} == {Config.DEFAULT_ACCOUNT_ID}
+    assert {t.account_id for t in Transaction.query.all()} == {Config.DEFAULT_ACCOUNT_ID}
+
+def test_upgrade_builds_lots_from_history(app):
+    lots = [(lot.ticker, lot.shares, lot.price) for lot in Lot.query.order_by(Lot.ticker, Lot.opened_at)]
+    # MSFT has no transactions, so its position becomes one lot at its average cost
+    assert lots == [('AAPL', 5, 100.0), ('AAPL', 3, 110.0), ('MSFT', 1, 400.0)]
+
+def test_upgrade_is_recorded_and_idempotent(app):
+    upgrade()
+    versions = [v.version for v in SchemaVersion.query.order_by(SchemaVersion.version)]
+    assert versions == [version for version, _, _ in MIGRATIONS]
+
+def test_buy_uses_normalized_position(app):
+    response = app.test_client().post('/api/transactions/buy', json={'ticker': 'msft', 'shares': 1})
+    assert response.status_code == 201
+    assert Portfolio.query.filter_by(ticker='MSFT').one().shares_owned == 2
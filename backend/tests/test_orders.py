@@ -0,0 +1,112 @@
+import time
+import pytest
+from sqlalchemy import event, text
+from app import create_app, db
+from app.ledger import verify
+from app.models import Lot, Portfolio, QueuedOrder, Transaction
+from app.orders import order_writer
+from app.trading import apply_order_batch
+from .conftest import TestingConfig
+
+
+class OrdersConfig(TestingConfig):
+    ORDER_QUEUE_ENABLED = True
+    # Orders are drained by the tests themselves
+    ORDER_QUEUE_WRITER = False
+
+@pytest.fixture
+def config():
+    return OrdersConfig
+
+def test_orders_are_queued_then_applied_together(client):
+    response = client.post('/api/transactions/buy', json={'ticker': 'aapl', 'shares': 10})
+    assert response.status_code == 202
+    assert response.headers['Location'].endswith(f"/api/orders/{response.json['order_id']}")
+    buy_id = response.json['order_id']
+    sell_id = client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 4}).json['order_id']
+    too_many_id = client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 100}).json['order_id']
+    assert client.get(f'/api/orders/{buy_id}').json['status'] == 'pending'
+    assert Transaction.query.count() == 0
+
+    commits = []
+    event.listen(db.engine, 'commit', lambda conn: commits.append(conn))
+    assert order_writer.drain() == 3
+    assert len(commits) == 1
+    assert order_writer.drain() == 0
+
+    assert client.get(f'/api/orders/{buy_id}').json['status'] == 'executed'
+    sale = client.get(f'/api/orders/{sell_id}').json
+    assert (sale['status'], sale['realized_profit_loss']) == ('executed', 0.0)
+    failed = client.get(f'/api/orders/{too_many_id}').json
+    assert (failed['status'], failed['error']) == ('failed', "Not enough shares to sell.")
+    assert Portfolio.query.one().shares_owned == 6
+    assert [lot.shares for lot in Lot.query] == [6]
+    assert Transaction.query.count() == 2
+    assert verify(db.session) == []
+
+def test_batches_are_limited(app, client):
+    order_writer.batch_size = 2
+    for _ in range(3):
+        client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 1})
+    assert [order_writer.drain() for _ in range(3)] == [2, 1, 0]
+    # The buys of a batch update the position once
+    assert Portfolio.query.one().shares_owned == 3
+    assert Lot.query.count() == 3
+
+def test_an_order_that_cannot_be_applied_does_not_stall_the_queue(client, monkeypatch):
+    def apply(session, orders):
+        if any(order['ticker'] == 'TSLA' for order in orders):
+            raise ValueError("Unknown instrument.")
+        return apply_order_batch(session, orders)
+
+    monkeypatch.setattr('app.orders.apply_order_batch', apply)
+    ids = [client.post('/api/transactions/buy', json={'ticker': ticker, 'shares': 1}).json['order_id']
+           for ticker in ('AAPL', 'TSLA', 'MSFT')]
+    assert order_writer.drain() == 3
+    assert order_writer.drain() == 0
+    outcomes = [client.get(f'/api/orders/{order_id}').json for order_id in ids]
+    assert [(order['status'], order['error']) for order in outcomes] == [
+        ('executed', None), ('failed', "Unknown instrument."), ('executed', None)]
+    assert sorted(p.ticker for p in Portfolio.query) == ['AAPL', 'MSFT']
+
+def test_orders_of_other_accounts_are_hidden(client):
+    order_id = client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 1}).json['order_id']
+    other = {'X-Account-Id': str(client.post('/api/accounts', json={'name': 'other'}).json['id'])}
+    assert client.get(f'/api/orders/{order_id}', headers=other).status_code == 404
+    assert client.get('/api/orders/999').status_code == 404
+
+def test_portfolio_shows_orders_executed_by_another_process(client, monkeypatch):
+    assert client.get('/api/portfolio').json == []
+    order_id = client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 3}).json['order_id']
+    # A writer in another process leaves this process's snapshot alone
+    monkeypatch.setattr('app.orders.valuation_engine.record_trade', lambda *args: None)
+    assert order_writer.drain() == 1
+
+    assert client.get(f'/api/orders/{order_id}').json['status'] == 'executed'
+    assert [(p['ticker'], p['shares_owned']) for p in client.get('/api/portfolio').json] == [('AAPL', 3)]
+
+def test_writer_thread_applies_orders(tmp_path):
+    class WriterConfig(OrdersConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'orders.db'}"
+        ORDER_QUEUE_WRITER = True
+        ORDER_QUEUE_LOCK_PATH = str(tmp_path / 'order-writer.lock')
+
+    app = create_app(WriterConfig)
+    try:
+        with app.app_context():
+            assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            # FULL
+            assert db.session.execute(text('PRAGMA synchronous')).scalar() == 2
+            client = app.test_client()
+            order_id = client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 2}).json['order_id']
+            deadline = time.monotonic() + 5
+            while client.get(f'/api/orders/{order_id}').json['status'] == 'pending':
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+            assert QueuedOrder.query.one().status == 'executed'
+            assert Portfolio.query.one().shares_owned == 2
+    finally:
+        order_writer.stop()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
@@ -0,0 +1,84 @@
+import datetime
+import pytest
+from app import db
+from app.history import PriceHistory
+from app.models import Transaction, PortfolioCheckpoint
+from app.performance import equity_curve
+from config import Config
+from .conftest import TestingConfig
+
+ACCOUNT_ID = Config.DEFAULT_ACCOUNT_ID
+TODAY = datetime.date.today()
+
+
+@pytest.fixture
+def config(tmp_path):
+    class HistoryConfig(TestingConfig):
+        PRICE_HISTORY_DIR = str(tmp_path)
+    return HistoryConfig
+
+def at(days_ago, hour):
+    return datetime.datetime.combine(TODAY - datetime.timedelta(days=days_ago), datetime.time(hour))
+
+def trade(days_ago, ticker, shares, operation, price, hour=10):
+    db.session.add(Transaction(account_id=ACCOUNT_ID, ticker=ticker, shares=shares,
+                               operation=operation, price=price, date=at(days_ago, hour)))
+    db.session.commit()
+
+def record_quote(app, moment, ticker, price):
+    PriceHistory(app.config['PRICE_HISTORY_DIR'], clock=moment.timestamp).record(
+        {ticker: {'current_price': price}})
+
+def curve(first, last, every=5000):
+    return equity_curve(db.session, ACCOUNT_ID, TODAY - datetime.timedelta(days=first),
+                        TODAY - datetime.timedelta(days=last), every)
+
+def test_values_positions_at_end_of_each_day(app):
+    trade(5, 'AAPL', 10, 'buy', 100.0)
+    record_quote(app, at(4, 12), 'AAPL', 105.0)
+    trade(3, 'AAPL', 4, 'sell', 110.0)
+
+    points = curve(6, 2)
+    assert [p['date'] for p in points] == [(TODAY - datetime.timedelta(days=d)).isoformat()
+                                           for d in (6, 5, 4, 3, 2)]
+    assert [p['market_value'] for p in points] == [0.0, 1000.0, 1050.0, 660.0, 660.0]
+    # The shares sold cost 100 each
+    assert [p['cost_basis'] for p in points] == [0.0, 1000.0, 1000.0, 600.0, 600.0]
+    assert points[2]['profit_loss'] == 50.0
+
+def test_replays_from_checkpoints(app):
+    for days_ago in range(20, 0, -1):
+        trade(days_ago, 'AAPL', 2, 'buy', 100.0 + days_ago)
+        trade(days_ago, 'MSFT', 1, 'buy', 50.0, hour=11)
+        if days_ago % 3 == 0:
+            trade(days_ago, 'AAPL', 1, 'sell', 120.0, hour=12)
+
+    full = curve(20, 0, every=4)
+    db.session.commit()
+    checkpoints = PortfolioCheckpoint.query.order_by(PortfolioCheckpoint.as_of).all()
+    assert len(checkpoints) > 3
+    # Nothing from yesterday on is checkpointed
+    assert checkpoints[-1].as_of <= at(1, 0)
+
+    # Every range gives the same points as one replay from the start
+    assert curve(7, 0, every=4) == full[13:]
+    assert curve(12, 9, every=4) == full[8:12]
+    db.session.commit()
+    assert PortfolioCheckpoint.query.count() == len(checkpoints)
+
+def test_history_endpoint(app):
+    client = app.test_client()
+    assert client.get('/api/portfolio/history').json == [
+        {'date': TODAY.isoformat(), 'market_value': 0.0, 'cost_basis': 0.0, 'profit_loss': 0.0}]
+
+    client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 2})
+    trade(2, 'AAPL', 1, 'buy', 200.0)
+    points = client.get('/api/portfolio/history').json
+    assert len(points) == 3
+    assert points[0]['market_value'] == 200.0
+    # Valued at the quote fetched for the trade
+    assert points[-1]['market_value'] == 3 * 227.55
+
+    assert client.get('/api/portfolio/history?start=2024-02-01&end=2024-01-01').status_code == 400
+    assert client.get('/api/portfolio/history?start=2000-01-01').status_code == 400
+    assert client.get('/api/portfolio/history?end=soon').status_code == 400
@@ -0,0 +1,70 @@
+import glob
+import json
+import os
+import threading
+import time
+from app import create_app, db
+from app.profiling import Sampler, hot_functions, read_collapsed, route_slug
+from .conftest import TestingConfig
+
+
+class ProfilingConfig(TestingConfig):
+    PROFILING_ENABLED = True
+    PROFILE_SAMPLE_RATE = 0
+
+
+def spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def test_sampler_records_watched_thread():
+    sampler = Sampler(interval=0.001)
+    profile = sampler.start('spin')
+    spin(0.05)
+    assert sampler.stop() is profile
+    assert profile.samples > 0
+    assert 'tests/test_profiling.py:spin' in profile.collapsed()
+    speedscope = profile.speedscope()
+    assert speedscope['profiles'][0]['samples']
+    assert len(speedscope['profiles'][0]['weights']) == len(speedscope['profiles'][0]['samples'])
+
+    # The sampler thread exits once nothing is watched
+    time.sleep(0.01)
+    assert not any(t.name == 'profile-sampler' for t in threading.enumerate())
+
+def test_hot_functions(tmp_path):
+    (tmp_path / 'a.collapsed').write_text('main;load;parse 6\nmain;render 3\n')
+    (tmp_path / 'b.collapsed').write_text('main;render 1\nmain 2\n')
+    stacks = read_collapsed([tmp_path / 'a.collapsed', tmp_path / 'b.collapsed'])
+    assert stacks[('main', 'render')] == 4
+    assert hot_functions(stacks, top=3) == [('parse', 6, 6), ('render', 4, 4), ('main', 2, 12)]
+
+def test_route_slug():
+    assert route_slug('GET', '/api/instruments/<ticker>/history') == 'GET_api_instruments_ticker_history'
+
+def test_profiles_requests_with_header(tmp_path):
+    class ProfileDirConfig(ProfilingConfig):
+        PROFILE_DIR = str(tmp_path)
+
+    app = create_app(ProfileDirConfig)
+    app.add_url_rule('/slow', 'slow', lambda: (spin(0.03), 'done')[1])
+    with app.app_context():
+        client = app.test_client()
+        client.get('/slow')
+        assert not os.listdir(tmp_path)  # Not sampled without the header
+
+        assert client.get('/slow', headers={'X-Profile': '1'}).status_code == 200
+        [path] = glob.glob(str(tmp_path / 'GET_slow' / '*.speedscope.json'))
+        with open(path) as f:
+            assert json.load(f)['profiles'][0]['type'] == 'sampled'
+        stacks = read_collapsed(glob.glob(str(tmp_path / 'GET_slow' / '*.collapsed')))
+        assert hot_functions(stacks, top=1)[0][0] == 'tests/test_profiling.py:spin'
+
+        (tmp_path / 'GET_api_other').mkdir()
+        (tmp_path / 'GET_api_other' / '1.collapsed').write_text('app/routes.py:view;app/valuation.py:value 5\n')
+        result = app.test_cli_runner().invoke(args=['profile-report', '--route', 'GET_api_other', '--top', '1'])
+        assert 'app/valuation.py:value' in result.output
+        result = app.test_cli_runner().invoke(args=['profile-report', '--route', 'POST_api_none'])
+        assert 'No profiles' in result.output
+        db.drop_all()
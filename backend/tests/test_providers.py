@@ -0,0 +1,52 @@
+import json
+import os
+import pytest
+from app.providers import create_provider, SyntheticProvider, ReplayProvider
+from app.quote_client import QuoteProviderError
+from config import Config
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'quotes.json')
+
+
+def config(**overrides):
+    values = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    values.update(overrides)
+    return values
+
+
+def test_create_provider_from_config():
+    assert isinstance(create_provider(config(QUOTE_PROVIDER='synthetic')), SyntheticProvider)
+    assert isinstance(create_provider(config(QUOTE_PROVIDER='replay', QUOTE_REPLAY_PATH=FIXTURE)),
+                      ReplayProvider)
+    with pytest.raises(ValueError):
+        create_provider(config(QUOTE_PROVIDER='unknown'))
+
+def test_synthetic_is_deterministic_for_a_seed():
+    first = SyntheticProvider(seed=42)
+    second = SyntheticProvider(seed=42)
+    for _ in range(3):
+        assert first.fetch_quotes(['AAPL', 'MSFT']) == second.fetch_quotes(['AAPL', 'MSFT'])
+
+def test_synthetic_quote_shape():
+    quote = SyntheticProvider().fetch_quotes(['AAPL'])['AAPL']
+    assert quote['symbol'] == 'AAPL'
+    assert quote['bid'] < quote['current_price'] < quote['ask']
+
+def test_synthetic_error_rate():
+    with pytest.raises(QuoteProviderError):
+        SyntheticProvider(error_rate=1.0).fetch_quotes(['AAPL'])
+
+def test_replay_serves_recorded_quotes():
+    quotes = ReplayProvider(FIXTURE).fetch_quotes(['AAPL', 'INVALID'])
+    assert list(quotes) == ['AAPL']
+    assert quotes['AAPL']['current_price'] == 227.55
+    assert quotes['AAPL']['name'] == 'Apple Inc.'
+
+def test_replay_directory_replays_in_sequence(tmp_path):
+    for i, price in enumerate([10.0, 11.0]):
+        response = {"quoteResponse": {"result": [{"symbol": "AAPL", "regularMarketPrice": price}]}}
+        (tmp_path / f"quotes-{i}.json").write_text(json.dumps(response))
+
+    provider = ReplayProvider(str(tmp_path))
+    prices = [provider.fetch_quotes(['AAPL'])['AAPL']['current_price'] for _ in range(3)]
+    assert prices == [10.0, 11.0, 10.0]
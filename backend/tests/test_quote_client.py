@@ -0,0 +1,137 @@
+import asyncio
+import pytest
+import requests
+from app.quote_client import AsyncQuoteClient, QuoteClient, QuoteProviderError, CircuitOpenError, CircuitBreaker
+from .conftest import FakeClock
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.headers = headers or {}
+
+    def json(self):
+        return self._payload
+
+
+class FakeSession:
+    # Replays a scripted list of responses (or exceptions) in order
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.headers = {}
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def make_client(responses, **kwargs):
+    session = FakeSession(responses)
+    client = QuoteClient('http://quotes.test', session=session,
+                         sleep=lambda seconds: None, **kwargs)
+    return client, session
+
+
+def test_retries_server_errors_then_succeeds():
+    client, session = make_client([FakeResponse(503), FakeResponse(429),
+                                   FakeResponse(200, {'ok': True})])
+    assert client.get_json() == {'ok': True}
+    assert session.calls == 3
+
+def test_retries_network_errors():
+    client, session = make_client([requests.ConnectionError(), FakeResponse(200, {'ok': True})])
+    assert client.get_json() == {'ok': True}
+    assert session.calls == 2
+
+def test_client_errors_are_not_retried():
+    client, session = make_client([FakeResponse(401)], name='Yahoo Finance')
+    with pytest.raises(QuoteProviderError, match="Error fetching data from Yahoo Finance."):
+        client.get_json()
+    assert session.calls == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_gives_up_after_max_retries():
+    client, session = make_client([FakeResponse(500)] * 3, max_retries=2)
+    with pytest.raises(QuoteProviderError):
+        client.get_json()
+    assert session.calls == 3
+
+def test_circuit_opens_and_fails_fast():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    client, session = make_client([FakeResponse(500)] * 2 + [FakeResponse(200, {'ok': True})],
+                                  max_retries=0, breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(QuoteProviderError):
+            client.get_json()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open circuit rejects calls without touching the provider
+    with pytest.raises(CircuitOpenError):
+        client.get_json()
+    assert session.calls == 2
+
+    # After the reset timeout a trial call closes the circuit again
+    clock.now = 31
+    assert client.get_json() == {'ok': True}
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_failed_trial_call_reopens_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    client, _ = make_client([FakeResponse(500), FakeResponse(500)], max_retries=0, breaker=breaker)
+
+    with pytest.raises(QuoteProviderError):
+        client.get_json()
+    clock.now = 31
+    with pytest.raises(QuoteProviderError):
+        client.get_json()
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_trial_call_ending_without_an_outcome_reopens_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    client, session = make_client([FakeResponse(500), requests.exceptions.ChunkedEncodingError(),
+                                   FakeResponse(200, {'ok': True})], max_retries=0, breaker=breaker)
+
+    with pytest.raises(QuoteProviderError):
+        client.get_json()
+    clock.now = 31
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.get_json()
+    assert breaker.state == CircuitBreaker.OPEN
+    # Another trial call is let through once the reset timeout passes again
+    clock.now = 62
+    assert client.get_json() == {'ok': True}
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_cancelled_async_trial_call_reopens_circuit():
+    class CancelledSession:
+        headers = {}
+
+        async def get(self, url, params=None):
+            raise asyncio.CancelledError()
+
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now = 31
+    client = AsyncQuoteClient('http://quotes.test', session=CancelledSession(), breaker=breaker)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(client.get_json())
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is False
+    clock.now = 62
+    assert breaker.allow() is True
+
+def test_backoff_honours_retry_after_and_cap():
+    client, _ = make_client([], backoff_base=0.1, backoff_max=2)
+    assert 0 <= client._backoff(0) <= 0.1
+    assert client._backoff(0, retry_after='1.5') == 1.5
+    assert client._backoff(0, retry_after='60') == 2
@@ -1,28 +1,21 @@
+import datetime
 import json
 import pytest
-from app import create_app, db
+from app import db
 from app.models import Transaction, Portfolio
+from config import Config
+from .conftest import TestingConfig
 
-@pytest.fixture
-def app():
-    # Create and configure a new app instance for each test
-    app = create_app()
-    
-    # Create a test client
-    app.config['TESTING'] = True
-    with app.app_context():
-        db.create_all()  # Create tables
-        yield app  # This will run the tests
-        db.drop_all()  # Cleanup after tests
 
-@pytest.fixture
-def client(app):
-    return app.test_client()
+class SmallPageConfig(TestingConfig):
+    TRANSACTIONS_PAGE_SIZE = 4
+
 
 @pytest.fixture
 def sample_portfolio(client):
     # Create a sample portfolio for testing
-    portfolio = Portfolio(ticker='AAPL', total_cost_basis=1000, shares_owned=10)
+    portfolio = Portfolio(account_id=Config.DEFAULT_ACCOUNT_ID, ticker='AAPL', total_cost_basis=1000,
+                          shares_owned=10)
     db.session.add(portfolio)
     db.session.commit()
     return portfolio
@@ -46,6 +39,12 @@ def test_search_instrument_invalid_ticker(client):
     assert 'error' in data
     assert data['error'] == 'Instrument data not found.'
 
+def test_search_instrument_missing_ticker(client):
+    for query in ('', '?ticker=', '?ticker=%20'):
+        response = client.get(f'/api/instruments/search{query}')
+        assert response.status_code == 400
+        assert response.json == {'error': 'Ticker is required.'}
+
 def test_buy_shares(client):
     response = client.post('/api/transactions/buy', json={
         'ticker': 'AAPL',
@@ -170,3 +169,113 @@ def test_get_portfolio_status_no_portfolio(client):
     assert isinstance(status_data, list)  # Ensure it's a list
     assert len(status_data) == 0  # Expect an empty list
 
+
+@pytest.fixture
+def transaction_history(client):
+    # Ten days of alternating AAPL buys and MSFT sells
+    base = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    for day in range(10):
+        db.session.add(Transaction(
+            account_id=Config.DEFAULT_ACCOUNT_ID, ticker='AAPL' if day % 2 == 0 else 'MSFT', shares=day + 1,
+            operation='buy' if day % 2 == 0 else 'sell', price=100.0,
+            date=base + datetime.timedelta(days=day)))
+    db.session.commit()
+
+def test_get_transactions_pages_with_cursor(client, transaction_history):
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/transactions?limit=4' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        seen.extend(t['id'] for t in response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+
+    assert len(seen) == 10
+    assert len(set(seen)) == 10
+    # Newest first
+    dates = [t['date'] for t in client.get('/api/transactions').json]
+    assert dates == sorted(dates, reverse=True)
+
+def test_get_transactions_last_page_has_no_cursor(client, transaction_history):
+    response = client.get('/api/transactions?limit=10')
+    assert len(response.json) == 10
+    assert 'X-Next-Cursor' not in response.headers
+
+@pytest.mark.parametrize('config', [SmallPageConfig])
+def test_get_transactions_defaults_to_a_page(client, transaction_history):
+    response = client.get('/api/transactions')
+    assert len(response.json) == 4
+    assert 'X-Next-Cursor' in response.headers
+    assert len(client.get('/api/transactions?limit=10').json) == 10
+
+def test_get_transactions_filters(client, transaction_history):
+    response = client.get('/api/transactions?ticker=aapl&operation=buy')
+    assert len(response.json) == 5
+    assert all(t['ticker'] == 'AAPL' for t in response.json)
+
+    response = client.get('/api/transactions?start=2024-01-03&end=2024-01-05')
+    assert [t['date'][:10] for t in response.json] == ['2024-01-05', '2024-01-04', '2024-01-03']
+
+def test_get_transactions_invalid_arguments(client):
+    assert client.get('/api/transactions?cursor=garbage').status_code == 400
+    assert client.get('/api/transactions?operation=hold').status_code == 400
+    assert client.get('/api/transactions?start=yesterday').status_code == 400
+    assert client.get('/api/transactions?limit=0').status_code == 400
+
+def test_batch_all_or_nothing(client):
+    response = client.post('/api/transactions/batch', json={'orders': [
+        {'ticker': 'aapl', 'operation': 'buy', 'shares': 10},
+        {'ticker': 'MSFT', 'operation': 'buy', 'shares': 2},
+        # Uses shares bought earlier in the same batch
+        {'ticker': 'AAPL', 'operation': 'sell', 'shares': 4}
+    ]})
+    assert response.status_code == 201
+    data = response.json
+    assert data['mode'] == 'all_or_nothing'
+    assert data['executed'] == 3
+    assert [r['status'] for r in data['results']] == ['executed'] * 3
+    assert data['results'][0]['price'] == 227.55
+
+    assert Portfolio.query.filter_by(ticker='AAPL').first().shares_owned == 6
+    assert Portfolio.query.filter_by(ticker='MSFT').first().shares_owned == 2
+    assert Transaction.query.count() == 3
+
+def test_batch_all_or_nothing_rolls_back(client):
+    response = client.post('/api/transactions/batch', json={'orders': [
+        {'ticker': 'AAPL', 'operation': 'buy', 'shares': 5},
+        {'ticker': 'MSFT', 'operation': 'sell', 'shares': 1}
+    ]})
+    assert response.status_code == 400
+    data = response.json
+    assert data['executed'] == 0
+    assert [r['status'] for r in data['results']] == ['rolled_back', 'failed']
+    assert data['results'][1]['error'] == 'Not enough shares to sell.'
+
+    assert Portfolio.query.count() == 0
+    assert Transaction.query.count() == 0
+
+def test_batch_best_effort(client, sample_portfolio):
+    response = client.post('/api/transactions/batch', json={'mode': 'best_effort', 'orders': [
+        {'ticker': 'AAPL', 'operation': 'sell', 'shares': 20},
+        {'ticker': 'INVALID', 'operation': 'buy', 'shares': 1},
+        {'ticker': 'TSLA', 'operation': 'buy', 'shares': 0},
+        {'ticker': 'AAPL', 'operation': 'sell', 'shares': 10}
+    ]})
+    assert response.status_code == 201
+    data = response.json
+    assert data['executed'] == 1
+    assert [r['error'] for r in data['results']] == [
+        'Not enough shares to sell.', 'Instrument data not found.', 'Invalid number of shares.', None]
+
+    # Selling every share closes the position
+    assert Portfolio.query.count() == 0
+    assert Transaction.query.count() == 1
+
+def test_batch_invalid_request(client):
+    for body in ({}, {'orders': []}, {'orders': [], 'mode': 'sometimes'}):
+        response = client.post('/api/transactions/batch', json=body)
+        assert response.status_code == 400
+        assert 'error' in response.json
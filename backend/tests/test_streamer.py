@@ -0,0 +1,94 @@
+import pytest
+from app import db
+from app.models import Portfolio
+from app.streamer import QuoteStreamer
+from config import Config
+from .conftest import TestingConfig
+
+
+class StreamerConfig(TestingConfig):
+    QUOTE_STREAM_WATCHLIST = ['MSFT']
+
+
+@pytest.fixture
+def config():
+    return StreamerConfig
+
+@pytest.fixture
+def app(app):
+    db.session.add(Portfolio(account_id=Config.DEFAULT_ACCOUNT_ID, ticker='aapl',
+                             total_cost_basis=1000, shares_owned=10))
+    db.session.commit()
+    return app
+
+
+def test_refresh_fetches_held_and_watched_tickers(app):
+    streamer = QuoteStreamer()
+    streamer.init_app(app)
+    streamer.refresh()
+
+    version, snapshot = streamer.current()
+    assert version == 1
+    assert set(snapshot) == {'AAPL', 'MSFT'}
+
+def test_subscribers_receive_changed_quotes_once(app):
+    streamer = QuoteStreamer()
+    streamer.init_app(app)
+    streamer.start = lambda: None  # Drive refreshes by hand
+    subscription = streamer.subscribe(['TSLA'], Config.DEFAULT_ACCOUNT_ID)
+    # Another account doesn't see what the default account holds
+    other = streamer.subscribe(account_id=Config.DEFAULT_ACCOUNT_ID + 1)
+
+    streamer.refresh()
+    version, quotes = subscription.get_nowait()
+    assert set(quotes) == {'AAPL', 'MSFT', 'TSLA'}
+    assert set(other.get_nowait()[1]) == {'MSFT'}
+    streamer.unsubscribe(other)
+
+    # Replayed prices don't move, so a second refresh publishes nothing
+    streamer.refresh()
+    assert subscription.empty()
+
+    streamer.unsubscribe(subscription)
+    streamer.refresh()
+    assert 'TSLA' in streamer.current()[1]
+
+def test_refresh_warms_quote_cache(app):
+    from app.services import quote_cache
+    streamer = QuoteStreamer()
+    streamer.init_app(app)
+    streamer.refresh()
+
+    quotes = quote_cache.get_many(['AAPL'], lambda symbols: pytest.fail("cache miss"))
+    assert quotes['AAPL']['current_price'] == 227.55
+
+def test_slow_subscriber_drops_oldest_event(app):
+    streamer = QuoteStreamer(max_queue=1)
+    subscription = streamer.subscribe()
+    streamer._publish(subscription, (1, {}))
+    streamer._publish(subscription, (2, {}))
+    assert subscription.get_nowait()[0] == 2
+    streamer.unsubscribe(subscription)
+
+def test_stream_endpoint_sends_snapshot(app):
+    from app.streamer import quote_streamer
+    quote_streamer.refresh()
+
+    response = app.test_client().get('/api/quotes/stream')
+    assert response.mimetype == 'text/event-stream'
+    first_event = next(response.response)
+    response.close()
+    assert first_event.startswith(b'id: ')
+    assert b'AAPL' in first_event
+
+def test_stream_endpoint_is_scoped_to_the_account(app):
+    from app.streamer import quote_streamer
+    quote_streamer.refresh()
+    client = app.test_client()
+    other = client.post('/api/accounts', json={'name': 'other'}).json['id']
+
+    response = client.get(f'/api/quotes/stream?account={other}')
+    first_event = next(response.response)
+    response.close()
+    assert b'MSFT' in first_event and b'AAPL' not in first_event
+    assert client.get('/api/quotes/stream?account=999').status_code == 404
@@ -0,0 +1,71 @@
+import os
+import pytest
+from app.symbols import SymbolIndex, read_listing
+from config import Config
+from .conftest import FakeClock
+
+
+@pytest.fixture
+def listing(tmp_path):
+    path = tmp_path / 'symbols.csv'
+    path.write_text('symbol,name\n'
+                    'AAPL,Apple Inc.\n'
+                    'AMAT,"Applied Materials, Inc."\n'
+                    'HD,"The Home Depot, Inc."\n'
+                    'KO,The Coca-Cola Company\n'
+                    'MSFT,Microsoft Corporation\n'
+                    'TSLA,"Tesla, Inc."\n')
+    return path
+
+def symbols(results):
+    return [r['symbol'] for r in results]
+
+def test_ticker_prefix(listing):
+    index = SymbolIndex(str(listing))
+    assert symbols(index.search('ts')) == ['TSLA']
+    assert index.search('msft') == [{'symbol': 'MSFT', 'name': 'Microsoft Corporation'}]
+
+def test_name_prefix_at_any_word(listing):
+    index = SymbolIndex(str(listing))
+    assert symbols(index.search('appl')) == ['AAPL', 'AMAT']
+    assert symbols(index.search('depot')) == ['HD']
+    # Punctuation in names doesn't get in the way
+    assert symbols(index.search('coca cola')) == ['KO']
+
+def test_typo_in_ticker(listing):
+    index = SymbolIndex(str(listing))
+    assert symbols(index.search('MSTF')) == ['MSFT']   # Swapped
+    assert symbols(index.search('TSLQ')) == ['TSLA']   # Wrong
+    assert symbols(index.search('AAPPL')) == ['AAPL']  # Extra
+
+def test_limit_and_empty_query(listing):
+    index = SymbolIndex(str(listing))
+    assert len(index.search('a', limit=1)) == 1
+    assert index.search('  ') == []
+
+def test_reloads_changed_listing(listing):
+    clock = FakeClock()
+    index = SymbolIndex(str(listing), check_interval=60, clock=clock)
+    assert len(index) == 6
+
+    listing.write_text('symbol,name\nNVDA,NVIDIA Corporation\n')
+    os.utime(listing, (1, 1))
+    assert len(index) == 6  # Not checked again yet
+    clock.now = 61
+    assert symbols(index.search('nv')) == ['NVDA']
+
+def test_read_pipe_separated_listing(tmp_path):
+    path = tmp_path / 'nasdaqlisted.txt'
+    path.write_text('Symbol|Security Name|Market Category\n'
+                    'AAPL|Apple Inc. - Common Stock|Q\n'
+                    'File Creation Time: 1018202412:00|||\n')
+    assert read_listing(path) == {'AAPL': 'Apple Inc. - Common Stock'}
+
+def test_bundled_listing():
+    assert len(read_listing(Config.SYMBOL_LISTING_PATH)) > 100
+
+def test_autocomplete_endpoint(client):
+    response = client.get('/api/instruments/autocomplete?q=micro&limit=3')
+    assert response.status_code == 200
+    assert 'MSFT' in symbols(response.json)
+    assert client.get('/api/instruments/autocomplete?q=a&limit=0').status_code == 400
@@ -0,0 +1,90 @@
+import random
+import threading
+import pytest
+from sqlalchemy import func
+from app import db
+from app.models import Lot, Portfolio, Transaction
+from app.trading import execute_trade, InsufficientShares
+from config import Config
+from .conftest import TestingConfig
+
+
+@pytest.fixture
+def config(tmp_path):
+    class TradingConfig(TestingConfig):
+        # A file database so every thread gets its own connection
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'trading.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 20, 'connect_args': {'timeout': 30}}
+    return TradingConfig
+
+
+def run_parallel(app, orders, threads=16):
+    # Executes (ticker, shares, operation) orders from many threads at once
+    rejected = []
+    lock = threading.Lock()
+    pending = list(orders)
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        with app.app_context():
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    ticker, shares, operation = pending.pop()
+                try:
+                    execute_trade(Config.DEFAULT_ACCOUNT_ID, ticker, shares, operation, 100.0)
+                except InsufficientShares:
+                    with lock:
+                        rejected.append((ticker, shares, operation))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return rejected
+
+
+def net_shares(ticker):
+    buys = db.session.query(func.coalesce(func.sum(Transaction.shares), 0)).filter_by(
+        ticker=ticker, operation='buy').scalar()
+    sells = db.session.query(func.coalesce(func.sum(Transaction.shares), 0)).filter_by(
+        ticker=ticker, operation='sell').scalar()
+    return buys - sells
+
+
+def test_concurrent_first_buys_open_one_position(app):
+    run_parallel(app, [('AAPL', 1, 'buy')] * 100)
+    positions = Portfolio.query.filter_by(ticker='AAPL').all()
+    assert len(positions) == 1
+    assert positions[0].shares_owned == 100
+    assert Transaction.query.count() == 100
+
+def test_concurrent_sells_never_oversell(app):
+    execute_trade(Config.DEFAULT_ACCOUNT_ID, 'AAPL', 50, 'buy', 100.0)
+    rejected = run_parallel(app, [('AAPL', 1, 'sell')] * 200)
+
+    assert len(rejected) == 150
+    assert Portfolio.query.filter_by(ticker='AAPL').first() is None
+    assert Transaction.query.filter_by(operation='sell').count() == 50
+
+def test_books_reconcile_under_mixed_parallel_orders(app):
+    rng = random.Random(7)
+    orders = [(rng.choice(['AAPL', 'MSFT', 'TSLA']), rng.randint(1, 5), rng.choice(['buy', 'sell']))
+              for _ in range(400)]
+    run_parallel(app, orders)
+
+    for ticker in ('AAPL', 'MSFT', 'TSLA'):
+        position = Portfolio.query.filter_by(ticker=ticker).first()
+        owned = position.shares_owned if position else 0
+        assert owned >= 0
+        assert owned == net_shares(ticker)
+        # Every share owned is in exactly one open lot
+        assert db.session.query(func.coalesce(func.sum(Lot.shares), 0)).filter_by(ticker=ticker).scalar() == owned
+
+def test_insufficient_shares_leaves_no_trace(app):
+    with pytest.raises(InsufficientShares):
+        execute_trade(Config.DEFAULT_ACCOUNT_ID, 'AAPL', 1, 'sell', 100.0)
+    assert Transaction.query.count() == 0
@@ -0,0 +1,155 @@
+import pytest
+from app import db
+from app.models import Portfolio
+from app.services import quote_cache
+from app.valuation import Valuation, valuation_engine
+from config import Config
+
+
+def test_valuation_positions_and_summary():
+    quotes = {'AAPL': {'symbol': 'AAPL', 'name': 'Apple Inc.', 'current_price': 200.0},
+              'MSFT': {'symbol': 'MSFT', 'name': 'Microsoft', 'current_price': 'n/a'}}
+    valuation = Valuation(['AAPL', 'MSFT', 'GIFT'], [10, 5, 3], [1500.0, 2000.0, 0.0], quotes)
+
+    positions = valuation.positions()
+    assert positions[0] == {
+        'ticker': 'AAPL',
+        'name': 'Apple Inc.',
+        'total_cost_basis': 1500.0,
+        'shares_owned': 10,
+        'current_market_value': 2000.0,
+        'unrealized_profit_loss': 500.0,
+        'unrealized_return_rate': 33.33
+    }
+    # Unusable prices value the position at 0
+    assert positions[1]['current_market_value'] == 0.0
+    assert positions[1]['unrealized_return_rate'] == -100.0
+    # No cost basis, no return rate
+    assert positions[2]['name'] is None
+    assert positions[2]['unrealized_return_rate'] == 0
+
+    summary = valuation.summary()
+    assert summary['total_shares_owned'] == 18
+    assert isinstance(summary['total_shares_owned'], int)
+    assert summary['total_cost_basis'] == 3500.0
+    assert summary['total_current_market_value'] == 2000.0
+    assert summary['total_unrealized_profit_loss'] == -1500.0
+    assert summary['total_unrealized_return_rate'] == -42.86
+
+def test_empty_valuation():
+    valuation = Valuation([], [], [], {})
+    assert len(valuation) == 0
+    assert valuation.positions() == []
+    assert valuation.summary()['total_shares_owned'] == 0
+
+
+@pytest.fixture
+def client(client):
+    db.session.add(Portfolio(account_id=Config.DEFAULT_ACCOUNT_ID, ticker='AAPL',
+                             total_cost_basis=1000, shares_owned=10))
+    db.session.commit()
+    return client
+
+def test_endpoints_share_one_snapshot(client):
+    portfolio = client.get('/api/portfolio').json
+    status = client.get('/api/portfolio/status').json
+
+    assert quote_cache.stats()['upstream_calls'] == 1
+    assert quote_cache.stats()['hits'] == 0
+    assert portfolio[0]['current_market_value'] == pytest.approx(2275.5)
+    assert status['total_current_market_value'] == pytest.approx(2275.5)
+
+def test_trade_invalidates_snapshot(client):
+    assert client.get('/api/portfolio/status').json['total_shares_owned'] == 10
+
+    client.post('/api/transactions/buy', json={'ticker': 'AAPL', 'shares': 5})
+
+    assert client.get('/api/portfolio/status').json['total_shares_owned'] == 15
+    assert client.get('/api/portfolio').json[0]['shares_owned'] == 15
+
+def test_with_trade_and_with_prices():
+    valuation = Valuation(['AAPL', 'MSFT'], [10, 5], [1500.0, 2000.0],
+                          {'AAPL': {'current_price': 200.0}, 'MSFT': {'current_price': 400.0}})
+
+    bought = valuation.with_trade('TSLA', 2, 500.0, 250.0)
+    assert bought.tickers == ['AAPL', 'MSFT', 'TSLA']
+    assert bought.positions()[2]['current_market_value'] == 500.0
+    # The published valuation is left untouched
+    assert valuation.tickers == ['AAPL', 'MSFT']
+
+    sold = bought.with_trade('MSFT', -5, -2000.0, 400.0)
+    assert sold.tickers == ['AAPL', 'TSLA']
+    assert sold.summary()['total_shares_owned'] == 12
+
+    repriced = sold.with_prices({'AAPL': {'current_price': 210.0}, 'MSFT': {'current_price': 1.0}})
+    assert repriced.positions()[0]['current_market_value'] == 2100.0
+    assert repriced.positions()[1] == sold.positions()[1]
+    # Quotes that change nothing keep the same valuation
+    assert repriced.with_prices({'AAPL': {'current_price': 210.0}}) is repriced
+
+def test_with_trade_rejects_sales_the_snapshot_cannot_cover():
+    valuation = Valuation(['AAPL'], [10], [1500.0], {})
+    assert valuation.with_trade('MSFT', -1, -400.0, 400.0) is None
+    assert valuation.with_trade('AAPL', -11, -1650.0, 200.0) is None
+    assert valuation.with_trade('AAPL', -5, -1600.0, 200.0) is None
+    assert valuation.with_trade('AAPL', -10, -1500.0, 200.0).tickers == []
+
+def test_stale_snapshot_is_reloaded_after_a_sale_it_cannot_cover(client):
+    client.get('/api/portfolio')
+    # Trades of another worker, which this one's snapshot doesn't know about
+    db.session.add(Portfolio(account_id=Config.DEFAULT_ACCOUNT_ID, ticker='MSFT',
+                             total_cost_basis=2000, shares_owned=5))
+    db.session.commit()
+    client.post('/api/transactions/sell', json={'ticker': 'MSFT', 'shares': 2})
+    assert {p['ticker']: p['shares_owned'] for p in client.get('/api/portfolio').json} == {'AAPL': 10, 'MSFT': 3}
+
+    Portfolio.query.filter_by(ticker='AAPL').one().shares_owned = 15
+    db.session.commit()
+    client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 12})
+    assert {p['ticker']: p['shares_owned'] for p in client.get('/api/portfolio').json} == {'AAPL': 3, 'MSFT': 3}
+
+def test_unchanged_portfolio_is_not_modified(client):
+    response = client.get('/api/portfolio')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+    calls = quote_cache.stats()['upstream_calls']
+
+    response = client.get('/api/portfolio', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert client.get('/api/portfolio/status', headers={'If-None-Match': etag}).status_code == 304
+    assert quote_cache.stats()['upstream_calls'] == calls
+
+    client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 4})
+
+    response = client.get('/api/portfolio', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json[0]['shares_owned'] == 6
+
+def test_trades_update_snapshot_in_place(client):
+    client.get('/api/portfolio')
+
+    client.post('/api/transactions/buy', json={'ticker': 'MSFT', 'shares': 2})
+    client.post('/api/transactions/sell', json={'ticker': 'AAPL', 'shares': 10})
+
+    portfolio = client.get('/api/portfolio').json
+    assert [p['ticker'] for p in portfolio] == ['MSFT']
+    assert portfolio[0]['name'] == 'Microsoft Corporation'
+    assert portfolio[0]['current_market_value'] == pytest.approx(416.21 * 2)
+    # Matches a fresh load from the database
+    valuation_engine.invalidate()
+    assert client.get('/api/portfolio').json == portfolio
+
+def test_price_updates_bump_version_only_on_change(client):
+    account_id = Config.DEFAULT_ACCOUNT_ID
+    valuation = valuation_engine.snapshot(account_id)
+    quote = dict(quote_cache.get_many(['AAPL'], lambda symbols: {})['AAPL'])
+
+    valuation_engine.update_prices({'AAPL': quote})
+    assert valuation_engine.snapshot(account_id) is valuation
+    quote['current_price'] = 230.0
+    valuation_engine.update_prices({'AAPL': quote})
+    updated = valuation_engine.snapshot(account_id)
+    assert updated.version > valuation.version
+    assert updated.summary()['total_current_market_value'] == 2300.0
@@ -1,5 +1,7 @@
 const config = {
     API_BASE_URL: 'http://127.0.0.1:5000/api',
+    // Account the app acts on; the backend's default account when unset
+    ACCOUNT_ID: process.env.REACT_APP_ACCOUNT_ID || null,
   };
   
   export default config;
@@ -1,20 +1,24 @@
 import React, { useState, useEffect } from "react";
-import { fetchRecentTransactions } from "../services/stockService";
+import { fetchTransactionsPage } from "../services/stockService";
 import { useNavigate } from "react-router-dom";
 import PillBar from "../components/PillBar";
 import "../styles/AllTransactions.css";
 import Title from '../components/Title';
 
+const PAGE_SIZE = 50;
+
 function AllTransactions({ showError }) {
   const [transactions, setTransactions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const navigate = useNavigate();
 
   useEffect(() => {
     const getData = async () => {
       try {
-        const allTransactions = await fetchRecentTransactions();
-        setTransactions(allTransactions);
+        const page = await fetchTransactionsPage(PAGE_SIZE);
+        setTransactions(page.transactions);
+        setNextCursor(page.nextCursor);
       } catch (error) {
         showError("Failed to fetch all transactions.");
       } finally {
@@ -24,6 +28,16 @@ function AllTransactions({ showError }) {
     getData();
   }, [showError]);
 
+  const loadMore = async () => {
+    try {
+      const page = await fetchTransactionsPage(PAGE_SIZE, nextCursor);
+      setTransactions((current) => [...current, ...page.transactions]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      showError("Failed to fetch more transactions.");
+    }
+  };
+
   if (loading) {
     return <div>Loading...</div>;
   }
@@ -41,6 +55,7 @@ function AllTransactions({ showError }) {
         <ul>
           {transactions.map((transaction) => (
             <PillBar
+              key={transaction.id}
               ticker={transaction.ticker}
               operation={transaction.operation}
               shares={transaction.shares}
@@ -51,6 +66,12 @@ function AllTransactions({ showError }) {
             />
           ))}
         </ul>
+
+        {nextCursor && (
+          <button className="back-button" onClick={loadMore}>
+            Load more
+          </button>
+        )}
       </div>
     </div>
   );
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from "react";
-import { fetchPortfolio } from "../services/stockService";
+import { fetchPortfolio, subscribeToQuotes } from "../services/stockService";
 import PillBar from "../components/PillBar"; // Import the PillBar component
 import "../styles/PortfolioPage.css";
 import Title from '../components/Title';
@@ -25,6 +25,31 @@ function PortfolioPage({ showError }) {
     getPortfolio();
   }, [showError]); // Include showError in the dependency array
 
+  useEffect(() => {
+    // Revalue positions from pushed quotes instead of polling the portfolio
+    return subscribeToQuotes((quotes) => {
+      setPositions((current) =>
+        current.map((position) => {
+          const quote = quotes[position.ticker.toUpperCase()];
+          if (!quote || typeof quote.current_price !== "number") {
+            return position;
+          }
+          const marketValue = quote.current_price * position.shares_owned;
+          const profitLoss = marketValue - position.total_cost_basis;
+          return {
+            ...position,
+            current_market_value: marketValue,
+            unrealized_profit_loss: profitLoss,
+            unrealized_return_rate:
+              position.total_cost_basis > 0
+                ? Math.round((profitLoss / position.total_cost_basis) * 10000) / 100
+                : 0,
+          };
+        })
+      );
+    });
+  }, []);
+
   if (loading) {
     return <div className="mainContainer">Loading...</div>; // Loading indicator
   }
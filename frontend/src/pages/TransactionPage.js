@@ -1,5 +1,6 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import {
+  autocompleteInstruments,
   searchInstrument,
   buyShares,
   sellShares,
@@ -12,14 +13,41 @@ function TransactionPage({ showError }) {
   const [ticker, setTicker] = useState("");
   const [instrumentData, setInstrumentData] = useState(null);
   const [shares, setShares] = useState(0);
+  const [suggestions, setSuggestions] = useState([]);
+  // Only the latest keystroke's suggestions are shown
+  const latestQuery = useRef("");
+  // Symbol picked from the suggestions, which needs no new suggestions
+  const selected = useRef(null);
 
   useEffect(() => {
     showError("");
   }, [showError]);
 
-  const handleSearch = async () => {
+  useEffect(() => {
+    const query = ticker.trim();
+    latestQuery.current = query;
+    if (!query || query === selected.current) {
+      setSuggestions([]);
+      return;
+    }
+    // Wait for a pause in typing before asking for suggestions
+    const timer = setTimeout(async () => {
+      try {
+        const results = await autocompleteInstruments(query);
+        if (latestQuery.current === query) {
+          setSuggestions(results);
+        }
+      } catch (error) {
+        setSuggestions([]);
+      }
+    }, 150);
+    return () => clearTimeout(timer);
+  }, [ticker]);
+
+  const handleSearch = async (symbol = ticker) => {
+    setSuggestions([]);
     try {
-      const data = await searchInstrument(ticker);
+      const data = await searchInstrument(symbol);
       if (data && !data.error) {
         setInstrumentData(data); // Set to the first item in the array
       } else {
@@ -36,6 +64,13 @@ function TransactionPage({ showError }) {
     }
   };
 
+  const handleSelect = (symbol) => {
+    selected.current = symbol;
+    setTicker(symbol);
+    // Quotes are only fetched for the chosen symbol
+    handleSearch(symbol);
+  };
+
   const navigate = useNavigate();
 
   const handleBuy = async () => {
@@ -78,7 +113,21 @@ function TransactionPage({ showError }) {
           placeholder="Enter Ticker (e.g., AAPL)"
           className="ticker-input"
         />
-        <button onClick={handleSearch} className="search-button">
+        {suggestions.length > 0 && (
+          <ul className="suggestions">
+            {suggestions.map((suggestion) => (
+              <li
+                key={suggestion.symbol}
+                onClick={() => handleSelect(suggestion.symbol)}
+                className="suggestion"
+              >
+                <span className="suggestion-symbol">{suggestion.symbol}</span>
+                {suggestion.name}
+              </li>
+            ))}
+          </ul>
+        )}
+        <button onClick={() => handleSearch()} className="search-button">
           Search
         </button>
 
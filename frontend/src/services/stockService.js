@@ -1,6 +1,14 @@
 import config from '../config';
 
-const { API_BASE_URL } = config;
+const { API_BASE_URL, ACCOUNT_ID } = config;
+
+// Sends every request on behalf of the configured account
+const apiFetch = (url, options = {}) => {
+  const headers = ACCOUNT_ID
+    ? { ...options.headers, 'X-Account-Id': ACCOUNT_ID }
+    : options.headers;
+  return fetch(url, { ...options, headers });
+};
 
 const handleResponse = async (response) => {
   if (!response.ok) {
@@ -19,27 +27,54 @@ export const fetchRecentTransactions = async (limit = null) => {
     ? `${API_BASE_URL}/transactions?limit=${limit}`
     : `${API_BASE_URL}/transactions`;
 
-  const response = await fetch(url);
+  const response = await apiFetch(url);
   return handleResponse(response);
 };
 
+// Fetches one page of transactions, newest first. Pass the returned
+// nextCursor to get the following page; it is null on the last page.
+export const fetchTransactionsPage = async (limit, cursor = null) => {
+  const params = new URLSearchParams({ limit });
+  if (cursor) {
+    params.append('cursor', cursor);
+  }
+
+  const response = await apiFetch(`${API_BASE_URL}/transactions?${params}`);
+  const transactions = await handleResponse(response);
+  return { transactions, nextCursor: response.headers.get('X-Next-Cursor') };
+};
+
 export const fetchPortfolioStatus = async () => {
-  const response = await fetch(`${API_BASE_URL}/portfolio/status`);
+  const response = await apiFetch(`${API_BASE_URL}/portfolio/status`);
   return handleResponse(response);
 };
 
 export const fetchPortfolio = async () => {
-  const response = await fetch(`${API_BASE_URL}/portfolio`);
+  const response = await apiFetch(`${API_BASE_URL}/portfolio`);
   return handleResponse(response);
 };
 
 export const searchInstrument = async (ticker) => {
-  const response = await fetch(`${API_BASE_URL}/instruments/search?ticker=${ticker}`);
+  const response = await apiFetch(`${API_BASE_URL}/instruments/search?ticker=${ticker}`);
   return handleResponse(response);
 };
 
+// Suggestions for a partial ticker or company name, served from the backend's
+// local symbol listing. Results are remembered, so retyping a query is free.
+const suggestionCache = new Map();
+
+export const autocompleteInstruments = async (query, limit = 8) => {
+  const key = `${query.trim().toLowerCase()}|${limit}`;
+  if (!suggestionCache.has(key)) {
+    const params = new URLSearchParams({ q: query.trim(), limit });
+    const response = await apiFetch(`${API_BASE_URL}/instruments/autocomplete?${params}`);
+    suggestionCache.set(key, await handleResponse(response));
+  }
+  return suggestionCache.get(key);
+};
+
 export const buyShares = async (ticker, shares) => {
-  const response = await fetch(`${API_BASE_URL}/transactions/buy`, {
+  const response = await apiFetch(`${API_BASE_URL}/transactions/buy`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
@@ -50,7 +85,7 @@ export const buyShares = async (ticker, shares) => {
 };
 
 export const sellShares = async (ticker, shares) => {
-  const response = await fetch(`${API_BASE_URL}/transactions/sell`, {
+  const response = await apiFetch(`${API_BASE_URL}/transactions/sell`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
@@ -59,3 +94,19 @@ export const sellShares = async (ticker, shares) => {
   });
   return handleResponse(response);
 };
+
+// Subscribes to live quotes pushed by the backend. The callback receives an
+// object mapping ticker symbols to quote data; returns a function that closes
+// the stream.
+export const subscribeToQuotes = (onQuotes, symbols = []) => {
+  // EventSource can't send the X-Account-Id header, so the account goes in
+  // the query string
+  const params = new URLSearchParams();
+  if (symbols.length) params.set('symbols', symbols.join(','));
+  if (ACCOUNT_ID) params.set('account', ACCOUNT_ID);
+  const query = params.toString();
+
+  const source = new EventSource(`${API_BASE_URL}/quotes/stream${query ? `?${query}` : ''}`);
+  source.addEventListener('quotes', (event) => onQuotes(JSON.parse(event.data)));
+  return () => source.close();
+};